@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+import_times.py
+---------------
+How long each gasser command takes to start: cold start of the quick commands
+against a time budget, and the import time of every command's module, with the
+heaviest imports behind it.
+
+- Cold start: wall time of a fresh interpreter running `gasser_cli.py --help`
+  and `gasser_cli.py last` (median of --repeat runs), next to a bare
+  `python -c pass` for the interpreter's own share; `last` reads a scratch
+  SQLite database in the work folder, never .env's database
+- Imports: `python -X importtime -c "import <module>"` for every command in
+  gasser_cli.COMMANDS; the cumulative time and the three heaviest direct imports
+  (a missing optional dependency shows as an error, not a failure)
+- Exit status is 1 when a quick command's median is over --budget-ms
+
+Usage:
+  python benchmarks/import_times.py
+  python benchmarks/import_times.py --repeat 10 --budget-ms 100 --out benchmarks/results/imports.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from gasser_cli import COMMANDS
+
+DEFAULT_WORK_DIR = os.path.join(BENCH_DIR, "work")
+QUICK_COMMANDS = [["--help"], ["last", "-n", "10"]]
+
+
+########################
+def scratch_db(work_dir: str) -> Dict[str, str]:
+    """Environment for a SQLite fuel_readings with a few rows, for `gasser last`."""
+    path = os.path.join(work_dir, "imports.sqlite")
+    os.makedirs(work_dir, exist_ok=True)
+    env = dict(os.environ, GASSER_DB_BACKEND="sqlite", GASSER_SQLITE_PATH=path)
+    os.environ.update(GASSER_DB_BACKEND="sqlite", GASSER_SQLITE_PATH=path)
+
+    import gasser_db
+    from create_gasser_table import CREATE_INDEXES_SQL, SQLITE_CREATE_TABLE_SQL, SQLITE_DROP_TABLE_SQL
+
+    start = datetime(2024, 1, 6, 17, 30, tzinfo=timezone.utc)
+    with gasser_db.transaction() as cur:
+        cur.execute(SQLITE_DROP_TABLE_SQL)
+        cur.execute(SQLITE_CREATE_TABLE_SQL)
+        gasser_db.execute_script(cur, CREATE_INDEXES_SQL.format(key_suffix="", fill_time_using=""))
+        for i in range(20):
+            gasser_db.execute_prepared(cur, "insert_reading", gasser_db.INSERT_READING_SQL, (
+                f"odo_{i}.jpg", 300, 100000 + 300 * i, f"pump_{i}.jpg", 35.5, 10.25, start + timedelta(days=7 * i)))
+    gasser_db.close_pool()
+    return env
+
+def wall_ms(cmd: List[str], env: Dict[str, str], repeat: int) -> Dict[str, Any]:
+    times = []
+    status = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=REPO_DIR, env=env, capture_output=True, text=True)
+        times.append((time.perf_counter() - t0) * 1000)
+        status = status or proc.returncode
+    return {"median_ms": round(statistics.median(times), 1), "min_ms": round(min(times), 1), "exit": status}
+
+def import_time(module: str, env: Dict[str, str]) -> Dict[str, Any]:
+    """Cumulative -X importtime of module and its heaviest direct imports, in ms."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        last = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"
+        return {"error": last}
+    total, children, pending = 0.0, [], []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            pending.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            # an import is listed after the imports it made (site's come first)
+            if name.strip() == module:
+                total, children = int(cumulative) / 1000, pending
+            pending = []
+    heaviest = sorted(children, reverse=True)[:3]
+    return {"import_ms": round(total, 1), "heaviest": [{"module": n, "ms": round(ms, 1)} for ms, n in heaviest]}
+
+########################
+def run(args) -> Dict[str, Any]:
+    env = scratch_db(args.work_dir)
+    results: Dict[str, Any] = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "budget_ms": args.budget_ms,
+        "startup": {},
+        "imports": {},
+    }
+
+    print(f"Cold start, median of {args.repeat} (budget {args.budget_ms:.0f} ms):")
+    bare = wall_ms([sys.executable, "-c", "pass"], env, args.repeat)
+    results["startup"]["python -c pass"] = bare
+    print(f"  {'python -c pass':<28} {bare['median_ms']:8.1f} ms")
+    for argv in QUICK_COMMANDS:
+        label = "gasser " + " ".join(argv)
+        r = wall_ms([sys.executable, os.path.join(REPO_DIR, "gasser_cli.py")] + argv, env, args.repeat)
+        r["over_budget"] = r["median_ms"] > args.budget_ms
+        results["startup"][label] = r
+        note = "  OVER BUDGET" if r["over_budget"] else ""
+        note += f"  (exit {r['exit']})" if r["exit"] else ""
+        print(f"  {label:<28} {r['median_ms']:8.1f} ms{note}")
+
+    print("\nImport time per command module:")
+    for name, (module, _, _) in COMMANDS.items():
+        r = import_time(module, env)
+        results["imports"][name] = dict(r, module=module)
+        if "error" in r:
+            print(f"  {name:<16} {module:<28} {'-':>8}     {r['error']}")
+            continue
+        heaviest = ", ".join(f"{h['module']} {h['ms']:.0f}" for h in r["heaviest"])
+        print(f"  {name:<16} {module:<28} {r['import_ms']:8.1f} ms  {heaviest}")
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description="Start-up and import time of every gasser command.")
+    ap.add_argument("--repeat", type=int, default=5, help="Runs per quick command, the median is reported (default: 5)")
+    ap.add_argument("--budget-ms", type=float, default=100.0, help="Cold start budget for the quick commands (default: 100)")
+    ap.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="Folder for the scratch database")
+    ap.add_argument("--out", default=None, help="Also write the results as JSON")
+    args = ap.parse_args()
+
+    results = run(args)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.out}")
+    if any(r.get("over_budget") for r in results["startup"].values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+mock_llm_server.py
+------------------
+A stand-in for LM Studio / the OpenAI API that answers gauge questions about the
+synthetic photos from their ground truth, so the inference stage can be
+benchmarked (client, encoding, HTTP, parsing) without a GPU or an API key.
+
+- POST /v1/chat/completions: every image in the request is identified by the id
+  strip synthetic_gauges.py drew on it, then answered in the format the runner
+  asked for (one image: the run_vision_query_locally.py prompt; several images:
+  the run_vision_query_chatgpt.py JSON or text format)
+- A --mosaic composite (run_vision_query_locally.py) has no id strips, its tiles
+  are cropped to the displays: each tile is read with seven_segment_ocr.py and
+  matched to the fill-up whose numbers it shows
+- GET /v1/models: the model list, like LM Studio (check_local_running.bat)
+- --latency adds a fixed delay per request to imitate a real model
+- usage.prompt_tokens / completion_tokens are estimated like the OpenAI API
+  bills them (85 tokens per image plus ~4 characters per token of text)
+
+Usage:
+  python benchmarks/mock_llm_server.py --truth bench_images/ground_truth.json --port 1234
+  LMSTUDIO_BASE_URL=http://127.0.0.1:1234/v1 python run_vision_query_locally.py
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(1, os.path.dirname(BENCH_DIR))
+from synthetic_gauges import read_id_strip
+
+TOKENS_PER_IMAGE = 85
+MODEL_NAME = "mock-gauge-reader"
+
+
+class Answers:
+    """Ground truth by image index."""
+
+    def __init__(self, truth: Dict[str, Any]):
+        self.images = truth["images"]
+        self.fillups = truth["fillups"]
+
+    def lookup(self, data_url: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """(image entry, its fill-up) for a data: URL, or None for an image that is not ours."""
+        b64 = data_url.split(",", 1)[-1]
+        with Image.open(BytesIO(base64.b64decode(b64))) as img:
+            index = read_id_strip(img)
+        if index >= len(self.images):
+            return None
+        image = self.images[index]
+        return image, self.fillups[image["fillup"]]
+
+    def single(self, data_url: str) -> str:
+        """Answer for run_vision_query_locally.py: one image, "odometer_reading" or "price" / "gallons"."""
+        found = self.lookup(data_url)
+        if found is None:
+            return "I could not read any numbers in this image."
+        image, fillup = found
+        if image["kind"] == "odometer":
+            return "This is a fuel gauge with an odometer.\n" + json.dumps({"odometer_reading": fillup["total_mileage"]})
+        price = round(fillup["dollars"] / fillup["gallons"], 3)
+        return ("This is a digital display for a gas pump.\n"
+                + json.dumps({"price": fillup["dollars"], "gallons": fillup["gallons"], "price_per_gallon": price}))
+
+    def mosaic(self, data_url: str, tiles: int) -> str:
+        """Answer for a run_vision_query_locally.py --mosaic composite: tiles side by side under a label bar."""
+        from run_vision_query_locally import MOSAIC_BACKGROUND, MOSAIC_LABEL
+        from seven_segment_ocr import read_display, to_gray
+
+        b64 = data_url.split(",", 1)[-1]
+        with Image.open(BytesIO(base64.b64decode(b64))) as img:
+            img = img.convert("RGB")
+        width = img.width // max(1, tiles)
+        result = {"odometer": {"tile": None, "trip": "", "total_mileage": ""},
+                  "pump": {"tile": None, "dollars": "", "gallons": ""}}
+        for i in range(tiles):
+            tile = img.crop((i * width, MOSAIC_LABEL, (i + 1) * width, img.height))
+            # the display without the letterbox around it (JPEG blurs its edge a little)
+            diff = ImageChops.difference(tile, Image.new("RGB", tile.size, MOSAIC_BACKGROUND)).convert("L")
+            box = diff.point(lambda v: 255 if v > 24 else 0).getbbox()
+            gray = to_gray(tile.crop(box) if box else tile)
+            rows = [[text for text, _ in read_display(gray, polarity)[1]][:2] for polarity in ("led", "lcd")]
+            for f in self.fillups:
+                if [str(f["trip"]), str(f["total_mileage"])] in rows:
+                    result["odometer"] = {"tile": i + 1, "trip": str(f["trip"]), "total_mileage": str(f["total_mileage"])}
+                elif [f"{f['dollars']:.2f}", f"{f['gallons']:.3f}"] in rows:
+                    result["pump"] = {"tile": i + 1, "dollars": f"{f['dollars']:.2f}", "gallons": f"{f['gallons']:.3f}"}
+        return json.dumps(result)
+
+    def multi(self, data_urls: List[str], text_mode: bool) -> str:
+        """Answer for run_vision_query_chatgpt.py: pick the odometer and the pump image of the set."""
+        odo = pump = None
+        for url in data_urls:
+            found = self.lookup(url)
+            if found and found[0]["kind"] == "odometer" and odo is None:
+                odo = found
+            elif found and found[0]["kind"] == "pump" and pump is None:
+                pump = found
+        result = {
+            "odometer_image": {
+                "file": odo[0]["file"] if odo else "not found",
+                "top_value_trip": str(odo[1]["trip"]) if odo else "",
+                "bottom_value_total_mileage": str(odo[1]["total_mileage"]) if odo else "",
+            },
+            "gas_pump_image": {
+                "file": pump[0]["file"] if pump else "not found",
+                "top_value_dollars": f"{pump[1]['dollars']:.2f}" if pump else "",
+                "bottom_value_gallons": f"{pump[1]['gallons']:.3f}" if pump else "",
+            },
+        }
+        if not text_mode:
+            return json.dumps(result)
+        o, g = result["odometer_image"], result["gas_pump_image"]
+        return (f"Odometer Image\nFile name: {o['file']}\nTop value (trip meter): {o['top_value_trip']}\n"
+                f"Bottom value (total mileage): {o['bottom_value_total_mileage']}\n\n"
+                f"Gas Pump Image\nFile name: {g['file']}\nTop value (dollars): {g['top_value_dollars']}\n"
+                f"Bottom value (gallons): {g['bottom_value_gallons']}\n")
+
+def split_content(messages: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+    texts, urls = [], []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                texts.append(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                urls.append(part["image_url"]["url"])
+    return "\n".join(texts), urls
+
+########################
+def make_handler(answers: Answers, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # one line per request would drown the benchmark output
+
+        def _send(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send(200, {"object": "list", "data": [{"id": MODEL_NAME, "object": "model", "owned_by": "mock"}]})
+            else:
+                self._send(404, {"error": {"message": f"no route {self.path}"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": f"no route {self.path}"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            text, urls = split_content(request.get("messages", []))
+            if latency:
+                time.sleep(latency)
+            try:
+                tiles = re.search(r"The image is (\d+) tiles", text)
+                if tiles and len(urls) == 1:
+                    answer = answers.mosaic(urls[0], int(tiles.group(1)))
+                elif len(urls) == 1 and "Here are the files" not in text:
+                    answer = answers.single(urls[0])
+                else:
+                    answer = answers.multi(urls, text_mode="response_format" not in request)
+            except Exception as e:
+                self._send(400, {"error": {"message": f"unreadable image: {e}", "type": "invalid_request_error"}})
+                return
+            prompt_tokens = len(urls) * TOKENS_PER_IMAGE + math.ceil(len(text) / 4)
+            completion_tokens = math.ceil(len(answer) / 4)
+            self._send(200, {
+                "id": f"chatcmpl-mock-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model") or MODEL_NAME,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+    return Handler
+
+def start_server(truth: Dict[str, Any], port: int = 0, latency: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve in a background thread; returns (server, base URL ending in /v1). port 0 picks a free port."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(Answers(truth), latency))
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+def main():
+    ap = argparse.ArgumentParser(description="Mock OpenAI-compatible vision server for the synthetic gauge photos.")
+    ap.add_argument("--truth", default="bench_images/ground_truth.json", help="ground_truth.json from synthetic_gauges.py")
+    ap.add_argument("--port", type=int, default=1234, help="Port (default: 1234, LM Studio's)")
+    ap.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each answer")
+    args = ap.parse_args()
+
+    with open(args.truth, "r", encoding="utf-8") as f:
+        truth = json.load(f)
+    server, url = start_server(truth, args.port, args.latency)
+    print(f"Mock model at {url} ({len(truth['images'])} images known); Ctrl-C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
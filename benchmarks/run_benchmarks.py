@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+run_benchmarks.py
+-----------------
+Benchmark every pipeline stage on synthetic gauge photos with known numbers and
+compare the result with a saved baseline, so a slowdown (or a drop in accuracy)
+in any stage shows up before the nightly batch.
+
+Stages, each timed per item with its peak Python allocation and the process RSS:
+  thumbnails  create_thumbnails.create_thumbnail on every photo
+  encode      the runner's base64 / JPEG data-URI encoding of every thumbnail
+  exif        exif_to_json_and_csv.update_store into a fresh metadata store (needs exiftool)
+  cost        image_cost_batch.estimate_costs for the thumbnails
+  inference   the runner's analyze_images per fill-up against mock_llm_server.py
+              (or --server, e.g. LM Studio), checked against the ground truth, with the
+              model requests and prompt tokens per fill-up (--mosaic: one composite image)
+  db_ingest   one transaction per fill-up into a scratch SQLite database
+  mpg         compute_mpg.recompute_mpg over the whole history, checked against the ground truth
+
+The database stages always use GASSER_DB_BACKEND=sqlite in the work folder, never .env's database.
+Photos are reused between runs while --count / --resolution / --seed are unchanged.
+Exit status is 1 when a stage fails or regresses against --baseline.
+
+Usage:
+  python benchmarks/run_benchmarks.py --count 20
+  python benchmarks/run_benchmarks.py --count 50 --save-baseline benchmarks/baseline.json
+  python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --tolerance 0.2
+  python benchmarks/run_benchmarks.py --stages inference --server http://localhost:1234/v1   # real model accuracy
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Windows: no getrusage, RSS is left out
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import metrics
+from synthetic_gauges import DEFAULT_RESOLUTION, GROUND_TRUTH, generate, parse_resolution
+
+STAGE_NAMES = ["thumbnails", "encode", "exif", "cost", "inference", "db_ingest", "mpg"]
+DEFAULT_WORK_DIR = os.path.join(BENCH_DIR, "work")
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+########################
+def max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def measure(items: Iterable[Any], fn: Callable[[Any], Any], verbose: bool = False) -> Dict[str, Any]:
+    """Run fn on every item; time each call and track the peak Python allocation."""
+    items = list(items)
+    per_item: List[float] = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with out:
+        for item in items:
+            t0 = time.perf_counter()
+            fn(item)
+            per_item.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_item.sort()
+    return {
+        "items": len(items),
+        "seconds": round(elapsed, 4),
+        "items_per_sec": round(len(items) / elapsed, 3) if elapsed > 0 else None,
+        "p50_ms": round(metrics.quantile(per_item, 0.50) * 1000, 3) if per_item else None,
+        "p95_ms": round(metrics.quantile(per_item, 0.95) * 1000, 3) if per_item else None,
+        "peak_alloc_mb": round(peak / (1024 * 1024), 2),
+        "max_rss_mb": max_rss_mb(),
+    }
+
+########################
+class Bench:
+    def __init__(self, args, truth: Dict[str, Any]):
+        self.args = args
+        self.truth = truth
+        self.images_dir = os.path.join(args.work_dir, "images")
+        self.thumbs_dir = os.path.join(args.work_dir, "thumbnails")
+        self.fillups = truth["fillups"]
+
+    def photo(self, name: str) -> str:
+        return os.path.join(self.images_dir, name)
+
+    def thumb(self, fillup: Dict[str, Any], name: str) -> str:
+        return os.path.join(self.thumbs_dir, f"fillup-{fillup['index']:04d}", name)
+
+    def thumbnail_paths(self) -> List[str]:
+        return [self.thumb(f, f[key]) for f in self.fillups for key in ("odometer_file", "gaspump_file")]
+
+    ########################
+    def thumbnails(self) -> Dict[str, Any]:
+        from create_thumbnails import create_thumbnail
+
+        def one(pair):
+            fillup, name = pair
+            os.makedirs(os.path.dirname(self.thumb(fillup, name)), exist_ok=True)
+            create_thumbnail(self.photo(name), self.thumb(fillup, name))
+        pairs = [(f, f[key]) for f in self.fillups for key in ("odometer_file", "gaspump_file")]
+        return measure(pairs, one, self.args.verbose)
+
+    def encode(self) -> Dict[str, Any]:
+        if self.args.runner == "chatgpt":
+            from run_vision_query_chatgpt import encode_image_as_jpeg_data_uri as encode
+        else:
+            from run_vision_query_locally import encode_image as encode
+        payload = []
+        result = measure(self.thumbnail_paths(), lambda p: payload.append(len(encode(p))), self.args.verbose)
+        result["payload_kb_per_image"] = round(sum(payload) / max(1, len(payload)) / 1024, 1)
+        return result
+
+    def exif(self) -> Dict[str, Any]:
+        import exiftool
+        import exif_to_json_and_csv as exif
+        import metadata_store
+
+        store_path = os.path.join(self.args.work_dir, "bench_metadata.sqlite")
+        if os.path.exists(store_path):
+            os.remove(store_path)
+        store = metadata_store.open_store(store_path)
+        try:
+            with exiftool.ExifTool() as et:
+                return measure([self.photo(i["file"]) for i in self.truth["images"]],
+                               lambda p: exif.update_store(store, [p], "bench@example.com", 0, True, et=et),
+                               self.args.verbose)
+        finally:
+            store.close()
+
+    def cost(self) -> Dict[str, Any]:
+        from image_cost_batch import count_tokens, estimate_costs
+
+        with open(os.path.join(REPO_DIR, "prompt_file"), "r", encoding="utf-8") as f:
+            input_tokens = count_tokens(f.read(), "gpt-4o")
+        return measure(self.thumbnail_paths(), lambda p: estimate_costs([p], input_tokens, 0), self.args.verbose)
+
+    def inference(self) -> Dict[str, Any]:
+        if self.args.runner == "chatgpt":
+            import run_vision_query_chatgpt as runner
+            analyze = lambda d: runner.analyze_images(d, self.args.model)
+        else:
+            import run_vision_query_locally as runner
+            analyze = lambda d: runner.analyze_images(d, mosaic=self.args.mosaic)
+        runner.get_client()  # import openai and build the client outside the timed calls
+
+        correct = []
+        def one(fillup):
+            results = analyze(os.path.dirname(self.thumb(fillup, fillup["odometer_file"])))
+            correct.append(reading_matches(results, fillup))
+        requests, prompt_tokens = llm_totals()
+        result = measure(self.fillups, one, self.args.verbose)
+        after = llm_totals()
+        result["correct"] = sum(correct)
+        result["accuracy"] = round(sum(correct) / max(1, len(correct)), 4)
+        result["requests_per_fillup"] = round((after[0] - requests) / max(1, len(self.fillups)), 2)
+        result["prompt_tokens_per_fillup"] = round((after[1] - prompt_tokens) / max(1, len(self.fillups)), 1)
+        return result
+
+    def db_ingest(self) -> Dict[str, Any]:
+        import gasser_db
+        from create_gasser_table import CREATE_INDEXES_SQL, SQLITE_CREATE_TABLE_SQL, SQLITE_DROP_TABLE_SQL
+
+        with gasser_db.transaction() as cur:
+            cur.execute(SQLITE_DROP_TABLE_SQL)
+            cur.execute(SQLITE_CREATE_TABLE_SQL)
+            gasser_db.execute_script(cur, CREATE_INDEXES_SQL.format(key_suffix="", fill_time_using=""))
+
+        def one(f):
+            # one transaction per fill-up, as write_results_sql.py does
+            with gasser_db.transaction() as cur:
+                gasser_db.execute_prepared(cur, "insert_reading", gasser_db.INSERT_READING_SQL, (
+                    f["odometer_file"], f["trip"], f["total_mileage"], f["gaspump_file"],
+                    f["dollars"], f["gallons"], datetime.fromisoformat(f["fill_time"])))
+        return measure(self.fillups, one, self.args.verbose)
+
+    def mpg(self) -> Dict[str, Any]:
+        import gasser_db
+        from compute_mpg import recompute_mpg
+
+        result = measure([None], lambda _: recompute_mpg(), self.args.verbose)
+        with gasser_db.transaction() as cur:
+            cur.execute("SELECT odometer_file, mpg FROM fuel_readings")
+            computed = dict(cur.fetchall())
+        result["items"] = len(computed)
+        result["items_per_sec"] = round(len(computed) / result["seconds"], 3) if result["seconds"] else None
+        # the first fill-up has no previous reading to compute from
+        expected = {f["odometer_file"]: round(f["trip"] / f["gallons"], 2) for f in self.fillups[1:]}
+        correct = sum(1 for name, mpg in expected.items()
+                      if computed.get(name) is not None and abs(computed[name] - mpg) < 0.011)
+        result["correct"] = correct
+        result["accuracy"] = round(correct / max(1, len(expected)), 4)
+        return result
+
+def as_float(value: Any) -> Optional[float]:
+    try:
+        return float(str(value).replace(",", "").replace("$", ""))
+    except (TypeError, ValueError):
+        return None
+
+def llm_totals() -> Tuple[int, int]:
+    """(model requests, prompt tokens) llm_ledger has recorded in this process so far."""
+    summary = metrics.summary()
+    requests = sum(h["count"] for k, h in summary["histograms"].items() if k.startswith("llm_request_seconds"))
+    tokens = sum(v for k, v in summary["counters"].items() if k.startswith("llm_prompt_tokens_total"))
+    return int(requests), int(tokens)
+
+def reading_matches(results: Dict[str, Any], fillup: Dict[str, Any]) -> bool:
+    odo = results.get("odometer_image") or {}
+    gas = results.get("gas_pump_image") or {}
+    mileage, dollars, gallons = (as_float(odo.get("bottom_value_total_mileage")),
+                                 as_float(gas.get("top_value_dollars")), as_float(gas.get("bottom_value_gallons")))
+    return (mileage is not None and dollars is not None and gallons is not None
+            and mileage == fillup["total_mileage"]
+            and abs(dollars - fillup["dollars"]) < 0.005
+            and abs(gallons - fillup["gallons"]) < 0.0005)
+
+########################
+def prepare_images(args) -> Dict[str, Any]:
+    images_dir = os.path.join(args.work_dir, "images")
+    truth_path = os.path.join(images_dir, GROUND_TRUTH)
+    resolution = f"{args.resolution[0]}x{args.resolution[1]}"
+    if not args.regenerate and os.path.exists(truth_path):
+        with open(truth_path, "r", encoding="utf-8") as f:
+            truth = json.load(f)
+        if (truth.get("seed") == args.seed and truth.get("resolution") == resolution
+                and len(truth.get("fillups", [])) == args.count):
+            return truth
+    print(f"Generating {2 * args.count} synthetic photos at {resolution} ...")
+    return generate(images_dir, args.count, args.resolution, args.seed)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(args) -> Dict[str, Any]:
+    os.makedirs(args.work_dir, exist_ok=True)
+    # before gasser_db / the runners are imported: scratch database, mock model
+    os.environ["GASSER_DB_BACKEND"] = "sqlite"
+    os.environ["GASSER_SQLITE_PATH"] = os.path.join(args.work_dir, "bench.sqlite")
+
+    truth = prepare_images(args)
+    server = None
+    if "inference" in args.stages:
+        url = args.server
+        if url is None:
+            from mock_llm_server import start_server
+            server, url = start_server(truth, latency=args.mock_latency)
+        os.environ["LMSTUDIO_BASE_URL"] = url
+        os.environ["OPENAI_BASE_URL"] = url
+        if args.server is None:
+            os.environ["OPENAI_API_KEY"] = "mock"
+
+    bench = Bench(args, truth)
+    stages: Dict[str, Any] = {}
+    try:
+        for name in STAGE_NAMES:
+            if name not in args.stages:
+                continue
+            print(f"=== {name}", end="", flush=True)
+            try:
+                stages[name] = getattr(bench, name)()
+                s = stages[name]
+                rate = f"{s['items_per_sec']:.2f}/s" if s["items_per_sec"] is not None else "-"
+                print(f": {s['items']} items, {rate}, p95 {s['p95_ms']} ms, peak {s['peak_alloc_mb']} MB"
+                      + (f", accuracy {s['accuracy']:.0%}" if "accuracy" in s else "")
+                      + (f", {s['requests_per_fillup']} requests / {s['prompt_tokens_per_fillup']:.0f} prompt tokens"
+                         " per fill-up" if "requests_per_fillup" in s else ""))
+            except (Exception, SystemExit) as e:
+                stages[name] = {"error": f"{type(e).__name__}: {e}"}
+                print(f": FAILED {stages[name]['error']}")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    return {
+        "run": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "count": args.count,
+            "resolution": truth["resolution"],
+            "seed": args.seed,
+            "runner": args.runner,
+            "model": args.model if args.runner == "chatgpt" else None,
+            "server": args.server or "mock",
+            "mock_latency": args.mock_latency,
+            "mosaic": args.mosaic,
+        },
+        "stages": stages,
+        # per-call timings from metrics.py (LLM requests, DB connects, thumbnails, ...)
+        "calls": metrics.summary()["histograms"],
+    }
+
+########################
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Lines describing each stage against the baseline; regressions start with 'REGRESSION'."""
+    lines = []
+    for key in ("count", "resolution", "runner", "server", "mock_latency", "mosaic"):
+        if current["config"].get(key) != baseline["config"].get(key):
+            lines.append(f"note: {key} differs from the baseline "
+                         f"({current['config'].get(key)} vs {baseline['config'].get(key)})")
+
+    for name, cur in current["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None or "error" in base:
+            continue
+        if "error" in cur:
+            lines.append(f"REGRESSION {name}: failed ({cur['error']}), the baseline passed")
+            continue
+        if cur.get("items_per_sec") and base.get("items_per_sec"):
+            ratio = cur["items_per_sec"] / base["items_per_sec"]
+            verdict = "REGRESSION" if ratio < 1 - tolerance else "ok"
+            lines.append(f"{verdict} {name}: {cur['items_per_sec']:.2f}/s vs {base['items_per_sec']:.2f}/s "
+                         f"({ratio - 1:+.0%})")
+        # allocations under a megabyte are noise
+        if cur["peak_alloc_mb"] > base["peak_alloc_mb"] * (1 + tolerance) + 1.0:
+            lines.append(f"REGRESSION {name}: peak allocation {cur['peak_alloc_mb']} MB vs {base['peak_alloc_mb']} MB")
+        if "accuracy" in cur and "accuracy" in base and cur["accuracy"] < base["accuracy"]:
+            lines.append(f"REGRESSION {name}: accuracy {cur['accuracy']:.1%} vs {base['accuracy']:.1%}")
+    return lines
+
+def stage_list(value: str) -> List[str]:
+    names = [n.strip() for n in value.split(",") if n.strip()]
+    unknown = [n for n in names if n not in STAGE_NAMES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown stage(s) {', '.join(unknown)}; choose from {', '.join(STAGE_NAMES)}")
+    return names
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic gauge photos.")
+    ap.add_argument("--count", type=int, default=20, help="Synthetic fill-ups, two photos each (default: 20)")
+    ap.add_argument("--resolution", type=parse_resolution, default=DEFAULT_RESOLUTION,
+                    help=f"Photo size WIDTHxHEIGHT (default: {DEFAULT_RESOLUTION})")
+    ap.add_argument("--seed", type=int, default=42, help="Random seed for the photos")
+    ap.add_argument("--regenerate", action="store_true", help="Generate the photos even if matching ones exist")
+    ap.add_argument("--stages", type=stage_list, default=STAGE_NAMES, metavar="STAGE[,STAGE]",
+                    help=f"Stages to run (default: all of {', '.join(STAGE_NAMES)})")
+    ap.add_argument("--runner", choices=["local", "chatgpt"], default="local",
+                    help="Inference code path: run_vision_query_locally.py or run_vision_query_chatgpt.py")
+    ap.add_argument("--model", default="gpt-4o-mini", help="Model name for --runner chatgpt")
+    ap.add_argument("--mosaic", action="store_true", help="--runner local: one composite image per fill-up")
+    ap.add_argument("--server", default=None, metavar="URL",
+                    help="OpenAI-compatible base URL to benchmark instead of the mock (e.g. http://localhost:1234/v1)")
+    ap.add_argument("--mock-latency", type=float, default=0.0, help="Seconds the mock model waits per request")
+    ap.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="Photos, thumbnails and scratch databases")
+    ap.add_argument("--out", default=None, help="Results JSON (default: benchmarks/results/bench-<time>.json)")
+    ap.add_argument("--baseline", default=None, help="Results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15,
+                    help="Allowed slowdown / extra memory before a stage counts as a regression (default: 0.15)")
+    ap.add_argument("--save-baseline", default=None, metavar="PATH", help="Also write the results as the new baseline")
+    ap.add_argument("--verbose", action="store_true", help="Show the output of the stages")
+    args = ap.parse_args()
+
+    baseline = None
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            raise SystemExit(f"ERROR: Baseline not found: {args.baseline}")
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    out = args.out or os.path.join(DEFAULT_RESULTS_DIR, time.strftime("bench-%Y%m%dT%H%M%S.json"))
+    for path in filter(None, (out, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    failed = [name for name, s in results["stages"].items() if "error" in s]
+    regressions = []
+    if baseline is not None:
+        print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for line in compare(results, baseline, args.tolerance):
+            print("  " + line)
+            if line.startswith("REGRESSION"):
+                regressions.append(line)
+    if failed or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+synthetic_gauges.py
+-------------------
+Generate odometer and gas pump display photos with known numbers, for the
+benchmarks (and for checking a model's readings against ground truth).
+
+- A history of fill-ups: the odometer grows by a random trip each time, the
+  pump shows dollars and gallons for that trip at a random price
+- Digits are drawn as seven-segment displays (like the real dashboard and pump),
+  no fonts needed; every value is known exactly
+- File names carry the Gmail date prefix that gasser.py gives downloaded
+  attachments, and EXIF DateTimeOriginal / GPS are set to match
+- A 16-cell black/white strip along the top encodes each image's index, so the
+  mock model server can look up the right answer from a thumbnail of the image
+- ground_truth.json lists every fill-up with its files and numbers
+
+Usage:
+  python benchmarks/synthetic_gauges.py --out bench_images --count 20
+  python benchmarks/synthetic_gauges.py --out bench_images --count 200 --resolution 3024x4032
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageDraw
+
+GROUND_TRUTH = "ground_truth.json"
+ID_BITS = 16
+DEFAULT_RESOLUTION = "1512x2016"      # half an iPhone photo; the real ones are 3024x4032
+
+# segments a..g of each digit (a top, b top right, c bottom right, d bottom, e bottom left, f top left, g middle)
+SEGMENTS = {
+    "0": "abcdef", "1": "bc", "2": "abdeg", "3": "abcdg", "4": "bcfg",
+    "5": "acdfg", "6": "acdefg", "7": "abc", "8": "abcdefg", "9": "abcdfg",
+}
+
+# Tag ids for Image.Exif
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_DATETIME_ORIGINAL = 0x9003
+
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    try:
+        w, h = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"resolution must look like 1512x2016, not {value!r}")
+    if w < 64 or h < 64:
+        raise argparse.ArgumentTypeError("resolution must be at least 64x64")
+    return w, h
+
+########################
+# Drawing
+
+def draw_digit(draw: ImageDraw.ImageDraw, x: float, y: float, w: float, h: float, digit: str, color) -> None:
+    t = max(2, w * 0.16)                 # segment thickness
+    half = h / 2
+    boxes = {
+        "a": (x + t, y, x + w - t, y + t),
+        "b": (x + w - t, y + t, x + w, y + half),
+        "c": (x + w - t, y + half, x + w, y + h - t),
+        "d": (x + t, y + h - t, x + w - t, y + h),
+        "e": (x, y + half, x + t, y + h - t),
+        "f": (x, y + t, x + t, y + half),
+        "g": (x + t, y + half - t / 2, x + w - t, y + half + t / 2),
+    }
+    for seg in SEGMENTS[digit]:
+        draw.rectangle(boxes[seg], fill=color)
+
+def draw_number(draw: ImageDraw.ImageDraw, box: Tuple[float, float, float, float], text: str, color) -> None:
+    """Right-aligned seven-segment number filling the height of box; '.' is a small square."""
+    x0, y0, x1, y1 = box
+    h = y1 - y0
+    w = h * 0.55
+    gap = w * 0.3
+    x = x1
+    for ch in reversed(text):
+        if ch == ".":
+            dot = w * 0.22
+            x -= dot + gap
+            draw.rectangle((x, y1 - dot, x + dot, y1), fill=color)
+        else:
+            x -= w + gap
+            draw_digit(draw, x, y0, w, h, ch, color)
+
+def draw_id_strip(draw: ImageDraw.ImageDraw, width: int, height: int, index: int) -> None:
+    cell = width / ID_BITS
+    band = height / 12
+    for bit in range(ID_BITS):
+        on = (index >> (ID_BITS - 1 - bit)) & 1
+        draw.rectangle((bit * cell, 0, (bit + 1) * cell, band), fill=(255, 255, 255) if on else (0, 0, 0))
+
+def read_id_strip(img: Image.Image) -> int:
+    """Inverse of draw_id_strip, for an image at any scale."""
+    gray = img.convert("L")
+    w, h = gray.size
+    cell = w / ID_BITS
+    band = h / 12
+    index = 0
+    for bit in range(ID_BITS):
+        # sample the middle of the cell, away from edges blurred by resizing and JPEG
+        box = (int(bit * cell + cell * 0.3), int(band * 0.3), int(bit * cell + cell * 0.7), int(band * 0.7))
+        pixels = list(gray.crop(box).getdata())
+        index = (index << 1) | (sum(pixels) / max(1, len(pixels)) > 127)
+    return index
+
+def render(kind: str, index: int, top: str, bottom: str, size: Tuple[int, int], rng: random.Random) -> Image.Image:
+    w, h = size
+    if kind == "odometer":
+        background, panel, lit = (28, 30, 34), (10, 12, 10), (235, 120, 40)
+    else:
+        background, panel, lit = (150, 150, 145), (20, 40, 25), (120, 255, 140)
+    shade = rng.randint(-12, 12)
+    img = Image.new("RGB", size, tuple(max(0, min(255, c + shade)) for c in background))
+    draw = ImageDraw.Draw(img)
+    draw_id_strip(draw, w, h, index)
+
+    # display panel in the middle, two rows of digits
+    px0, py0, px1, py1 = w * 0.08, h * 0.30, w * 0.92, h * 0.70
+    draw.rectangle((px0, py0, px1, py1), fill=panel)
+    row_h = (py1 - py0) * 0.32
+    pad = (py1 - py0) * 0.12
+    draw_number(draw, (px0, py0 + pad, px1 - w * 0.05, py0 + pad + row_h), top, lit)
+    draw_number(draw, (px0, py1 - pad - row_h, px1 - w * 0.05, py1 - pad), bottom, lit)
+    return img
+
+def exif_bytes(taken_at: datetime, lat: float, lng: float) -> bytes:
+    exif = Image.Exif()
+    exif[TAG_MAKE] = "gasser"
+    exif[TAG_MODEL] = "synthetic"
+    exif.get_ifd(EXIF_IFD)[TAG_DATETIME_ORIGINAL] = taken_at.strftime("%Y:%m:%d %H:%M:%S")
+    gps = exif.get_ifd(GPS_IFD)
+    gps[1], gps[2] = ("N" if lat >= 0 else "S"), dms(abs(lat))
+    gps[3], gps[4] = ("E" if lng >= 0 else "W"), dms(abs(lng))
+    return exif.tobytes()
+
+def dms(value: float) -> Tuple[float, float, float]:
+    deg = int(value)
+    minutes = int((value - deg) * 60)
+    return float(deg), float(minutes), round((value - deg - minutes / 60) * 3600, 2)
+
+########################
+def fillup_history(count: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    odometer = rng.randint(10000, 200000)
+    when = datetime(2024, 1, 6, 17, 30, tzinfo=timezone.utc)
+    fillups = []
+    for i in range(count):
+        trip = rng.randint(180, 420)
+        gallons = round(rng.uniform(7.0, 13.0), 3)
+        price = round(rng.uniform(2.89, 4.59), 3)
+        odometer += trip
+        when += timedelta(days=rng.randint(4, 10), minutes=rng.randint(-90, 90))
+        fillups.append({
+            "index": i,
+            "fill_time": when.isoformat(),
+            "trip": trip,
+            "total_mileage": odometer,
+            "gallons": gallons,
+            "dollars": round(gallons * price, 2),
+            "lat": round(39.74 + rng.uniform(-0.05, 0.05), 6),
+            "lng": round(-104.99 + rng.uniform(-0.05, 0.05), 6),
+        })
+    return fillups
+
+def file_name(taken_at: datetime, n: int) -> str:
+    # the attachment name gasser.py writes: <ISO date with - for :>_<original name>
+    return taken_at.strftime("%Y-%m-%dT%H-%M-%S+00-00") + f"_IMG_{n:04d}.jpg"
+
+def generate(out_dir: str, count: int, size: Tuple[int, int] = (1512, 2016), seed: int = 42,
+             quality: int = 90) -> Dict[str, Any]:
+    """Write 2 * count images and ground_truth.json into out_dir; returns the ground truth."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed + 1)
+    fillups = fillup_history(count, seed)
+    images = []
+    for f in fillups:
+        when = datetime.fromisoformat(f["fill_time"])
+        odo_time, pump_time = when, when + timedelta(seconds=rng.randint(30, 240))
+        odo_name = file_name(odo_time, 2 * f["index"])
+        pump_name = file_name(pump_time, 2 * f["index"] + 1)
+
+        odo = render("odometer", len(images), str(f["trip"]), f"{f['total_mileage']:06d}", size, rng)
+        odo.save(os.path.join(out_dir, odo_name), quality=quality, exif=exif_bytes(odo_time, f["lat"], f["lng"]))
+        images.append({"file": odo_name, "kind": "odometer", "fillup": f["index"]})
+
+        pump = render("pump", len(images), f"{f['dollars']:.2f}", f"{f['gallons']:.3f}", size, rng)
+        pump.save(os.path.join(out_dir, pump_name), quality=quality, exif=exif_bytes(pump_time, f["lat"], f["lng"]))
+        images.append({"file": pump_name, "kind": "pump", "fillup": f["index"]})
+
+        f["odometer_file"], f["gaspump_file"] = odo_name, pump_name
+
+    truth = {"seed": seed, "resolution": f"{size[0]}x{size[1]}", "fillups": fillups, "images": images}
+    with open(os.path.join(out_dir, GROUND_TRUTH), "w", encoding="utf-8") as fh:
+        json.dump(truth, fh, indent=2)
+    return truth
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic odometer / pump photos with known numbers.")
+    ap.add_argument("--out", default="bench_images", help="Output folder (default: bench_images)")
+    ap.add_argument("--count", type=int, default=20, help="Fill-ups to generate, two photos each (default: 20)")
+    ap.add_argument("--resolution", type=parse_resolution, default=DEFAULT_RESOLUTION,
+                    help=f"Photo size WIDTHxHEIGHT (default: {DEFAULT_RESOLUTION})")
+    ap.add_argument("--seed", type=int, default=42, help="Random seed; the same seed gives the same photos")
+    ap.add_argument("--quality", type=int, default=90, help="JPEG quality (default: 90)")
+    args = ap.parse_args()
+
+    truth = generate(args.out, args.count, args.resolution, args.seed, args.quality)
+    print(f"{len(truth['images'])} images for {len(truth['fillups'])} fill-ups -> {args.out}/ ({GROUND_TRUTH})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+bulk_ingest_results.py
+----------------------
+Load many results_llm.json documents into fuel_readings in one transaction.
+
+- Inputs: results JSON files, directories (searched recursively for *.json / *.jsonl),
+  JSON Lines files with one results document per line, or "-" for JSONL on stdin
+- Each reading gets its fill_time from the metadata store (EXIF DateTimeOriginal)
+  or from the date prefix of its file names
+- Rows are COPYed into a temporary staging table, then inserted oldest fill-up first;
+  readings without a known date get -infinity (gasser_db.UNDATED_SQL), like every other insert
+- Rows with a non-numeric trip, mileage, dollars or gallons value are rejected
+  and listed by source; the rest of the batch still goes in
+- Readings already in the table, or repeated in the input, are skipped
+  (ON CONFLICT on the odometer file name)
+
+Usage:
+  python bulk_ingest_results.py results/                 # a directory of results_llm*.json
+  python bulk_ingest_results.py backfill.jsonl more.json
+  cat backfill.jsonl | python bulk_ingest_results.py - --recompute-mpg
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+import gasser_db
+import llm_ledger
+from compute_mpg import recompute_mpg
+from fuel_stats import refresh_stats
+import metadata_store
+import profiling
+from write_results_sql import reading_from_results
+
+STAGING_SQL = """
+CREATE TEMP TABLE fuel_readings_staging (
+    source        TEXT,
+    odometer_file TEXT,
+    trip_value    TEXT,
+    total_mileage TEXT,
+    gaspump_file  TEXT,
+    dollars       TEXT,
+    gallons       TEXT,
+    fill_time     TEXT
+) ON COMMIT DROP
+"""
+
+COPY_SQL = "COPY fuel_readings_staging FROM STDIN WITH (FORMAT csv)"
+
+NUMERIC_COLUMNS = ("trip_value", "total_mileage", "dollars", "gallons")
+
+# Staging columns are text so a bad value can't break the COPY stream. Rows whose
+# numbers wouldn't cast are taken out of staging here and reported by source,
+# so one bad document doesn't abort the whole transaction.
+REJECT_FROM_STAGING_SQL = """
+DELETE FROM fuel_readings_staging
+WHERE {}
+RETURNING source, odometer_file
+""".format("\n   OR ".join(f"{col} !~ '^([-+]?([0-9]+[.]?[0-9]*|[.][0-9]+))?$'" for col in NUMERIC_COLUMNS))
+
+# DISTINCT ON drops duplicates inside the batch, ON CONFLICT drops readings that are
+# already in fuel_readings. Undated readings get -infinity rather than the load time,
+# which would put old history at the end.
+INSERT_FROM_STAGING_SQL = f"""
+INSERT INTO fuel_readings (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons, fill_time)
+SELECT odometer_file,
+       NULLIF(trip_value, '')::numeric,
+       NULLIF(total_mileage, '')::numeric,
+       gaspump_file,
+       NULLIF(dollars, '')::numeric,
+       NULLIF(gallons, '')::numeric,
+       COALESCE(NULLIF(fill_time, '')::timestamptz, {gasser_db.UNDATED_SQL})
+FROM (
+    SELECT DISTINCT ON (odometer_file) *
+    FROM fuel_readings_staging
+    ORDER BY odometer_file, source
+) s
+ORDER BY 7, odometer_file
+ON CONFLICT DO NOTHING
+"""
+
+Row = Tuple[str, str, str, str, str, str, str, str]
+
+
+def iter_documents(inputs: List[str], pattern: str) -> Iterator[Tuple[str, dict]]:
+    """(source, results dict) for every results document in the inputs."""
+    for item in inputs:
+        if item == "-":
+            yield from iter_jsonl(sys.stdin, "<stdin>")
+            continue
+        path = Path(item)
+        if path.is_dir():
+            files = sorted(p for p in path.rglob(pattern) if p.suffix.lower() in (".json", ".jsonl"))
+        elif path.exists():
+            files = [path]
+        else:
+            raise SystemExit(f"Error: '{path}' not found.")
+        for f in files:
+            with open(f, "r", encoding="utf-8") as fp:
+                if f.suffix.lower() == ".jsonl":
+                    yield from iter_jsonl(fp, str(f))
+                else:
+                    try:
+                        yield str(f), json.load(fp)
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping {f}: error decoding JSON: {e}")
+
+def iter_jsonl(fp, source: str) -> Iterator[Tuple[str, dict]]:
+    for lineno, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield f"{source}:{lineno}", json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Skipping {source}:{lineno}: error decoding JSON: {e}")
+
+def text(val) -> str:
+    return "" if val is None else str(val).strip()
+
+def staging_rows(documents: Iterable[Tuple[str, dict]]) -> Tuple[List[Row], int]:
+    rows: List[Row] = []
+    skipped = 0
+    store = metadata_store.open_store_if_exists()
+    try:
+        for source, data in documents:
+            reading = [text(v) for v in reading_from_results(data)]
+            if reading[0] in ("", "not found"):
+                # no odometer photo: nothing to compute MPG from, and no key to dedup on
+                skipped += 1
+                continue
+            fill_time = metadata_store.fill_time_for([reading[0], reading[3]], store)
+            rows.append((source, *reading, fill_time.isoformat() if fill_time else ""))
+    finally:
+        if store is not None:
+            store.close()
+    return rows, skipped
+
+def ingest_readings(rows: List[Row]) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    COPY rows into staging and insert the new ones, all in one transaction.
+    Returns rows inserted and the (source, odometer_file) of rows rejected as non-numeric.
+    """
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+
+    with gasser_db.transaction() as cur:
+        cur.execute(STAGING_SQL)
+        cur.copy_expert(COPY_SQL, buf)
+        cur.execute(REJECT_FROM_STAGING_SQL)
+        rejected = sorted(cur.fetchall())
+        cur.execute(INSERT_FROM_STAGING_SQL)
+        return cur.rowcount, rejected
+
+def main():
+    ap = argparse.ArgumentParser(description="Bulk-load results_llm JSON/JSONL into fuel_readings with COPY.")
+    ap.add_argument("inputs", nargs="+", help="Result files, directories, JSONL files, or - for JSONL on stdin")
+    ap.add_argument("--pattern", default="*.json*", help="Glob used inside directories (default: *.json*)")
+    ap.add_argument("--recompute-mpg", action="store_true", help="Recompute mpg for the whole history afterwards")
+    args = ap.parse_args()
+
+    if gasser_db.SQLITE:
+        raise SystemExit("ERROR: bulk COPY ingest needs PostgreSQL (GASSER_DB_BACKEND=postgres)")
+
+    rows, skipped = staging_rows(iter_documents(args.inputs, args.pattern))
+    if not rows:
+        raise SystemExit("No readings with an odometer image found in the inputs.")
+
+    with gasser_db.exit_on_db_error():
+        inserted, rejected = ingest_readings(rows)
+        if inserted:
+            llm_ledger.link_readings()
+        recomputed = recompute_mpg() if args.recompute_mpg and inserted else None
+        if inserted:
+            refresh_stats()
+
+    for source, odometer_file in rejected:
+        print(f"⚠️  Rejected {source}: {odometer_file} has a non-numeric reading")
+    print(f"Readings read:      {len(rows) + skipped}")
+    print(f"Without odometer:   {skipped}")
+    print(f"Rejected:           {len(rejected)}")
+    print(f"Inserted:           {inserted}")
+    print(f"Already present:    {len(rows) - len(rejected) - inserted}")
+    if recomputed is not None:
+        print(f"MPG recomputed:     {recomputed}")
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -1,9 +1,16 @@
 from PIL import Image
 import os
 
+import profiling
+
 folder = "attachments"
-for file in os.listdir(folder):
-    if file.lower().endswith((".jpg", ".png", ".tiff", ".bmp", ".webp")):
-        with Image.open(os.path.join(folder, file)) as img:
-            w, h = img.size
-        print(f"{file}: {w} x {h}")
+
+def main():
+    for file in os.listdir(folder):
+        if file.lower().endswith((".jpg", ".png", ".tiff", ".bmp", ".webp")):
+            with Image.open(os.path.join(folder, file)) as img:
+                w, h = img.size
+            print(f"{file}: {w} x {h}")
+
+if __name__ == "__main__":
+    profiling.run(main)
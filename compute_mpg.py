@@ -1,70 +1,99 @@
 #!/usr/bin/env python3
-import json
-import sys
-from pathlib import Path
-import sys
-import psycopg2
-from psycopg2 import sql
-from psycopg2.extras import DictCursor
-import os
-from dotenv import load_dotenv
-
-
-load_dotenv();
-
+import argparse
+from datetime import datetime
+
+import gasser_db
+import profiling
+from fuel_stats import refresh_stats
+
+
+# Set-based recompute: every reading gets its MPG from the previous reading's mileage in one
+# statement, in fill_time order. The optional filter limits it to the rows next to a changed
+# (or deleted) reading: a row is affected when the changed reading's position falls between
+# its previous reading's position and its own. A reading without gallons or mileage (a photo
+# the model could not read) gets no MPG, and neither does the reading after it.
+# gasser_db.FILL_ORDER puts undated readings first, like the -infinity seed row.
+RECOMPUTE_MPG_SQL = f"""
+UPDATE fuel_readings f
+SET mpg = CASE WHEN f.gallons > 0 AND w.total_mileage > 0 AND w.prev_mileage > 0
+               THEN ROUND(((w.total_mileage - w.prev_mileage) / f.gallons)::numeric, 2) END,
+    price_per_gal = CASE WHEN f.gallons > 0
+                         THEN ROUND((f.dollars / f.gallons)::numeric, 3) END
+FROM (
+    SELECT id, fill_time, total_mileage,
+           LAG(total_mileage) OVER (ORDER BY {gasser_db.FILL_ORDER}) AS prev_mileage,
+           LAG(fill_time)     OVER (ORDER BY {gasser_db.FILL_ORDER}) AS prev_time,
+           LAG(id)            OVER (ORDER BY {gasser_db.FILL_ORDER}) AS prev_id
+    FROM fuel_readings
+) w
+WHERE f.id = w.id
+"""
+
+# Same statement for the embedded SQLite backend (no ::casts, and UPDATE needs AS for the alias)
+SQLITE_RECOMPUTE_MPG_SQL = f"""
+UPDATE fuel_readings AS f
+SET mpg = CASE WHEN f.gallons > 0 AND w.total_mileage > 0 AND w.prev_mileage > 0
+               THEN ROUND((w.total_mileage - w.prev_mileage) / f.gallons, 2) END,
+    price_per_gal = CASE WHEN f.gallons > 0
+                         THEN ROUND(f.dollars / f.gallons, 3) END
+FROM (
+    SELECT id, fill_time, total_mileage,
+           LAG(total_mileage) OVER (ORDER BY {gasser_db.FILL_ORDER}) AS prev_mileage,
+           LAG(fill_time)     OVER (ORDER BY {gasser_db.FILL_ORDER}) AS prev_time,
+           LAG(id)            OVER (ORDER BY {gasser_db.FILL_ORDER}) AS prev_id
+    FROM fuel_readings
+) AS w
+WHERE f.id = w.id
+"""
+
+# {time} / {id}: the changed reading's position, in the caller's placeholder style
+# (gasser_db_async.py fills in asyncpg's $1 / $2)
+AROUND_FILTER_TEMPLATE = """
+  AND (w.fill_time, w.id) >= ({time}, {id})
+  AND (w.prev_time IS NULL OR (w.prev_time, w.prev_id) <= ({time}, {id}))
+"""
+AROUND_FILTER = AROUND_FILTER_TEMPLATE.format(time="%(time)s", id="%(id)s")
+
+READING_TIME_SQL = "SELECT fill_time FROM fuel_readings WHERE id = %s"
 
 
 ########################
 def compute_mpg_info( ):
-    PGHOST      = os.environ.get("PGHOST")
-    PGUSER      = os.environ.get("PGUSER")
-    PGPASSWORD  = os.environ.get("PGPASSWORD")  
-    PGPORT      = os.environ.get("PGPORT")
-    PGDATABASE  = os.environ.get("PGDATABASE")
-
-    DB_CONFIG = {
-        "dbname": PGDATABASE,
-        "user":   PGUSER,
-        "password": PGPASSWORD,
-        "host": PGHOST,
-        "port": PGPORT
-    }
-    
-
-    query = "select * from fuel_readings order by id desc limit 2; "
-
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.autocommit = True
-  
-        #server side cursor
-        cur = conn.cursor()
-        cur.execute(query)
+    with gasser_db.transaction() as cur:
+        gasser_db.execute_prepared(cur, "latest_readings", gasser_db.LATEST_READINGS_SQL, (2,))
         
         #this is current gas fill up
         row = cur.fetchone()
-
-        if row:
-            id         = row[0]
-            total_mileage_current = row[3]
-            gallons    = row[6]
-            dollars    = row[5]
-            file_name1 = row[1]
-            datestr    = file_name1[:22]
-
-      
-        #this the previous gas fill up
+        if not row:
+            print("No readings in fuel_readings yet; nothing to compute.")
+            return
+
+        id         = row[0]
+        total_mileage_current = row[3]
+        gallons    = row[6]
+        dollars    = row[5]
+        fill_time  = row[12]
+        datestr    = fill_time.isoformat() if fill_time else str(row[1])[:22]
+
+        #this the previous gas fill up (none for the very first reading)
         row2= cur.fetchone()
-        if row2:
-            total_mileage_previous = row2[3]
-              
-
-    
-        trip_mileage = total_mileage_current - total_mileage_previous
-        mpg  = trip_mileage / gallons
-
-        #round to two decimal places
-        mpg  = round(mpg, 2)
+        total_mileage_previous = row2[3] if row2 else None
+
+        # an unreadable photo leaves its values NULL (or 0 in results written before that)
+        trip_mileage = None
+        mpg = None
+        if row2 is None:
+            print("First reading: no previous mileage to compute the MPG from.")
+        elif not total_mileage_previous:
+            print("The previous reading has no odometer value; MPG not computed.")
+        elif not total_mileage_current:
+            print("The odometer reading is missing (photo not readable?); MPG not computed.")
+        elif not gallons:
+            print("The gallons are missing or 0 (photo not readable?); MPG not computed.")
+        else:
+            trip_mileage = total_mileage_current - total_mileage_previous
+            #round to two decimal places
+            mpg  = round(trip_mileage / gallons, 2)
 
         print(f"id:          {id}")
         print(f"date:        {datestr}")
@@ -73,31 +102,11 @@ def compute_mpg_info( ):
         print(f"dollars:     {dollars}")
         print(f"mpg:         {mpg}")
         
-        price_per_gal = round(dollars / gallons, 3)
-
-
-        #now lets update the mpg record
-        # Example update
-        cur.execute("""
-            UPDATE fuel_readings
-            SET mpg = %s, price_per_gal = %s 
-            WHERE id = %s
-        """, (mpg, price_per_gal, id))
-
-        # even though we autocommit .. a commit can't hurt
-        conn.commit()  # <-- Required to make changes permanent
-        cur.close()
-        conn.close()
-
-    except psycopg2.Error as e:
-        print(f"PostgreSQL error: {e}")
-        sys.exit(1)
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except Exception:
-            pass
+        price_per_gal = round(dollars / gallons, 3) if gallons and dollars is not None else None
+
+
+        #now lets update the mpg record - committed when the transaction block exits
+        gasser_db.execute_prepared(cur, "update_mpg", gasser_db.UPDATE_MPG_SQL, (mpg, price_per_gal, id))
     
          
 
@@ -106,13 +115,58 @@ def compute_mpg_info( ):
 
 
 ########################
-def main():
+def recompute_mpg(around_id=None, around_time=None):
+    """
+    Recompute mpg and price_per_gal for the whole history, or only next to one reading:
+    around_id for a reading that was inserted or corrected, around_time for one that was deleted.
+    Raises ValueError when there is no reading around_id.
+    """
+    query = SQLITE_RECOMPUTE_MPG_SQL if gasser_db.SQLITE else RECOMPUTE_MPG_SQL
+    params = {}
+    if isinstance(around_time, str):
+        around_time = datetime.fromisoformat(around_time)
+
+    with gasser_db.transaction() as cur:
+        if around_id is not None or around_time is not None:
+            if around_time is None:
+                cur.execute(READING_TIME_SQL, (around_id,))
+                row = cur.fetchone()
+                if not row:
+                    raise ValueError(f"no reading with id {around_id}")
+                around_time = row[0]
+            query += AROUND_FILTER
+            params = {"time": around_time, "id": around_id if around_id is not None else 0}
+
+        cur.execute(query, params)
+        return cur.rowcount
 
 
+
+########################
+def main():
+    ap = argparse.ArgumentParser(description="Compute MPG and price per gallon for fuel_readings.")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--all", action="store_true", help="Recompute every reading in one statement")
+    mode.add_argument("--around", type=int, metavar="ID",
+                      help="Recompute only the readings next to an inserted or corrected reading id")
+    mode.add_argument("--around-time", metavar="TIMESTAMP",
+                      help="Recompute only the readings next to a deleted reading's fill_time")
+    args = ap.parse_args()
+
     #print( odometer_file, trip_milage, total_mileage, gas_pump_file, dollars, gallons)
 
-    compute_mpg_info()
+    with gasser_db.exit_on_db_error():
+        if args.all or args.around is not None or args.around_time:
+            try:
+                updated = recompute_mpg(args.around, args.around_time)
+            except ValueError as e:
+                raise SystemExit(f"ERROR: {e}; use --around-time for deleted readings")
+            print(f"Recomputed mpg for {updated} readings")
+        else:
+            compute_mpg_info()
+        # the stats views read mpg, so they are refreshed once it is written
+        refresh_stats()
  
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    profiling.run(main)
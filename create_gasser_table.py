@@ -1,30 +1,9 @@
 #!/usr/bin/env python3
-from dotenv import load_dotenv
-import os
+import argparse
 
-load_dotenv();
-
-PGHOST      = os.environ.get("PGHOST")
-PGUSER      = os.environ.get("PGUSER")
-PGPASSWORD  = os.environ.get("PGPASSWORD")
-PGPORT      = os.environ.get("PGPORT")
-PGDATABASE  = os.environ.get("PGDATABASE")
-
-
-
-
-import sys
-import psycopg2
-from psycopg2 import sql
-
-# Adjust these or use env vars like PGHOST/PGUSER/PGPASSWORD/PGPORT
-DB_CONFIG = {
-    "dbname": PGDATABASE,
-    "user":   PGUSER,    
-    "password": PGPASSWORD,
-    "host": PGHOST,
-    "port": PGPORT
-}
+import gasser_db
+import metadata_store
+import profiling
 
 #     id SERIAL PRIMARY KEY,
 
@@ -41,33 +20,237 @@ CREATE TABLE IF NOT EXISTS fuel_readings (
     lat     DOUBLE PRECISION,
     lng     DOUBLE PRECISION,
     location TEXT,
-    price_per_gal REAL
+    price_per_gal REAL,
+    fill_time TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# Declarative partitioning by year (identity columns on a partitioned table need PostgreSQL 17).
+# The partition key has to be part of the primary key and of every unique index.
+CREATE_PARTITIONED_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS fuel_readings (
+    id INT GENERATED BY DEFAULT AS IDENTITY,
+    odometer_file TEXT, 
+    trip_value  INTEGER,
+    total_mileage INTEGER,
+    gaspump_file TEXT,
+    dollars REAL,
+    gallons REAL,
+    mpg     REAL,
+    lat     DOUBLE PRECISION,
+    lng     DOUBLE PRECISION,
+    location TEXT,
+    price_per_gal REAL,
+    fill_time TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, fill_time)
+) PARTITION BY RANGE (fill_time);
+CREATE TABLE IF NOT EXISTS fuel_readings_default PARTITION OF fuel_readings DEFAULT;
+"""
+
+# Embedded backend (GASSER_DB_BACKEND=sqlite); fill_time is UTC ISO-8601 text
+SQLITE_CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS fuel_readings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    odometer_file TEXT,
+    trip_value  INTEGER,
+    total_mileage INTEGER,
+    gaspump_file TEXT,
+    dollars REAL,
+    gallons REAL,
+    mpg     REAL,
+    lat     REAL,
+    lng     REAL,
+    location TEXT,
+    price_per_gal REAL,
+    fill_time TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
 );
 """
 
-DROP_TABLE_SQL = "drop table fuel_readings" 
+CREATE_YEAR_PARTITION_SQL = """
+CREATE TABLE IF NOT EXISTS fuel_readings_{year} PARTITION OF fuel_readings
+    FOR VALUES FROM ('{year}-01-01') TO ('{next_year}-01-01');
+"""
+
+MIGRATE_SQL = """
+ALTER TABLE fuel_readings ADD COLUMN IF NOT EXISTS fill_time TIMESTAMPTZ;
+ALTER TABLE fuel_readings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+"""
+
+SQLITE_TABLE_INFO_SQL = "PRAGMA table_info(fuel_readings)"
+SQLITE_ADD_FILL_TIME_SQL = "ALTER TABLE fuel_readings ADD COLUMN fill_time TIMESTAMPTZ"
+# SQLite cannot add a column with a non-constant default; the insert trigger below stamps new rows
+SQLITE_ADD_UPDATED_AT_SQL = """
+ALTER TABLE fuel_readings ADD COLUMN updated_at TIMESTAMPTZ;
+UPDATE fuel_readings SET updated_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now');
+"""
+
+# updated_at moves on every change to a row (export_parquet.py rewrites only the years
+# with rows changed since its last export)
+TOUCH_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION fuel_readings_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END
+$$;
+DROP TRIGGER IF EXISTS fuel_readings_touch ON fuel_readings;
+CREATE TRIGGER fuel_readings_touch BEFORE UPDATE ON fuel_readings
+    FOR EACH ROW EXECUTE FUNCTION fuel_readings_touch();
+"""
+
+SQLITE_TOUCH_TRIGGER_SQL = """
+CREATE TRIGGER IF NOT EXISTS fuel_readings_touch_insert AFTER INSERT ON fuel_readings
+WHEN NEW.updated_at IS NULL
+BEGIN
+    UPDATE fuel_readings SET updated_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now') WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS fuel_readings_touch_update AFTER UPDATE ON fuel_readings
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE fuel_readings SET updated_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now') WHERE id = NEW.id;
+END;
+"""
+
+# One reading per odometer photo and per pump photo; bulk ingest relies on these for
+# ON CONFLICT dedup and read_update_metadata.py --all joins through them.
+# The seed row from write_firsttime_sql.py has no file names, so it is left out.
+# fill_time: B-tree for "latest readings" and MPG ordering, or BRIN (--brin) for a large
+# append-mostly history where a few pages of block ranges beat a full index.
+CREATE_INDEXES_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS fuel_readings_odometer_file_key
+    ON fuel_readings (odometer_file{key_suffix})
+    WHERE odometer_file NOT IN ('', 'not found');
+CREATE UNIQUE INDEX IF NOT EXISTS fuel_readings_gaspump_file_key
+    ON fuel_readings (gaspump_file{key_suffix})
+    WHERE gaspump_file NOT IN ('', 'not found');
+CREATE INDEX IF NOT EXISTS fuel_readings_fill_time_idx
+    ON fuel_readings {fill_time_using}(fill_time);
+"""
+
+# cascade: the fuel_stats.py materialized views depend on the table (re-create them afterwards)
+DROP_TABLE_SQL = "drop table if exists fuel_readings cascade"
+
+SQLITE_DROP_TABLE_SQL = "drop table if exists fuel_readings"
 
 CHECK_TABLE_SQL = "select * from fuel_readings"
 
-def main():
+# Re-running write_results_sql.py used to insert the same photos again; the unique file
+# indexes can only be built once those repeats are gone (the first reading of a photo stays)
+DELETE_DUPLICATE_FILES_SQL = """
+DELETE FROM fuel_readings
+WHERE {column} NOT IN ('', 'not found')
+  AND id NOT IN (SELECT MIN(id) FROM fuel_readings GROUP BY {column})
+RETURNING id, {column}
+"""
+
+MISSING_FILL_TIME_SQL = "SELECT id, odometer_file, gaspump_file FROM fuel_readings WHERE fill_time IS NULL"
+
+BACKFILL_FILL_TIME_SQL = """
+WITH v (id, fill_time) AS (VALUES %s)
+UPDATE fuel_readings SET fill_time = v.fill_time
+FROM v
+WHERE fuel_readings.id = v.id
+"""
+
+# Undated rows (and the seed row) sort before every real fill-up, like write_firsttime_sql.py's
+# seed row, so recompute_mpg sees the same order on PostgreSQL and SQLite
+MARK_UNDATED_SQL = "UPDATE fuel_readings SET fill_time = '-infinity' WHERE fill_time IS NULL"
+
+
+def backfill_fill_time(cur):
+    """
+    Fill in fill_time for rows written before the column existed (EXIF date, else file name date);
+    rows without a known date get -infinity.
+    """
+    cur.execute(MISSING_FILL_TIME_SQL)
+    rows = cur.fetchall()
+    store = metadata_store.open_store_if_exists()
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.autocommit = True
-    
-        with conn, conn.cursor() as cur:
-            cur.execute(DROP_TABLE_SQL)
-            cur.execute(CREATE_TABLE_SQL)
-            cur.execute(CHECK_TABLE_SQL)
-        print("Table fuel_readings")
-        
-    except psycopg2.Error as e:
-        print(f"PostgreSQL error: {e}")
-        sys.exit(1)
+        values = []
+        for id, odometer_file, gaspump_file in rows:
+            fill_time = metadata_store.fill_time_for([odometer_file, gaspump_file], store)
+            if fill_time:
+                values.append((id, fill_time))
     finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+        if store is not None:
+            store.close()
+    if values:
+        gasser_db.execute_values(cur, BACKFILL_FILL_TIME_SQL, values)
+    cur.execute(MARK_UNDATED_SQL)
+    return len(values), len(rows) - len(values)
+
+def delete_duplicate_files(cur):
+    """Delete every reading of an odometer / pump photo but the first. Returns the (id, file) deleted."""
+    deleted = []
+    for column in ("odometer_file", "gaspump_file"):
+        cur.execute(DELETE_DUPLICATE_FILES_SQL.format(column=column))
+        deleted += cur.fetchall()
+    return sorted(deleted)
+
+def migrate(cur):
+    if not gasser_db.SQLITE:
+        cur.execute(MIGRATE_SQL)
+        return
+    cur.execute(SQLITE_TABLE_INFO_SQL)
+    columns = [row[1] for row in cur.fetchall()]
+    if "fill_time" not in columns:
+        cur.execute(SQLITE_ADD_FILL_TIME_SQL)
+    if "updated_at" not in columns:
+        gasser_db.execute_script(cur, SQLITE_ADD_UPDATED_AT_SQL)
+
+def main():
+    ap = argparse.ArgumentParser(description="Create (drop and recreate) the fuel_readings table.")
+    ap.add_argument("--migrate", action="store_true",
+                    help="Keep the existing table and data; only add missing columns and indexes")
+    ap.add_argument("--partition-by-year", nargs=2, type=int, metavar=("FIRST", "LAST"),
+                    help="Create fuel_readings partitioned by fill_time, one partition per year")
+    ap.add_argument("--brin", action="store_true", help="Index fill_time with BRIN instead of B-tree")
+    args = ap.parse_args()
+
+    if args.migrate and args.partition_by_year:
+        raise SystemExit("ERROR: --partition-by-year creates a new table; it cannot be combined with --migrate")
+    if gasser_db.SQLITE and (args.partition_by_year or args.brin):
+        raise SystemExit("ERROR: --partition-by-year and --brin need PostgreSQL (GASSER_DB_BACKEND=postgres)")
+
+    if gasser_db.SQLITE:
+        fill_time_using = ""
+    else:
+        fill_time_using = "USING brin " if args.brin else "USING btree "
+    index_sql = CREATE_INDEXES_SQL.format(
+        key_suffix=", fill_time" if args.partition_by_year else "",
+        fill_time_using=fill_time_using,
+    )
+
+    with gasser_db.exit_on_db_error():
+        with gasser_db.transaction() as cur:
+            if not args.migrate:
+                cur.execute(SQLITE_DROP_TABLE_SQL if gasser_db.SQLITE else DROP_TABLE_SQL)
+            if gasser_db.SQLITE:
+                cur.execute(SQLITE_CREATE_TABLE_SQL)
+            elif args.partition_by_year:
+                first, last = args.partition_by_year
+                cur.execute(CREATE_PARTITIONED_TABLE_SQL)
+                for year in range(first, last + 1):
+                    cur.execute(CREATE_YEAR_PARTITION_SQL.format(year=year, next_year=year + 1))
+            else:
+                cur.execute(CREATE_TABLE_SQL)
+            if args.migrate:
+                migrate(cur)
+                duplicates = delete_duplicate_files(cur)
+                for id, file_name in duplicates:
+                    print(f"⚠️  Deleted reading {id}: {file_name} was already in an earlier reading")
+                if duplicates:
+                    print(f"{len(duplicates)} duplicate readings deleted; run compute_mpg.py --all afterwards")
+            gasser_db.execute_script(cur, index_sql)
+            gasser_db.execute_script(cur, SQLITE_TOUCH_TRIGGER_SQL if gasser_db.SQLITE else TOUCH_TRIGGER_SQL)
+            if args.migrate:
+                filled, unknown = backfill_fill_time(cur)
+                print(f"fill_time backfilled for {filled} readings ({unknown} without a known date, set to -infinity)")
+            cur.execute(CHECK_TABLE_SQL)
+        print("Table fuel_readings" + (" (migrated)" if args.migrate else ""))
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -1,23 +1,58 @@
 from PIL import Image
+import argparse
 import os
 
+import metrics
+import profiling
+
 input_folder = "attachments"
 output_folder = "images_thumbnails"
 
-os.makedirs(output_folder, exist_ok=True)
+THUMBNAIL_EXTENSIONS = (".jpg", ".png", ".tiff", ".bmp", ".webp")
+
+
+def create_thumbnail(src_path, dst_path):
+    """Write a quarter-size copy of one image. Returns (original size, thumbnail size)."""
+    with metrics.timer("thumbnail_seconds"), Image.open(src_path) as img:
+        # Make a copy so we don't modify the original object in place
+        img_copy = img.copy()
+
+        # Target size: original width/4, height/4
+        target_size = (img.width // 4, img.height // 4)
+
+        # This modifies the image in place, keeping aspect ratio
+        img_copy.thumbnail(target_size, Image.LANCZOS)
+
+        img_copy.save(dst_path)
+        return img.size, img_copy.size
+
+
+def create_thumbnails(input_folder=input_folder, output_folder=output_folder):
+    """Thumbnail every image in input_folder into output_folder. Returns the thumbnail paths."""
+    os.makedirs(output_folder, exist_ok=True)
+
+    written = []
+    for file in os.listdir(input_folder):
+        if file.lower().endswith(THUMBNAIL_EXTENSIONS):
+            dst_path = os.path.join(output_folder, file)
+            (w, h), (tw, th) = create_thumbnail(os.path.join(input_folder, file), dst_path)
+            written.append(dst_path)
+
+            print(f"{file}: original {w}x{h} → thumbnail {tw}x{th}")
+    return written
 
-for file in os.listdir(input_folder):
-    if file.lower().endswith((".jpg", ".png", ".tiff", ".bmp", ".webp")):
-        with Image.open(os.path.join(input_folder, file)) as img:
-            # Make a copy so we don't modify the original object in place
-            img_copy = img.copy()
 
-            # Target size: original width/4, height/4
-            target_size = (img.width // 4, img.height // 4)
+def main():
+    ap = argparse.ArgumentParser(description="Write a quarter-size thumbnail of every image in a folder.")
+    ap.add_argument("--input", default=input_folder, help=f"Folder of original images (default: {input_folder})")
+    ap.add_argument("--output", default=output_folder, help=f"Folder for the thumbnails (default: {output_folder})")
+    args = ap.parse_args()
 
-            # This modifies the image in place, keeping aspect ratio
-            img_copy.thumbnail(target_size, Image.LANCZOS)
+    if not os.path.isdir(args.input):
+        raise SystemExit(f"ERROR: Folder not found: {args.input}")
+    written = create_thumbnails(args.input, args.output)
+    print(f"{len(written)} thumbnail(s) in {args.output}")
 
-            img_copy.save(os.path.join(output_folder, file))
 
-        print(f"{file}: original {img.width}x{img.height} → thumbnail {img_copy.width}x{img_copy.height}")
+if __name__ == "__main__":
+    profiling.run(main)
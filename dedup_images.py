@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+dedup_images.py
+---------------
+Find near-duplicate photos (two or three shots of the same pump display, or a
+re-downloaded copy of the same picture) so that only one of them goes to the model.
+
+- Every image gets a 256-bit pHash (DCT of a 64x64 grayscale copy) and dHash
+  (gradient of a 17x16 copy), both with NumPy; 64 bits are too coarse to tell
+  two readings of the same display apart
+- Images are clustered by Hamming distance with a BK-tree: two images are
+  duplicates when their pHash is within --distance bits and their dHash agrees
+  too, so a similar-looking but different display (another odometer reading)
+  is not merged
+- The sharpest image of each cluster (variance of the Laplacian) is kept; the
+  others are moved to <folder>/duplicates/, which the runners do not read
+- pipeline.py runs this on the thumbnails as its dedup stage
+
+Usage:
+  python dedup_images.py --folder images_thumbnails --dry-run
+  python dedup_images.py --folder images_thumbnails --distance 8 --report dedup.json
+"""
+import argparse
+import json
+import math
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import metrics
+import profiling
+
+DEFAULT_FOLDER = "images_thumbnails"
+DUPLICATES_DIR = "duplicates"
+HASH_SIZE = 16                 # 16x16 = 256-bit hashes
+DEFAULT_DISTANCE = 24          # re-shots of one display are ~0-16 bits apart, other readings 50+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tiff", ".bmp", ".webp")
+SHARPNESS_SIZE = 1024          # longest side the sharpness is measured at, so sizes compare fairly
+
+
+class ImageHash(NamedTuple):
+    path: str
+    phash: int
+    dhash: int
+    sharpness: float
+
+
+########################
+# Hashes and sharpness
+
+def _gray(img: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    return np.asarray(img.convert("L").resize(size, Image.LANCZOS), dtype=np.float32)
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+def dhash(img: Image.Image, size: int = HASH_SIZE) -> int:
+    """Difference hash: is each pixel brighter than its left neighbour, on a (size+1) x size copy."""
+    g = _gray(img, (size + 1, size))
+    return _bits_to_int(g[:, 1:] > g[:, :-1])
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * math.sqrt(2 / n)
+    m[0] /= math.sqrt(2)
+    return m.astype(np.float32)
+
+_DCT = _dct_matrix(4 * HASH_SIZE)
+
+def phash(img: Image.Image) -> int:
+    """Perceptual hash: the 16x16 lowest DCT frequencies of a 64x64 copy against their median."""
+    n = 4 * HASH_SIZE
+    g = _gray(img, (n, n))
+    low = (_DCT @ g @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # the DC term is the average brightness, it would dominate the median
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Sharpness: variance of the 4-neighbour Laplacian; low for blurred or shaken photos."""
+    g = gray.astype(np.float32)
+    lap = g[1:-1, :-2] + g[1:-1, 2:] + g[:-2, 1:-1] + g[2:, 1:-1] - 4 * g[1:-1, 1:-1]
+    return float(lap.var())
+
+def sharpness_gray(img: Image.Image) -> np.ndarray:
+    """Grayscale copy with the longest side at most SHARPNESS_SIZE."""
+    gray = img.convert("L")
+    gray.thumbnail((SHARPNESS_SIZE, SHARPNESS_SIZE), Image.LANCZOS)
+    return np.asarray(gray, dtype=np.float32)
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def hash_image(path: str) -> ImageHash:
+    with metrics.timer("image_hash_seconds"), Image.open(path) as img:
+        img.load()
+        return ImageHash(path, phash(img), dhash(img), round(laplacian_variance(sharpness_gray(img)), 2))
+
+########################
+# Clustering
+
+class BKTree:
+    """Burkhard-Keller tree over integer keys for "everything within d" queries in a metric."""
+
+    def __init__(self, distance: Callable[[int, int], int] = hamming):
+        self.distance = distance
+        self.root: Optional[Tuple[int, Any, Dict[int, Any]]] = None
+
+    def add(self, key: int, value: Any) -> None:
+        if self.root is None:
+            self.root = (key, value, {})
+            return
+        node = self.root
+        while True:
+            d = self.distance(key, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = (key, value, {})
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, Any]]:
+        """(distance, value) of every entry within radius of key."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_key, value, children = stack.pop()
+            d = self.distance(key, node_key)
+            if d <= radius:
+                found.append((d, value))
+            # triangle inequality: only children at distance d-radius .. d+radius can match
+            stack.extend(child for cd, child in children.items() if d - radius <= cd <= d + radius)
+        return found
+
+def cluster(hashes: List[ImageHash], max_distance: int = DEFAULT_DISTANCE) -> List[List[ImageHash]]:
+    """Groups of near-duplicates, sharpest first; images without a duplicate are groups of one."""
+    parent = list(range(len(hashes)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        for _, j in tree.search(h.phash, max_distance):
+            if hamming(h.dhash, hashes[j].dhash) <= max_distance:
+                parent[find(i)] = find(j)
+        tree.add(h.phash, i)
+
+    groups: Dict[int, List[ImageHash]] = {}
+    for i, h in enumerate(hashes):
+        groups.setdefault(find(i), []).append(h)
+    return [sorted(g, key=lambda h: (-h.sharpness, h.path)) for g in groups.values()]
+
+def list_images(folder: str) -> List[str]:
+    return sorted(os.path.join(folder, n) for n in os.listdir(folder)
+                  if n.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(folder, n)))
+
+def dedup_folder(folder: str, max_distance: int = DEFAULT_DISTANCE,
+                 dry_run: bool = False) -> Tuple[List[str], List[List[ImageHash]]]:
+    """
+    Move all but the sharpest image of each near-duplicate group into folder/duplicates/.
+    Returns (the images left in folder, the groups that had duplicates).
+    """
+    groups = cluster([hash_image(p) for p in list_images(folder)], max_distance)
+    kept = sorted(g[0].path for g in groups)
+    dupes = [g for g in groups if len(g) > 1]
+    if dupes and not dry_run:
+        target = os.path.join(folder, DUPLICATES_DIR)
+        os.makedirs(target, exist_ok=True)
+        for g in dupes:
+            for h in g[1:]:
+                os.replace(h.path, os.path.join(target, os.path.basename(h.path)))
+    metrics.count("images_deduplicated_total", sum(len(g) - 1 for g in dupes))
+    return kept, dupes
+
+def report_groups(dupes: List[List[ImageHash]], dry_run: bool) -> None:
+    for g in dupes:
+        keep = g[0]
+        print(f"keep {os.path.basename(keep.path)} (sharpness {keep.sharpness:.0f})")
+        for h in g[1:]:
+            print(f"  {'would move' if dry_run else 'moved'} {os.path.basename(h.path)} "
+                  f"(pHash {hamming(keep.phash, h.phash)} / dHash {hamming(keep.dhash, h.dhash)} bits apart, "
+                  f"sharpness {h.sharpness:.0f})")
+
+def main():
+    ap = argparse.ArgumentParser(description="Move near-duplicate photos aside, keeping the sharpest of each group.")
+    ap.add_argument("--folder", default=DEFAULT_FOLDER, help=f"Folder of images (default: {DEFAULT_FOLDER})")
+    ap.add_argument("--distance", type=int, default=DEFAULT_DISTANCE,
+                    help=f"Most differing hash bits (of 256) for a duplicate (default: {DEFAULT_DISTANCE})")
+    ap.add_argument("--dry-run", action="store_true", help="Only show the groups, move nothing")
+    ap.add_argument("--report", default=None, metavar="JSON", help="Also write the groups as JSON")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.folder):
+        raise SystemExit(f"ERROR: Folder not found: {args.folder}")
+    kept, dupes = dedup_folder(args.folder, args.distance, args.dry_run)
+    report_groups(dupes, args.dry_run)
+    moved = sum(len(g) - 1 for g in dupes)
+    print(f"{len(kept)} distinct image(s), {moved} duplicate(s) "
+          f"{'found' if args.dry_run else 'moved to ' + os.path.join(args.folder, DUPLICATES_DIR)}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump([[h._asdict() for h in g] for g in dupes], f, indent=2)
+
+if __name__ == "__main__":
+    profiling.run(main)
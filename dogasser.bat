@@ -27,38 +27,19 @@ echo "Manually download the two images into ./attachments"
 rem python3 gasser.py
 
 
-echo "Extract Metadata from the Images  latitude longitude and location"
-
-python3 exif_to_json_and_csv.py --folder ./attachments --csv-out image_metadata_full.csv --json-out image_metadata_full.json
-
+echo "Extract Metadata, Create thumbnails, Analyze the cost and the images,"
+echo "Write the results to the database, compute the MPG and update the location"
+rem all of the steps run in one python process (pipeline.py); the results stay in memory
+rem --checkpoint also writes image_metadata_full.json/.csv and results_llm.json
+rem ChatGPT / OpenAI:  python3 pipeline.py run --runner chatgpt --model gpt-4o-mini
+rem the separate scripts still work one at a time, see README.md "Seperate Commands"
 
 rem echo "Fix the filenames if they do not have dates"
 rem echo "This will happen on a manual image download to ./attachments"
 rem echo "comment out if dates are not fixed"
 rem python3 fix_date_attachement_files.py image_metadata_full.json
 
-
-
-echo "Create thumbnails"
-python3 create_thumbnails.py
-
-echo "Analyze the cost using OpenAPI pricing"
-python3 image_cost_batch.py images_thumbnails prompt_file
-
-echo "Analyze the images"
-rem ChatGPT / OpenAI
-rem python run_vision_query_chatgpt.py  --dir images_thumbnails --model gpt-4o-mini
-rem Local LMstudio  Qwen2.5-VL-7B-Instruct-Q8_0 
-python3 run_vision_query_locally.py
-
-echo "Write the results to the database"
-python3  write_results_sql.py
-
-echo "Display the information and compute the MPG"
-python3  compute_mpg.py 
-
-echo "Update the Database with latitude longitude and location
-python3 read_update_metadata.py  image_metadata_full.json
+python3 pipeline.py run --store image_metadata.sqlite --checkpoint
 
 echo "Display the last 10 rows based on the id"
 view_table_10.bat
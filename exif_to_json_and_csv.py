@@ -3,43 +3,33 @@ import os
 import json
 import time
 import argparse
-import csv
+from contextlib import nullcontext
 from typing import Any, Dict, List, Optional
 
 # PyExifTool wrapper (pip name: PyExifTool)
 import exiftool
 import requests
 
+import metadata_store
+import metrics
+import profiling
+
 # ---- Default configuration ----
 DEFAULT_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".heic", ".png")
-DEFAULT_FIELDS = [
-    "File:FileName",
-    "EXIF:DateTimeOriginal",
-    "EXIF:Make",
-    "EXIF:Model",
-    "EXIF:LensModel",
-    "EXIF:ISO",
-    "EXIF:ShutterSpeedValue",
-    "EXIF:ApertureValue",
-    "EXIF:FocalLength",
-    "EXIF:ImageWidth",
-    "EXIF:ImageHeight",
-    "EXIF:GPSLongitudeRef",
-    "EXIF:GPSLatitudeRef",
-    "EXIF:GPSLatitude",
-    "EXIF:GPSLongitude",
-]
+DEFAULT_FIELDS = metadata_store.DEFAULT_FIELDS
 
 def reverse_geocode(lat: float, lon: float, user_agent_email: str, timeout: int = 10) -> str:
     url = "https://nominatim.openstreetmap.org/reverse"
     params = {"lat": lat, "lon": lon, "format": "json", "zoom": 10}
     headers = {"User-Agent": f"ExifLocationApp/1.0 ({user_agent_email})"}
     try:
-        r = requests.get(url, params=params, headers=headers, timeout=timeout)
+        with metrics.timer("geocode_seconds"):
+            r = requests.get(url, params=params, headers=headers, timeout=timeout)
         if r.status_code == 200:
             data = r.json()
             return data.get("display_name", "N/A")
         else:
+            metrics.count("geocode_errors_total", status=r.status_code)
             return f"N/A (HTTP {r.status_code})"
     except Exception as e:
         return f"N/A ({e})"
@@ -71,7 +61,8 @@ def read_exif_with_pyexiftool(et: exiftool.ExifTool, file_path: str) -> Dict[str
     Handles both bytes and str returns.
     """
     # -G keeps group (EXIF:..., File:...), -j outputs JSON, -n for numeric (no rational formatting)
-    raw = et.execute(b"-G", b"-j", b"-n", file_path.encode("utf-8"))
+    with metrics.timer("exiftool_seconds"):
+        raw = et.execute(b"-G", b"-j", b"-n", file_path.encode("utf-8"))
     if isinstance(raw, bytes):
         text = raw.decode("utf-8", errors="replace")
     else:
@@ -86,21 +77,94 @@ def read_exif_with_pyexiftool(et: exiftool.ExifTool, file_path: str) -> Dict[str
         arr2 = json.loads(text2)
         return arr2[0] if arr2 else {}
 
+def extract_record(et: exiftool.ExifTool, file_path: str, email: str, rate_sec: float, no_geo: bool) -> Dict[str, Any]:
+    data = read_exif_with_pyexiftool(et, file_path)
+
+    rec: Dict[str, Any] = {}
+    rec["FilePath"] = file_path
+
+    lat_ref = data.get("EXIF:GPSLatitudeRef") or data.get("GPSLatitudeRef")
+    lon_ref = data.get("EXIF:GPSLongitudeRef") or data.get("GPSLongitudeRef")
+    raw_lat = data.get("EXIF:GPSLatitude") or data.get("GPSLatitude")
+    raw_lon = data.get("EXIF:GPSLongitude") or data.get("GPSLongitude")
+
+    # Copy requested fields (prefer EXIF: prefix but accept bare tags too)
+    for tag in DEFAULT_FIELDS:
+        val = data.get(tag)
+        if val is None:
+            plain = tag.split(":", 1)[-1]
+            val = data.get(plain, "N/A")
+        rec[simplify_key(tag)] = val
+
+    # Fix lat/lon signs using refs
+    gps_lat = safe_float(raw_lat)
+    gps_lon = safe_float(raw_lon)
+    if gps_lat is not None and isinstance(lat_ref, str):
+        gps_lat = -abs(gps_lat) if lat_ref.strip().upper() == "S" else abs(gps_lat)
+    if gps_lon is not None and isinstance(lon_ref, str):
+        gps_lon = -abs(gps_lon) if lon_ref.strip().upper() == "W" else abs(gps_lon)
+
+    rec["GPSLatitudeFixed"] = gps_lat if gps_lat is not None else None
+    rec["GPSLongitudeFixed"] = gps_lon if gps_lon is not None else None
+
+    # Reverse geocode if enabled and coords exist
+    if (not no_geo) and (gps_lat is not None) and (gps_lon is not None):
+        rec["Location"] = reverse_geocode(gps_lat, gps_lon, email)
+        time.sleep(max(rate_sec, 0))
+    else:
+        rec["Location"] = "No GPS data"
+
+    return rec
+
+def update_store(store, files: List[str], email: str, rate_sec: float, no_geo: bool,
+                 force: bool = False, verbose: bool = False, et: Optional[exiftool.ExifTool] = None) -> List[str]:
+    """
+    Extract the new or changed files (by size + mtime) into the store. Returns their paths.
+    A long-running caller can pass its own running ExifTool instead of starting one per call.
+    """
+    # Only new or changed images go through exiftool / geocoding
+    known = {} if force else metadata_store.load_signatures(store)
+    pending = []
+    for file_path in files:
+        sig = metadata_store.file_signature(file_path)
+        if known.get(metadata_store.store_key(file_path)) != sig:
+            pending.append((file_path, sig))
+
+    if verbose:
+        print(f"{len(pending)} new or changed, {len(files) - len(pending)} unchanged")
+
+    if pending:
+        with (nullcontext(et) if et is not None else exiftool.ExifTool()) as et:
+            for file_path, sig in pending:
+                rec = extract_record(et, file_path, email, rate_sec, no_geo)
+                metadata_store.put_record(store, file_path, sig, rec)
+                # Commit per image so an interrupted run keeps what it already paid for
+                store.commit()
+
+                if verbose:
+                    print(f"Processed: {os.path.basename(file_path)}")
+
+    return [file_path for file_path, _ in pending]
+
 def main():
     ap = argparse.ArgumentParser(description="Extract image EXIF to JSON+CSV with fixed lat/lng + reverse geocoding (PyExifTool .execute).")
     ap.add_argument("--folder", default="./attachments", help="Folder containing images")
+    ap.add_argument("--store", default=metadata_store.DEFAULT_STORE, help="Incremental SQLite metadata store")
     ap.add_argument("--json-out", default="image_metadata_full.json", help="Output JSON file")
     ap.add_argument("--csv-out", default="image_metadata_full.csv", help="Output CSV file")
     ap.add_argument("--jsonl", default=None, help="Optional JSON Lines file (one JSON object per line)")
     ap.add_argument("--email", default="your_email@example.com", help="Contact email for Nominatim User-Agent")
     ap.add_argument("--rate-sec", type=float, default=1.0, help="Delay between reverse geocode calls (seconds)")
     ap.add_argument("--no-geo", action="store_true", help="Skip reverse geocoding (still fixes lat/lng)")
+    ap.add_argument("--force", action="store_true", help="Re-extract every image even if unchanged")
+    ap.add_argument("--no-export", action="store_true", help="Only update the store; do not write JSON/CSV")
     ap.add_argument("--verbose", "-v", action="store_true", help="Print extra info")
     args = ap.parse_args()
 
     if args.verbose:
         print(f"Working dir: {os.getcwd()}")
         print(f"Folder: {os.path.abspath(args.folder)}")
+        print(f"Store:       {os.path.abspath(args.store)}")
         print(f"JSON output: {os.path.abspath(args.json_out)}")
         print(f"CSV output:  {os.path.abspath(args.csv_out)}")
         if args.jsonl:
@@ -118,81 +182,34 @@ def main():
         if len(files) > 10:
             print(f"  ...and {len(files)-10} more")
 
-    records: List[Dict[str, Any]] = []
-    jsonl_fp = open(args.jsonl, "w", encoding="utf-8") if args.jsonl else None
-
+    store = metadata_store.open_store(args.store)
     try:
-        with exiftool.ExifTool() as et, open(args.csv_out, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-            header = [simplify_key(tag) for tag in DEFAULT_FIELDS] + ["GPSLatitudeFixed", "GPSLongitudeFixed", "Location", "FilePath"]
-            writer.writerow(header)
-
-            for file_path in files:
-                data = read_exif_with_pyexiftool(et, file_path)
-
-                rec: Dict[str, Any] = {}
-                rec["FilePath"] = file_path
-
-                lat_ref = data.get("EXIF:GPSLatitudeRef") or data.get("GPSLatitudeRef")
-                lon_ref = data.get("EXIF:GPSLongitudeRef") or data.get("GPSLongitudeRef")
-                raw_lat = data.get("EXIF:GPSLatitude") or data.get("GPSLatitude")
-                raw_lon = data.get("EXIF:GPSLongitude") or data.get("GPSLongitude")
-
-                # Copy requested fields (prefer EXIF: prefix but accept bare tags too)
-                for tag in DEFAULT_FIELDS:
-                    val = data.get(tag)
-                    if val is None:
-                        plain = tag.split(":", 1)[-1]
-                        val = data.get(plain, "N/A")
-                    rec[simplify_key(tag)] = val
-
-                # Fix lat/lon signs using refs
-                gps_lat = safe_float(raw_lat)
-                gps_lon = safe_float(raw_lon)
-                if gps_lat is not None and isinstance(lat_ref, str):
-                    gps_lat = -abs(gps_lat) if lat_ref.strip().upper() == "S" else abs(gps_lat)
-                if gps_lon is not None and isinstance(lon_ref, str):
-                    gps_lon = -abs(gps_lon) if lon_ref.strip().upper() == "W" else abs(gps_lon)
-
-                rec["GPSLatitudeFixed"] = gps_lat if gps_lat is not None else None
-                rec["GPSLongitudeFixed"] = gps_lon if gps_lon is not None else None
-
-                # Reverse geocode if enabled and coords exist
-                if (not args.no_geo) and (gps_lat is not None) and (gps_lon is not None):
-                    rec["Location"] = reverse_geocode(gps_lat, gps_lon, args.email)
-                    time.sleep(max(args.rate_sec, 0))
-                else:
-                    rec["Location"] = "No GPS data"
-
-                # CSV row
-                writer.writerow([rec[simplify_key(tag)] for tag in DEFAULT_FIELDS] +
-                                [rec["GPSLatitudeFixed"], rec["GPSLongitudeFixed"], rec["Location"], rec["FilePath"]])
-
-                # JSON aggregate
-                records.append(rec)
-
-                # Optional JSONL
-                if jsonl_fp:
-                    jsonl_fp.write(json.dumps(rec, ensure_ascii=False) + "\n")
-
-                if args.verbose:
-                    print(f"Processed: {os.path.basename(file_path)}")
-
+        pending = update_store(store, files, args.email, args.rate_sec, args.no_geo, args.force, args.verbose)
+        # Images removed from the folder must not linger in the exports
+        pruned = metadata_store.prune_missing(store)
+        if pruned:
+            print(f"Removed {pruned} entries whose image file no longer exists")
+
+        outputs = [args.json_out, args.csv_out] + ([args.jsonl] if args.jsonl else [])
+        exported = None
+        if not args.no_export and (pending or pruned or not all(os.path.exists(p) for p in outputs)):
+            exported = metadata_store.export_json(store, args.json_out)
+            metadata_store.export_csv(store, args.csv_out)
+            if args.jsonl:
+                metadata_store.export_jsonl(store, args.jsonl)
     finally:
-        if jsonl_fp:
-            jsonl_fp.close()
-
-    # Save JSON atomically
-    tmp_path = args.json_out + ".tmp"
-    with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(records, f, indent=2, ensure_ascii=False)
-    os.replace(tmp_path, args.json_out)
+        store.close()
 
-    print(f"\n✅ Done. Saved {len(records)} records to:")
+    print(f"\n✅ Done. Extracted {len(pending)} new/changed images into {args.store}")
+    if exported is None:
+        if not args.no_export:
+            print("   Exports are up to date.")
+        return
+    print(f"   Saved {exported} records to:")
     print(f"   JSON: {args.json_out}")
     print(f"   CSV:  {args.csv_out}")
     if args.jsonl:
         print(f"   JSONL: {args.jsonl}")
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+export_parquet.py
+-----------------
+Columnar export of the image metadata and the fuel_readings table to Parquet.
+
+- Typed columns: timestamps, float64 lat/lng, decimal dollars/gallons
+- Hive-style partitions by year (<out>/fuel_readings/year=2025/...)
+- Incremental: only the year partitions whose rows were added, changed or
+  removed since the last export are rewritten; --full rebuilds a dataset from scratch
+- fuel_readings: one GROUP BY query compares each year's row count and newest
+  updated_at with the watermark saved by the last export (_export_state.json);
+  only the changed years are fetched
+- Metadata: each year's rows are hashed and compared with the hashes saved by
+  the last export; the Parquet files are never read back
+
+Usage:
+  python export_parquet.py --out parquet
+  python export_parquet.py --out parquet --only readings --full
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import gasser_db
+import metadata_store
+import profiling
+
+DEFAULT_OUT = "parquet"
+
+METADATA_SCHEMA = pa.schema([
+    ("file_name", pa.string()),
+    ("file_path", pa.string()),
+    ("taken_at", pa.timestamp("s", tz="UTC")),
+    ("make", pa.string()),
+    ("model", pa.string()),
+    ("lens_model", pa.string()),
+    ("iso", pa.int32()),
+    ("shutter_speed", pa.float64()),
+    ("aperture", pa.float64()),
+    ("focal_length", pa.float64()),
+    ("lat", pa.float64()),
+    ("lng", pa.float64()),
+    ("location", pa.string()),
+    ("year", pa.int16()),
+])
+
+READINGS_SCHEMA = pa.schema([
+    ("id", pa.int32()),
+    ("fill_time", pa.timestamp("s", tz="UTC")),
+    ("odometer_file", pa.string()),
+    ("trip_value", pa.int32()),
+    ("total_mileage", pa.int32()),
+    ("gaspump_file", pa.string()),
+    ("dollars", pa.decimal128(10, 2)),
+    ("gallons", pa.decimal128(10, 3)),
+    ("mpg", pa.float64()),
+    ("price_per_gal", pa.float64()),
+    ("lat", pa.float64()),
+    ("lng", pa.float64()),
+    ("location", pa.string()),
+    ("year", pa.int16()),
+])
+
+STATE_FILE = "_export_state.json"  # pyarrow skips _-prefixed files when it reads the dataset
+
+READINGS_QUERY = """
+SELECT id, odometer_file, trip_value, total_mileage, gaspump_file,
+       dollars, gallons, mpg, price_per_gal, lat, lng, location, fill_time
+FROM fuel_readings
+WHERE {where}
+ORDER BY id
+"""
+
+# UTC year of fill_time; NULL for undated rows (-infinity), which go to the default partition
+if gasser_db.SQLITE:
+    YEAR_SQL = "CASE WHEN fill_time GLOB '[0-9][0-9][0-9][0-9]-*' THEN CAST(substr(fill_time, 1, 4) AS INTEGER) END"
+else:
+    YEAR_SQL = "CASE WHEN isfinite(fill_time) THEN EXTRACT(YEAR FROM fill_time AT TIME ZONE 'UTC')::int END"
+
+YEAR_STATS_SQL = f"SELECT {YEAR_SQL}, COUNT(*), MAX(updated_at) FROM fuel_readings GROUP BY 1"
+
+
+def as_float(val: Any) -> Optional[float]:
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+def as_int(val: Any) -> Optional[int]:
+    f = as_float(val)
+    return int(f) if f is not None else None
+
+def as_text(val: Any) -> Optional[str]:
+    return None if val in (None, "N/A") else str(val)
+
+def as_decimal(val: Any, places: int) -> Optional[Decimal]:
+    f = as_float(val)
+    return Decimal(f"{f:.{places}f}") if f is not None else None
+
+def year_of(ts: Optional[datetime]) -> Optional[int]:
+    if ts is None:
+        return None
+    return ts.astimezone(timezone.utc).year if ts.tzinfo else ts.year
+
+def partition_dir(year: Optional[int]) -> str:
+    return f"year={year if year is not None else '__HIVE_DEFAULT_PARTITION__'}"
+
+def rows_by_year(table: pa.Table, key: str) -> Dict[Optional[int], List[Dict[str, Any]]]:
+    years: Dict[Optional[int], List[Dict[str, Any]]] = {}
+    for row in table.to_pylist():
+        years.setdefault(row["year"], []).append(row)
+    for rows in years.values():
+        rows.sort(key=lambda row: str(row[key]))
+    return years
+
+def load_state(path: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_state(path: str, state: Dict[str, Any]) -> None:
+    os.makedirs(path, exist_ok=True)
+    state_path = os.path.join(path, STATE_FILE)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+def year_key(year: Optional[int]) -> str:
+    # JSON object keys are strings
+    return str(year) if year is not None else "null"
+
+def write_partitioned(table: pa.Table, path: str) -> None:
+    # A unique basename per run keeps the new files apart from any left
+    # behind in the year=YYYY directories that were not rewritten.
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=["year"],
+        partitioning_flavor="hive",
+        basename_template=f"part-{time.strftime('%Y%m%dT%H%M%S')}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+def rewrite_year(path: str, year: Optional[int], table: Optional[pa.Table]) -> int:
+    """Replace one year partition with table (None or empty: the year is gone). Returns rows written."""
+    shutil.rmtree(os.path.join(path, partition_dir(year)), ignore_errors=True)
+    if table is None or table.num_rows == 0:
+        return 0
+    write_partitioned(table, path)
+    return table.num_rows
+
+########################
+def metadata_rows(records: List[Dict[str, Any]]) -> Dict[str, list]:
+    cols: Dict[str, list] = {name: [] for name in METADATA_SCHEMA.names}
+    for rec in records:
+        file_path = rec.get("FilePath")
+        file_name = rec.get("FileName") or os.path.basename(file_path or "")
+        taken_at = (metadata_store.exif_datetime(rec.get("DateTimeOriginal"))
+                    or metadata_store.filename_datetime(file_name))
+        cols["file_name"].append(file_name)
+        cols["file_path"].append(file_path)
+        cols["taken_at"].append(taken_at)
+        cols["make"].append(as_text(rec.get("Make")))
+        cols["model"].append(as_text(rec.get("Model")))
+        cols["lens_model"].append(as_text(rec.get("LensModel")))
+        cols["iso"].append(as_int(rec.get("ISO")))
+        cols["shutter_speed"].append(as_float(rec.get("ShutterSpeedValue")))
+        cols["aperture"].append(as_float(rec.get("ApertureValue")))
+        cols["focal_length"].append(as_float(rec.get("FocalLength")))
+        cols["lat"].append(as_float(rec.get("GPSLatitudeFixed")))
+        cols["lng"].append(as_float(rec.get("GPSLongitudeFixed")))
+        cols["location"].append(as_text(rec.get("Location")))
+        cols["year"].append(year_of(taken_at))
+    return cols
+
+def load_metadata_records(source: str) -> List[Dict[str, Any]]:
+    if source.lower().endswith((".sqlite", ".db")):
+        store = metadata_store.open_store(source)
+        try:
+            return list(metadata_store.iter_records(store))
+        finally:
+            store.close()
+    with open(source, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def year_digest(rows: List[Dict[str, Any]]) -> str:
+    return hashlib.sha1(json.dumps(rows, default=str, sort_keys=True).encode("utf-8")).hexdigest()
+
+def export_metadata(source: str, out_dir: str) -> int:
+    """Rewrite the year partitions whose rows hash differently from the last export. Returns rows written."""
+    path = os.path.join(out_dir, "image_metadata_full")
+    cols = metadata_rows(load_metadata_records(source))
+    new = rows_by_year(pa.Table.from_pydict(cols, schema=METADATA_SCHEMA), "file_path")
+    digests = {year_key(year): year_digest(rows) for year, rows in new.items()}
+    old_digests = load_state(path).get("digests", {})
+
+    written = 0
+    for key in set(old_digests) | set(digests):
+        if old_digests.get(key) == digests.get(key):
+            continue
+        year = None if key == "null" else int(key)
+        rows = new.get(year)
+        table = pa.Table.from_pylist(rows, schema=METADATA_SCHEMA) if rows else None
+        written += rewrite_year(path, year, table)
+    save_state(path, {"digests": digests})
+    return written
+
+########################
+def as_datetime(val: Any) -> Optional[datetime]:
+    # MAX() over a SQLite TIMESTAMPTZ column comes back as text
+    return datetime.fromisoformat(val) if isinstance(val, str) else val
+
+def year_stats(cur) -> Dict[str, Tuple[int, Optional[datetime]]]:
+    """Row count and newest updated_at per year_key(), in one aggregate query."""
+    cur.execute(YEAR_STATS_SQL)
+    return {year_key(as_int(year)): (count, as_datetime(updated_at)) for year, count, updated_at in cur.fetchall()}
+
+def fetch_year(cur, year: Optional[int]) -> List[tuple]:
+    if year is None:
+        cur.execute(READINGS_QUERY.format(where=f"{YEAR_SQL} IS NULL"))
+    else:
+        cur.execute(READINGS_QUERY.format(where="fill_time >= %s AND fill_time < %s"),
+                    (datetime(year, 1, 1, tzinfo=timezone.utc), datetime(year + 1, 1, 1, tzinfo=timezone.utc)))
+    return cur.fetchall()
+
+def readings_rows(rows: List[tuple]) -> Dict[str, list]:
+    cols: Dict[str, list] = {name: [] for name in READINGS_SCHEMA.names}
+    for (id, odometer_file, trip_value, total_mileage, gaspump_file,
+         dollars, gallons, mpg, price_per_gal, lat, lng, location, fill_time) in rows:
+        if fill_time is not None and fill_time.year in (datetime.min.year, datetime.max.year):
+            fill_time = None  # -infinity (the seed row from write_firsttime_sql.py)
+        cols["id"].append(id)
+        cols["fill_time"].append(fill_time)
+        cols["odometer_file"].append(odometer_file)
+        cols["trip_value"].append(trip_value)
+        cols["total_mileage"].append(total_mileage)
+        cols["gaspump_file"].append(gaspump_file)
+        cols["dollars"].append(as_decimal(dollars, 2))
+        cols["gallons"].append(as_decimal(gallons, 3))
+        cols["mpg"].append(as_float(mpg))
+        cols["price_per_gal"].append(as_float(price_per_gal))
+        cols["lat"].append(as_float(lat))
+        cols["lng"].append(as_float(lng))
+        cols["location"].append(location)
+        cols["year"].append(year_of(fill_time))
+    return cols
+
+def export_readings(out_dir: str) -> int:
+    """
+    Rewrite the year partitions with rows changed since the last export's watermark,
+    or whose row count changed (deleted rows). Returns rows written.
+    """
+    path = os.path.join(out_dir, "fuel_readings")
+    state = load_state(path)
+    watermark = as_datetime(state.get("updated_at"))
+    old_rows = state.get("rows", {})
+
+    written = 0
+    with gasser_db.transaction() as cur:
+        stats = year_stats(cur)
+        for key in set(old_rows) | set(stats):
+            count, updated_at = stats.get(key, (0, None))
+            changed = watermark is None or (updated_at is not None and updated_at > watermark)
+            if old_rows.get(key) == count and not changed:
+                continue
+            year = None if key == "null" else int(key)
+            rows = fetch_year(cur, year) if count else []
+            table = pa.Table.from_pydict(readings_rows(rows), schema=READINGS_SCHEMA) if rows else None
+            written += rewrite_year(path, year, table)
+
+    newest = max((updated_at for _, updated_at in stats.values() if updated_at is not None), default=watermark)
+    save_state(path, {
+        "updated_at": newest.isoformat() if newest else None,
+        "rows": {key: count for key, (count, _) in stats.items()},
+    })
+    return written
+
+def main():
+    ap = argparse.ArgumentParser(description="Export image metadata and fuel_readings to partitioned Parquet.")
+    ap.add_argument("--out", default=DEFAULT_OUT, help=f"Output directory (default: {DEFAULT_OUT})")
+    ap.add_argument("--metadata", default=None,
+                    help="Metadata source: the SQLite store or image_metadata_full.json (default: store if present)")
+    ap.add_argument("--only", choices=["metadata", "readings"], default=None, help="Export just one dataset")
+    ap.add_argument("--full", action="store_true", help="Delete and rebuild the dataset(s) instead of syncing changed years")
+    args = ap.parse_args()
+
+    source = args.metadata
+    if source is None:
+        source = metadata_store.DEFAULT_STORE if os.path.exists(metadata_store.DEFAULT_STORE) else "image_metadata_full.json"
+
+    os.makedirs(args.out, exist_ok=True)
+
+    if args.only in (None, "metadata"):
+        if args.full:
+            shutil.rmtree(os.path.join(args.out, "image_metadata_full"), ignore_errors=True)
+        n = export_metadata(source, args.out)
+        print(f"image_metadata_full: rewrote {n} rows in changed years from {source}")
+
+    if args.only in (None, "readings"):
+        if args.full:
+            shutil.rmtree(os.path.join(args.out, "fuel_readings"), ignore_errors=True)
+        with gasser_db.exit_on_db_error():
+            n = export_readings(args.out)
+        print(f"fuel_readings:       rewrote {n} rows in changed years")
+
+    print(f"\nParquet datasets in {os.path.abspath(args.out)}")
+
+if __name__ == "__main__":
+    profiling.run(main)
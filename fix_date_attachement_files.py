@@ -3,6 +3,8 @@ import sys
 import os.path
 import os 
 
+import profiling
+
 
 def main():
     # Default file name
@@ -43,4 +45,4 @@ def main():
         print(f"Error: Failed to parse JSON - {e}")
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
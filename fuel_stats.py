@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+fuel_stats.py
+-------------
+Precomputed fuel statistics as materialized views over fuel_readings.
+
+- fuel_stats_monthly:   fill-ups, miles, gallons, dollars, MPG and cost per mile per month
+- fuel_stats_locations: price per gallon (avg/min/max) and fill-ups per location
+- fuel_stats_rolling:   per fill-up MPG, price per gallon and cost per mile with
+                        rolling averages over the last ROLLING_FILLUPS fill-ups
+
+Each view has a unique index, so refresh_stats() can REFRESH ... CONCURRENTLY
+(readers are never blocked). The ingest scripts call it after they write.
+
+Usage:
+  python fuel_stats.py create
+  python fuel_stats.py refresh
+  python fuel_stats.py monthly [--limit 12]
+  python fuel_stats.py locations
+  python fuel_stats.py rolling [--limit 10]
+"""
+import argparse
+
+import gasser_db
+import profiling
+
+ROLLING_FILLUPS = 5
+
+# Every fill-up with the miles driven since the previous one (the seed row and
+# fill-ups without gallons drop out here).
+# Same order as compute_mpg.py, so miles and MPG here match the stored mpg.
+TRIPS_SQL = f"""
+SELECT id, fill_time, location, dollars, gallons, price_per_gal, mpg,
+       total_mileage - LAG(total_mileage) OVER (ORDER BY {gasser_db.FILL_ORDER}) AS miles
+FROM fuel_readings
+"""
+
+CREATE_VIEWS_SQL = f"""
+CREATE MATERIALIZED VIEW IF NOT EXISTS fuel_stats_monthly AS
+SELECT date_trunc('month', fill_time) AS month,
+       COUNT(*)                                      AS fill_ups,
+       SUM(miles)                                    AS miles,
+       ROUND(SUM(gallons)::numeric, 3)               AS gallons,
+       ROUND(SUM(dollars)::numeric, 2)               AS dollars,
+       ROUND((SUM(miles) / SUM(gallons))::numeric, 2) AS mpg,
+       ROUND((SUM(dollars) / NULLIF(SUM(miles), 0))::numeric, 3) AS cost_per_mile,
+       ROUND((SUM(dollars) / SUM(gallons))::numeric, 3) AS price_per_gal
+FROM ({TRIPS_SQL}) t
+WHERE gallons > 0 AND miles IS NOT NULL AND isfinite(fill_time)
+GROUP BY 1;
+CREATE UNIQUE INDEX IF NOT EXISTS fuel_stats_monthly_key ON fuel_stats_monthly (month);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS fuel_stats_locations AS
+SELECT COALESCE(location, 'unknown')               AS location,
+       COUNT(*)                                    AS fill_ups,
+       ROUND(AVG(dollars / gallons)::numeric, 3)   AS avg_price_per_gal,
+       ROUND(MIN(dollars / gallons)::numeric, 3)   AS min_price_per_gal,
+       ROUND(MAX(dollars / gallons)::numeric, 3)   AS max_price_per_gal,
+       MAX(fill_time)                              AS last_fill
+FROM fuel_readings
+WHERE gallons > 0
+GROUP BY 1;
+CREATE UNIQUE INDEX IF NOT EXISTS fuel_stats_locations_key ON fuel_stats_locations (location);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS fuel_stats_rolling AS
+SELECT id, fill_time, miles,
+       ROUND((miles / gallons)::numeric, 2)              AS mpg,
+       ROUND((dollars / gallons)::numeric, 3)            AS price_per_gal,
+       ROUND((dollars / NULLIF(miles, 0))::numeric, 3)   AS cost_per_mile,
+       ROUND((AVG(miles / gallons) OVER w)::numeric, 2)   AS mpg_rolling,
+       ROUND((AVG(dollars / gallons) OVER w)::numeric, 3) AS price_per_gal_rolling,
+       ROUND((SUM(dollars) OVER w / NULLIF(SUM(miles) OVER w, 0))::numeric, 3) AS cost_per_mile_rolling
+FROM ({TRIPS_SQL}) t
+WHERE gallons > 0 AND miles IS NOT NULL
+WINDOW w AS (ORDER BY {gasser_db.FILL_ORDER} ROWS BETWEEN {ROLLING_FILLUPS - 1} PRECEDING AND CURRENT ROW);
+CREATE UNIQUE INDEX IF NOT EXISTS fuel_stats_rolling_key ON fuel_stats_rolling (id);
+"""
+
+VIEWS = ("fuel_stats_monthly", "fuel_stats_locations", "fuel_stats_rolling")
+
+EXISTING_VIEWS_SQL = "SELECT matviewname, ispopulated FROM pg_matviews WHERE matviewname = ANY(%s)"
+
+REPORTS = {
+    "monthly":   "SELECT * FROM fuel_stats_monthly ORDER BY month DESC LIMIT %s",
+    "locations": "SELECT * FROM fuel_stats_locations ORDER BY fill_ups DESC, location LIMIT %s",
+    "rolling":   "SELECT * FROM fuel_stats_rolling ORDER BY fill_time DESC NULLS LAST, id DESC LIMIT %s",
+}
+
+
+########################
+def create_stats():
+    with gasser_db.transaction() as cur:
+        cur.execute(CREATE_VIEWS_SQL)
+
+def refresh_stats():
+    """Refresh whichever stats views exist (concurrently once populated). Returns their names."""
+    if gasser_db.SQLITE:
+        # materialized views are PostgreSQL-only
+        return []
+    with gasser_db.transaction() as cur:
+        cur.execute(EXISTING_VIEWS_SQL, (list(VIEWS),))
+        existing = cur.fetchall()
+        for name, populated in existing:
+            concurrently = "CONCURRENTLY " if populated else ""
+            cur.execute(f"REFRESH MATERIALIZED VIEW {concurrently}{name}")
+    return [name for name, _ in existing]
+
+def query_stats(report, limit):
+    with gasser_db.transaction() as cur:
+        cur.execute(REPORTS[report], (limit,))
+        columns = [d[0] for d in cur.description]
+        return columns, cur.fetchall()
+
+def print_table(columns, rows):
+    cells = [[("" if v is None else str(v)) for v in row] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+########################
+def main():
+    ap = argparse.ArgumentParser(description="Create, refresh and query the fuel statistics views.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("create", help="Create the materialized views and their indexes")
+    sub.add_parser("refresh", help="Refresh the views (CONCURRENTLY)")
+    for report in REPORTS:
+        rp = sub.add_parser(report, help=f"Show fuel_stats_{report}")
+        rp.add_argument("--limit", type=int, default=12, help="Rows to show (default: 12)")
+    args = ap.parse_args()
+
+    if gasser_db.SQLITE:
+        raise SystemExit("ERROR: the statistics views need PostgreSQL (GASSER_DB_BACKEND=postgres)")
+
+    with gasser_db.exit_on_db_error():
+        if args.command == "create":
+            create_stats()
+            print("Created " + ", ".join(VIEWS))
+        elif args.command == "refresh":
+            refreshed = refresh_stats()
+            print("Refreshed " + (", ".join(refreshed) if refreshed else "nothing (run: fuel_stats.py create)"))
+        else:
+            print_table(*query_stats(args.command, args.limit))
+
+if __name__ == "__main__":
+    profiling.run(main)
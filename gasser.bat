@@ -0,0 +1,3 @@
+@echo off
+rem gasser <command> [args]; "gasser --help" lists the commands (gasser_cli.py)
+python3 "%~dp0gasser_cli.py" %*
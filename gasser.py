@@ -7,6 +7,8 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+import profiling
+
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 DOWNLOAD_DIR = "attachments"
 
@@ -121,4 +123,4 @@ def main():
         print(f"An error occurred: {error}")
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
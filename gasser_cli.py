@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+gasser_cli.py
+-------------
+One `gasser` command in front of all of the scripts, with a fast start.
+
+- `gasser <command> [args]` runs that script's main() with args, exactly as
+  `python <script>.py [args]` would (--help, --profile and --metrics-* included)
+- Nothing is imported until a command is chosen, and then only that command's
+  module: `gasser last` never loads openai, PIL, exiftool or the Google client
+- `gasser last` shows the latest readings (like view_table_10.bat, on either
+  database backend) and starts in well under 100 ms
+- benchmarks/import_times.py measures the start-up and import time of every command
+
+gasser.bat calls this file; on Linux / macOS: alias gasser="python3 /path/to/gasser_cli.py"
+
+Usage:
+  gasser --help
+  gasser last
+  gasser last -n 25
+  gasser pipeline run --runner chatgpt --model gpt-4o-mini
+  gasser ledger report --by day
+"""
+import argparse
+import importlib
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import profiling
+
+# command: (module, function, help); the module is imported only when its command runs
+COMMANDS: Dict[str, Tuple[str, str, str]] = {
+    "fetch":        ("gasser", "main", "download the odometer / pump photos from Gmail"),
+    "fix-dates":    ("fix_date_attachement_files", "main", "add the date to manually downloaded file names"),
+    "exif":         ("exif_to_json_and_csv", "main", "extract EXIF metadata and geocode the photos"),
+    "read-exif":    ("read_images_exif", "main", "print the EXIF metadata of a folder"),
+    "pair":         ("pair_images", "main", "pair odometer and pump photos by time and place"),
+    "thumbnails":   ("create_thumbnails", "main", "make the thumbnails the models read"),
+    "dedup":        ("dedup_images", "main", "set near-duplicate photos aside, keeping the sharpest"),
+    "quality":      ("image_quality", "main", "set aside photos too blurred, dark or glary to read"),
+    "ocr":          ("seven_segment_ocr", "main", "read pump displays locally, without the model"),
+    "dimensions":   ("check_picture_dimentions", "main", "print the size of every photo"),
+    "cost":         ("image_cost_batch", "main", "estimate the OpenAI cost of a folder of images"),
+    "analyze":      ("run_vision_query_locally", "main", "read the gauges with the local LM Studio model"),
+    "analyze-chatgpt": ("run_vision_query_chatgpt", "main", "read the gauges with the OpenAI API"),
+    "results":      ("read_results", "main", "print results_llm.json"),
+    "write":        ("write_results_sql", "main", "write results_llm.json to fuel_readings"),
+    "ingest":       ("bulk_ingest_results", "main", "bulk load many results files"),
+    "mpg":          ("compute_mpg", "main", "compute MPG for the readings"),
+    "location":     ("read_update_metadata", "main", "set the location of the readings"),
+    "stats":        ("fuel_stats", "main", "refresh and print the fuel statistics"),
+    "pipeline":     ("pipeline", "main", "run all of the steps in one process"),
+    "stream":       ("stream_pipeline", "main", "stream fill-ups through the steps concurrently"),
+    "watch":        ("watch_daemon", "main", "process new photos as they arrive"),
+    "jobs":         ("job_queue", "main", "enqueue / work the fill-up job queue"),
+    "create-table": ("create_gasser_table", "main", "create or migrate the fuel_readings table"),
+    "first-row":    ("write_firsttime_sql", "main", "write the starting mileage row"),
+    "store":        ("metadata_store", "main", "inspect the image metadata store"),
+    "export":       ("export_parquet", "main", "export the readings to Parquet"),
+    "ledger":       ("llm_ledger", "main", "token usage, latency and cost of the model calls"),
+    "metrics":      ("metrics", "main", "print a saved metrics summary"),
+}
+
+LAST_READINGS_SQL = """
+    SELECT id, fill_time, total_mileage, gallons, dollars, mpg, lat, lng, location
+    FROM fuel_readings
+    ORDER BY fill_time DESC NULLS LAST, id DESC
+    LIMIT %s
+"""
+
+
+########################
+def last(argv: List[str]) -> None:
+    ap = argparse.ArgumentParser(prog="gasser last", description="Show the latest readings in fuel_readings.")
+    ap.add_argument("-n", "--limit", type=int, default=10, help="Number of readings (default: 10)")
+    args = ap.parse_args(argv)
+
+    import gasser_db
+
+    with gasser_db.exit_on_db_error():
+        with gasser_db.transaction() as cur:
+            cur.execute(LAST_READINGS_SQL, (args.limit,))
+            rows = cur.fetchall()
+    if not rows:
+        print("No readings in fuel_readings yet.")
+        return
+
+    print(f"{'id':>6} {'fill_time':<19} {'mileage':>8} {'gallons':>8} {'dollars':>8} {'mpg':>6}  location")
+    for id_, fill_time, mileage, gallons, dollars, mpg, lat, lng, location in rows:
+        when = fill_time.strftime("%Y-%m-%d %H:%M") if fill_time else "-"
+        where = location or (f"{lat:.5f},{lng:.5f}" if lat is not None and lng is not None else "")
+        print(f"{id_:>6} {when:<19} {fmt(mileage, 0):>8} {fmt(gallons, 3):>8} {fmt(dollars, 2):>8} "
+              f"{fmt(mpg, 1):>6}  {where}")
+
+def fmt(value, places: int) -> str:
+    return "-" if value is None else f"{float(value):.{places}f}"
+
+def run_command(name: str, argv: List[str]) -> None:
+    """Import the command's module and run its entry point with argv, as if it were the script."""
+    module_name, function, _ = COMMANDS[name]
+    sys.argv[:] = [f"{module_name}.py"] + argv
+    module = importlib.import_module(module_name)
+    getattr(module, function)()
+
+def build_parser() -> argparse.ArgumentParser:
+    width = max(len(name) for name in COMMANDS)
+    listing = "\n".join(f"  {name:<{width}}  {help_}" for name, (_, _, help_) in COMMANDS.items())
+    ap = argparse.ArgumentParser(
+        prog="gasser",
+        description="Gasser - a fuel use tracker that also computes MPG.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"commands:\n  {'last':<{width}}  show the latest readings (-n N)\n{listing}\n\n"
+               "gasser <command> --help shows the options of a command.",
+    )
+    ap.add_argument("command", metavar="command", choices=["last"] + list(COMMANDS), help="see the list below")
+    ap.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    return ap
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    # options before the command belong to gasser; everything after it to the command
+    split = next((i for i, a in enumerate(argv) if not a.startswith("-")), len(argv))
+    args = build_parser().parse_args(argv[:split + 1])
+    rest = argv[split + 1:]
+    if args.command == "last":
+        last(rest)
+    else:
+        run_command(args.command, rest)
+
+if __name__ == "__main__":
+    profiling.run(main)
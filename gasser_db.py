@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+gasser_db.py
+------------
+Shared database access for all of the gasser scripts.
+
+- GASSER_DB_BACKEND selects PostgreSQL ("postgres", the default) or an embedded
+  SQLite file ("sqlite", GASSER_SQLITE_PATH, WAL mode) that needs no server
+- DB_CONFIG is built once from the PG* variables in .env / the environment
+- One connection pool per process, created on first use; stages that run in
+  the same process (or worker threads in a batch) share its connections
+- transaction(): a cursor that commits on success and rolls back on error
+- execute_prepared(): server-side PREPARE once per connection, then EXECUTE
+- execute_values(): multi-row VALUES statements, page_size rows each, on either backend
+- exit_on_db_error(): the "PostgreSQL error: ..." + exit(1) handling for main()
+
+Scripts keep writing psycopg2-style SQL (%s / %(name)s, $n in prepared statements);
+on SQLite the cursor translates the placeholders, and the few statements whose
+syntax differs check SQLITE and use their own variant.
+"""
+import atexit
+import os
+import re
+import sqlite3
+import sys
+import threading
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Sequence, Set, Union
+
+from dotenv import load_dotenv
+
+import metrics
+
+try:
+    import psycopg2
+    from psycopg2 import extensions, extras, pool
+except ImportError:
+    # only the SQLite backend is usable without psycopg2
+    psycopg2 = None
+
+load_dotenv()
+
+BACKEND = os.environ.get("GASSER_DB_BACKEND", "postgres").strip().lower()
+SQLITE = BACKEND == "sqlite"
+SQLITE_PATH = os.environ.get("GASSER_SQLITE_PATH", "gasser.sqlite")
+
+DB_CONFIG = {
+    "dbname": os.environ.get("PGDATABASE"),
+    "user":   os.environ.get("PGUSER"),
+    "password": os.environ.get("PGPASSWORD"),
+    "host": os.environ.get("PGHOST"),
+    "port": os.environ.get("PGPORT")
+}
+
+POOL_MIN = int(os.environ.get("GASSER_DB_POOL_MIN", "1"))
+POOL_MAX = int(os.environ.get("GASSER_DB_POOL_MAX", "4"))
+
+# Rows per VALUES statement in execute_values(), psycopg2's default; it keeps a page of
+# the widest batches well under SQLite's bound-variable limit (999 in older builds)
+PAGE_SIZE = 100
+
+DB_ERRORS = (sqlite3.Error,) + ((psycopg2.Error,) if psycopg2 else ())
+
+# SQL for "the current time" in a TIMESTAMPTZ column
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now')" if SQLITE else "now()"
+
+# fill_time of a reading without a known date: -infinity sorts it before every dated
+# fill-up, like the seed row. Single inserts, bulk ingest, copy_readings() and
+# create_gasser_table.py --migrate all use it (a partitioned table has no NULL fill_time).
+UNDATED_SQL = "'-infinity'" if SQLITE else "'-infinity'::timestamptz"
+
+# Fill-up order for every window over the history (MPG, trips, rolling stats); legacy
+# rows with a NULL fill_time sort first on both backends, like the -infinity ones
+FILL_ORDER = "fill_time NULLS FIRST, id"
+
+# Statements shared by several scripts ($n placeholders, used with execute_prepared).
+INSERT_READING_SQL = (
+    "INSERT INTO fuel_readings (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons, fill_time) "
+    f"VALUES ($1, $2, $3, $4, $5, $6, COALESCE($7, {UNDATED_SQL}))"
+)
+INSERT_READING_RETURNING_SQL = INSERT_READING_SQL + " RETURNING id"
+READING_COLUMNS = (
+    "id, odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons, "
+    "mpg, lat, lng, location, price_per_gal, fill_time"
+)
+LATEST_READINGS_SQL = (
+    f"SELECT {READING_COLUMNS} FROM fuel_readings "
+    "ORDER BY fill_time DESC NULLS LAST, id DESC LIMIT $1"
+)
+READING_ID_SQL = "SELECT id FROM fuel_readings WHERE odometer_file = $1"
+UPDATE_MPG_SQL = "UPDATE fuel_readings SET mpg = $1, price_per_gal = $2 WHERE id = $3"
+UPDATE_LOCATION_SQL = "UPDATE fuel_readings SET lat = $1, lng = $2, location = $3 WHERE id = $4"
+
+_pool = None
+_pool_lock = threading.Lock()
+# statement names already PREPAREd, per live connection; keyed weakly on the
+# connection itself, since the pool closes surplus connections and id()s get reused
+_prepared: "weakref.WeakKeyDictionary[object, Set[str]]" = weakref.WeakKeyDictionary()
+# SQLite: one connection per thread
+_sqlite_local = threading.local()
+_sqlite_conns: List[sqlite3.Connection] = []
+
+
+########################
+# SQLite backend
+
+_PLACEHOLDER_RE = re.compile(r"%%|%\((\w+)\)s|%s|\$(\d+)")
+
+def _sqlite_sql(statement: str) -> str:
+    """psycopg2 placeholders to sqlite3 ones: %s -> ?, %(name)s -> :name, $n -> ?n."""
+    def sub(m):
+        if m.group(0) == "%%":
+            return "%"
+        if m.group(1):
+            return f":{m.group(1)}"
+        if m.group(2):
+            return f"?{m.group(2)}"
+        return "?"
+    return _PLACEHOLDER_RE.sub(sub, statement)
+
+def _sqlite_value(val):
+    # fill_time is stored as UTC ISO-8601 text so that it sorts correctly as a string
+    if isinstance(val, datetime):
+        # round-trip the -infinity / infinity that _parse_timestamptz() reads as min / max
+        if val.replace(tzinfo=None) == datetime.min:
+            return "-infinity"
+        if val.replace(tzinfo=None) == datetime.max:
+            return "infinity"
+        if val.tzinfo is not None:
+            val = val.astimezone(timezone.utc)
+        return val.replace(tzinfo=timezone.utc).isoformat()
+    return val
+
+def _sqlite_params(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {k: _sqlite_value(v) for k, v in params.items()}
+    return tuple(_sqlite_value(v) for v in params)
+
+def _parse_timestamptz(raw: bytes) -> datetime:
+    text = raw.decode()
+    if text == "-infinity":
+        return datetime.min.replace(tzinfo=timezone.utc)
+    if text == "infinity":
+        return datetime.max.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(text)
+
+sqlite3.register_converter("TIMESTAMPTZ", _parse_timestamptz)
+
+########################
+# PostgreSQL: psycopg2 reads -infinity / infinity as datetime.min / max, but would
+# write them back as the years 1 and 9999; send them as themselves instead
+
+def _adapt_datetime(val: datetime):
+    cast = "timestamptz" if val.tzinfo is not None else "timestamp"
+    if val.replace(tzinfo=None) == datetime.min:
+        return extensions.AsIs(f"'-infinity'::{cast}")
+    if val.replace(tzinfo=None) == datetime.max:
+        return extensions.AsIs(f"'infinity'::{cast}")
+    return extensions.TimestampFromPy(val)
+
+if psycopg2 is not None:
+    extensions.register_adapter(datetime, _adapt_datetime)
+
+class SqliteCursor:
+    """The slice of the psycopg2 cursor API the scripts use, on top of sqlite3."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.connection = conn
+        self._cur = conn.cursor()
+        self._changes = -1
+
+    def execute(self, statement, params=None):
+        self.execute_raw(_sqlite_sql(statement), _sqlite_params(params))
+
+    def execute_raw(self, statement, params=()):
+        before = self.connection.total_changes
+        self._cur.execute(statement, params)
+        # total_changes also counts rows changed by triggers; changes() is this statement's own
+        if self.connection.total_changes != before:
+            self._changes = self.connection.execute("SELECT changes()").fetchone()[0]
+        else:
+            self._changes = 0
+
+    def executescript(self, script):
+        # sqlite3's own executescript() COMMITs first, which would end transaction()
+        pending = ""
+        for line in script.splitlines(keepends=True):
+            pending += line
+            if sqlite3.complete_statement(pending):
+                self.execute_raw(pending)
+                pending = ""
+        if pending.strip():
+            self.execute_raw(pending)
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    @property
+    def rowcount(self):
+        # sqlite3 reports -1 for DML that starts with WITH; fall back to the change counter
+        rc = self._cur.rowcount
+        return rc if rc != -1 else self._changes
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _sqlite_connection() -> sqlite3.Connection:
+    conn = getattr(_sqlite_local, "conn", None)
+    if conn is None:
+        # isolation_level=None: no implicit BEGINs, transaction() issues them
+        with metrics.timer("db_connect_seconds", backend="sqlite"):
+            conn = sqlite3.connect(SQLITE_PATH, isolation_level=None,
+                                   detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        _sqlite_local.conn = conn
+        with _pool_lock:
+            _sqlite_conns.append(conn)
+    return conn
+
+########################
+def get_pool():
+    global _pool
+    if psycopg2 is None:
+        raise SystemExit("ERROR: psycopg2 is not installed; install it or set GASSER_DB_BACKEND=sqlite")
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            # opens POOL_MIN psycopg2 connections up front
+            with metrics.timer("db_connect_seconds", backend="postgres"):
+                _pool = pool.ThreadedConnectionPool(POOL_MIN, POOL_MAX, **DB_CONFIG)
+        return _pool
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _prepared.clear()
+        while _sqlite_conns:
+            _sqlite_conns.pop().close()
+        _sqlite_local.__dict__.clear()
+
+atexit.register(close_pool)
+
+@contextmanager
+def connection() -> Iterator:
+    """Borrow a pooled connection; it goes back to the pool idle (no open transaction)."""
+    if SQLITE:
+        conn = _sqlite_connection()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+        return
+
+    p = get_pool()
+    # connects when every pooled connection is busy
+    with metrics.timer("db_getconn_seconds"):
+        conn = p.getconn()
+    try:
+        yield conn
+    finally:
+        broken = bool(conn.closed)
+        if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        if broken:
+            _prepared.pop(conn, None)
+        p.putconn(conn, close=broken)
+
+@contextmanager
+def transaction(cursor_factory=None) -> Iterator:
+    """A cursor inside one transaction: commit when the block exits, roll back if it raises."""
+    with connection() as conn:
+        if SQLITE:
+            conn.execute("BEGIN")
+            try:
+                with SqliteCursor(conn) as cur:
+                    yield cur
+                conn.execute("COMMIT")
+            except Exception:
+                conn.rollback()
+                raise
+            return
+
+        try:
+            with conn.cursor(cursor_factory=cursor_factory) as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def execute_prepared(cur, name: str, statement: str, params: Sequence = ()) -> None:
+    """EXECUTE a named server-side prepared statement, PREPAREing it first on this connection if needed."""
+    if SQLITE:
+        # sqlite3 keeps its own per-connection statement cache
+        cur.execute(statement, params)
+        return
+
+    names = _prepared.setdefault(cur.connection, set())
+    if name not in names:
+        cur.execute(f"PREPARE {name} AS {statement}")
+        names.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+def execute_values(cur, statement: str, rows: Sequence[Sequence], template: Optional[str] = None,
+                   page_size: int = PAGE_SIZE, fetch: bool = False) -> Union[int, List[tuple]]:
+    """
+    Run statement with its single %s replaced by a VALUES list, once per page_size rows.
+    Returns the rows affected by all pages together (cur.rowcount only has the last page),
+    or with fetch=True the rows of the statement's RETURNING clause, as psycopg2 does.
+    """
+    total = 0
+    fetched: List[tuple] = []
+    before, after = statement.split("%s", 1)
+    for start in range(0, len(rows), page_size):
+        page = rows[start:start + page_size]
+        if SQLITE:
+            row_sql = "(" + ", ".join("?" * len(page[0])) + ")"
+            values_sql = ", ".join([row_sql] * len(page))
+            cur.execute_raw(_sqlite_sql(before) + values_sql + _sqlite_sql(after),
+                            [v for row in page for v in _sqlite_params(row)])
+            if fetch:
+                fetched.extend(cur.fetchall())
+        elif fetch:
+            fetched.extend(extras.execute_values(cur, statement, page, template=template,
+                                                 page_size=len(page), fetch=True))
+        else:
+            extras.execute_values(cur, statement, page, template=template, page_size=len(page))
+        total += max(cur.rowcount, 0)
+    return fetched if fetch else total
+
+def execute_script(cur, script: str) -> None:
+    """Several ;-separated DDL statements."""
+    if SQLITE:
+        cur.executescript(script)
+    else:
+        cur.execute(script)
+
+@contextmanager
+def exit_on_db_error() -> Iterator[None]:
+    """For main(): report a database error the way the scripts always have, and exit 1."""
+    try:
+        yield
+    except DB_ERRORS as e:
+        print(f"{'SQLite' if SQLITE else 'PostgreSQL'} error: {e}")
+        sys.exit(1)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+gasser_db_async.py
+------------------
+Async storage path for concurrent pipeline workers (asyncpg), next to the
+blocking gasser_db.py that the command line scripts use.
+
+- One asyncpg pool per event loop, created on first use from gasser_db.DB_CONFIG
+  and GASSER_DB_POOL_MIN / GASSER_DB_POOL_MAX
+- asyncpg prepares and caches every statement per connection, so the shared
+  $n statements in gasser_db are used as they are
+- insert_readings(): executemany, pipelined (one round trip for the batch)
+- copy_readings(): binary COPY into a staging table, then the same
+  ON CONFLICT insert as bulk_ingest_results.py
+- recompute_mpg() / update_locations() / refresh_stats(): the set-based
+  statements from compute_mpg.py, read_update_metadata.py and fuel_stats.py
+
+Every call awaits the network instead of blocking, so database writes overlap
+with inference running in other tasks. With GASSER_DB_BACKEND=sqlite the same
+functions run the blocking gasser_db versions in a worker thread.
+
+Usage:
+  import gasser_db_async as adb
+  reading_id = await adb.insert_reading(reading, fill_time)
+  await adb.recompute_mpg(around_id=reading_id)
+  await adb.close_pool()
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+try:
+    import asyncpg
+except ImportError:
+    # only needed for PostgreSQL; the SQLite backend goes through gasser_db
+    asyncpg = None
+
+import gasser_db
+from compute_mpg import AROUND_FILTER_TEMPLATE, RECOMPUTE_MPG_SQL
+from compute_mpg import recompute_mpg as recompute_mpg_sync
+from fuel_stats import VIEWS
+from read_update_metadata import BATCH_UPDATE_LOCATION_SQL, LOCATION_VALUES
+from read_update_metadata import update_locations as update_locations_sync
+
+# (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons), as read_results_llm() returns it
+Reading = Sequence
+
+STAGING_COLUMNS = ("odometer_file", "trip_value", "total_mileage", "gaspump_file", "dollars", "gallons", "fill_time")
+
+STAGING_SQL = """
+CREATE TEMP TABLE fuel_readings_async_staging (
+    odometer_file TEXT,
+    trip_value    INTEGER,
+    total_mileage INTEGER,
+    gaspump_file  TEXT,
+    dollars       REAL,
+    gallons       REAL,
+    fill_time     TIMESTAMPTZ
+) ON COMMIT DROP
+"""
+
+INSERT_FROM_STAGING_SQL = f"""
+INSERT INTO fuel_readings (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons, fill_time)
+SELECT odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons,
+       COALESCE(fill_time, {gasser_db.UNDATED_SQL})
+FROM (
+    SELECT DISTINCT ON (odometer_file) *
+    FROM fuel_readings_async_staging
+    ORDER BY odometer_file
+) s
+ORDER BY 7, odometer_file
+ON CONFLICT DO NOTHING
+"""
+
+# compute_mpg's filter; asyncpg has no named parameters, and the casts pin the types
+# the row comparison can't infer
+AROUND_FILTER = AROUND_FILTER_TEMPLATE.format(time="$1::timestamptz", id="$2::int")
+
+READING_TIME_SQL = "SELECT fill_time FROM fuel_readings WHERE id = $1"
+
+READING_ID_SQL = "SELECT id FROM fuel_readings WHERE odometer_file = $1"
+
+# The batched location update with the values passed as four arrays instead of a temporary table
+UPDATE_LOCATIONS_SQL = BATCH_UPDATE_LOCATION_SQL.replace(
+    f"({LOCATION_VALUES})", "(SELECT * FROM unnest($1::text[], $2::float8[], $3::float8[], $4::text[]))"
+)
+
+EXISTING_VIEWS_SQL = "SELECT matviewname, ispopulated FROM pg_matviews WHERE matviewname = ANY($1::text[])"
+
+_pool = None
+_pool_loop = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+
+########################
+def connect_kwargs() -> dict:
+    """gasser_db.DB_CONFIG in asyncpg's spelling (database=, and no unset keys)."""
+    kwargs = {("database" if k == "dbname" else k): v for k, v in gasser_db.DB_CONFIG.items() if v}
+    if "port" in kwargs:
+        kwargs["port"] = int(kwargs["port"])
+    return kwargs
+
+async def get_pool():
+    global _pool, _pool_loop, _pool_lock
+    if asyncpg is None:
+        raise SystemExit("ERROR: asyncpg is not installed; install it or set GASSER_DB_BACKEND=sqlite")
+    loop = asyncio.get_running_loop()
+    if _pool_loop is not loop:
+        # a pool belongs to the loop that created it (asyncio.run() makes a new loop each time)
+        _pool, _pool_loop, _pool_lock = None, loop, asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None or _pool.is_closing():
+            _pool = await asyncpg.create_pool(min_size=gasser_db.POOL_MIN, max_size=gasser_db.POOL_MAX,
+                                              **connect_kwargs())
+        return _pool
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None and not _pool.is_closing():
+        await _pool.close()
+    _pool = None
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator:
+    """A pooled connection inside one transaction: commit when the block exits, roll back if it raises."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            yield conn
+
+def status_count(status: str) -> int:
+    """Row count from a command tag: "UPDATE 3" -> 3, "INSERT 0 2" -> 2."""
+    try:
+        return int(status.rsplit(" ", 1)[-1])
+    except (AttributeError, ValueError):
+        return 0
+
+########################
+def as_number(val, kind):
+    # psycopg2 sends values as literals and lets PostgreSQL cast them; asyncpg's binary
+    # protocol needs the Python type (the LLM answers "274989" as often as 274989)
+    if val is None or (isinstance(val, str) and not val.strip()):
+        return None
+    return kind(float(val)) if kind is int else kind(val)
+
+def typed_reading(reading: Reading, fill_time: Optional[datetime]) -> Tuple:
+    odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons = reading
+    return (odometer_file, as_number(trip_value, int), as_number(total_mileage, int),
+            gaspump_file, as_number(dollars, float), as_number(gallons, float), fill_time)
+
+def _insert_readings_sync(rows: List[Tuple], skip_existing: bool = False) -> List[int]:
+    """SQLite: insert rows one by one in a transaction, ids of the rows actually inserted."""
+    statement = gasser_db.INSERT_READING_SQL + (" ON CONFLICT DO NOTHING" if skip_existing else "")
+    ids = []
+    with gasser_db.transaction() as cur:
+        for row in rows:
+            cur.execute(statement, row)
+            if cur.rowcount:
+                cur.execute("SELECT last_insert_rowid()")
+                ids.append(cur.fetchone()[0])
+    return ids
+
+async def insert_reading(reading: Reading, fill_time: Optional[datetime] = None) -> int:
+    """Insert one reading (fill_time None = undated, -infinity) and return its id."""
+    row = typed_reading(reading, fill_time)
+    if gasser_db.SQLITE:
+        return (await asyncio.to_thread(_insert_readings_sync, [row]))[0]
+    async with transaction() as conn:
+        return await conn.fetchval(gasser_db.INSERT_READING_RETURNING_SQL, *row)
+
+async def insert_readings(readings: Sequence[Tuple[Reading, Optional[datetime]]]) -> int:
+    """Insert (reading, fill_time) pairs with one pipelined executemany. Returns rows sent."""
+    rows = [typed_reading(reading, fill_time) for reading, fill_time in readings]
+    if not rows:
+        return 0
+    if gasser_db.SQLITE:
+        return len(await asyncio.to_thread(_insert_readings_sync, rows))
+    async with transaction() as conn:
+        await conn.executemany(gasser_db.INSERT_READING_SQL, rows)
+    return len(rows)
+
+async def copy_readings(readings: Sequence[Tuple[Reading, Optional[datetime]]]) -> int:
+    """
+    Binary COPY (reading, fill_time) pairs into a staging table and insert the ones that are
+    not in fuel_readings yet. Readings without an odometer file are skipped. Returns rows inserted.
+    """
+    rows = [typed_reading(reading, fill_time) for reading, fill_time in readings
+            if reading[0] not in (None, "", "not found")]
+    if not rows:
+        return 0
+    if gasser_db.SQLITE:
+        # no COPY in SQLite; the unique file indexes still catch readings already stored
+        return len(await asyncio.to_thread(_insert_readings_sync, rows, True))
+    async with transaction() as conn:
+        await conn.execute(STAGING_SQL)
+        await conn.copy_records_to_table("fuel_readings_async_staging", records=rows, columns=STAGING_COLUMNS)
+        return status_count(await conn.execute(INSERT_FROM_STAGING_SQL))
+
+def _reading_id_sync(odometer_file: str) -> Optional[int]:
+    with gasser_db.transaction() as cur:
+        cur.execute(READING_ID_SQL, (odometer_file,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+async def reading_id(odometer_file: str) -> Optional[int]:
+    """id of the reading for an odometer photo (unique per photo), or None."""
+    if gasser_db.SQLITE:
+        return await asyncio.to_thread(_reading_id_sync, odometer_file)
+    async with transaction() as conn:
+        return await conn.fetchval(READING_ID_SQL, odometer_file)
+
+########################
+async def recompute_mpg(around_id: Optional[int] = None, around_time: Optional[datetime] = None) -> int:
+    """compute_mpg.recompute_mpg(), awaitable. Returns readings updated; ValueError for an unknown around_id."""
+    if gasser_db.SQLITE:
+        return await asyncio.to_thread(recompute_mpg_sync, around_id, around_time)
+    if isinstance(around_time, str):
+        around_time = datetime.fromisoformat(around_time)
+
+    async with transaction() as conn:
+        if around_id is None and around_time is None:
+            return status_count(await conn.execute(RECOMPUTE_MPG_SQL))
+        if around_time is None:
+            around_time = await conn.fetchval(READING_TIME_SQL, around_id)
+            if around_time is None:
+                raise ValueError(f"no reading with id {around_id}")
+        return status_count(await conn.execute(RECOMPUTE_MPG_SQL + AROUND_FILTER,
+                                               around_time, around_id if around_id is not None else 0))
+
+async def update_locations(values: Sequence[Tuple[str, float, float, str]]) -> int:
+    """read_update_metadata.update_locations(), awaitable: values are (file_name, lat, lng, location)."""
+    if not values:
+        return 0
+    if gasser_db.SQLITE:
+        return await asyncio.to_thread(update_locations_sync, list(values))
+    file_names, lats, lngs, locations = (list(col) for col in zip(*values))
+    async with transaction() as conn:
+        return status_count(await conn.execute(UPDATE_LOCATIONS_SQL, file_names, lats, lngs, locations))
+
+async def refresh_stats() -> List[str]:
+    """fuel_stats.refresh_stats(), awaitable. Returns the views refreshed."""
+    if gasser_db.SQLITE:
+        return []
+    async with transaction() as conn:
+        existing = await conn.fetch(EXISTING_VIEWS_SQL, list(VIEWS))
+        for name, populated in existing:
+            concurrently = "CONCURRENTLY " if populated else ""
+            await conn.execute(f"REFRESH MATERIALIZED VIEW {concurrently}{name}")
+    return [name for name, _ in existing]
@@ -5,22 +5,32 @@ import os
 from pathlib import Path
 import argparse
 import csv
+from functools import lru_cache
 
-# Try to import tiktoken; if unavailable, use a simple fallback heuristic
-try:
-    import tiktoken
-    def count_tokens(text: str, model: str = "gpt-4o") -> int:
-        try:
-            enc = tiktoken.encoding_for_model(model)
-        except Exception:
-            enc = tiktoken.get_encoding("cl100k_base")
-        return len(enc.encode(text))
-    TOKENIZER_NAME = "tiktoken"
-except Exception:
-    def count_tokens(text: str, model: str = "gpt-4o") -> int:
+import profiling
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """The tiktoken encoding for model, looked up once per process; None without tiktoken."""
+    # tiktoken is imported here, not at the top: it takes longer to load than the rest of the script
+    try:
+        import tiktoken
+    except Exception:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    enc = _encoding(model)
+    if enc is None:
         # Fallback: rough heuristic ~4 chars per token
         return max(1, math.ceil(len(text) / 4))
-    TOKENIZER_NAME = "heuristic(4 chars/token)"
+    return len(enc.encode(text))
+
+def tokenizer_name(model: str = "gpt-4o") -> str:
+    return "heuristic(4 chars/token)" if _encoding(model) is None else "tiktoken"
 
 PRICES = {
     "gpt-4o": {
@@ -49,26 +59,8 @@ def iter_images(root: Path):
         if p.is_file() and p.suffix.lower() in SUPPORTED_EXTS:
             yield p
 
-def main():
-    ap = argparse.ArgumentParser(description="Batch image cost estimator for GPT-4o and GPT-4o-mini")
-    ap.add_argument("image_dir", help="Directory containing images (searched recursively)")
-    ap.add_argument("prompt_file", help="Text file containing the prompt to send with each image")
-    ap.add_argument("--output-tokens", type=int, default=0, help="Expected output tokens per image (default: 0)")
-    ap.add_argument("--csv", default="image_cost_report.csv", help="Path to write CSV report")
-    args = ap.parse_args()
-
-    image_dir = Path(args.image_dir)
-    if not image_dir.exists():
-        raise SystemExit(f"Image directory not found: {image_dir}")
-
-    try:
-        prompt_text = Path(args.prompt_file).read_text(encoding="utf-8")
-    except Exception as e:
-        raise SystemExit(f"Failed to read prompt file: {e}")
-
-    input_tokens = count_tokens(prompt_text, "gpt-4o")
-    output_tokens = max(0, int(args.output_tokens))
-
+def estimate_costs(images, input_tokens: int, output_tokens: int):
+    """Per-image, per-model cost rows and the per-model totals."""
     rows = []
     totals = {
         "count": 0,
@@ -76,10 +68,6 @@ def main():
         "gpt-4o-mini": {"image": 0.0, "input": 0.0, "output": 0.0, "total": 0.0},
     }
 
-    images = list(iter_images(image_dir))
-    if not images:
-        raise SystemExit(f"No supported images found in: {image_dir}")
-
     for img_path in images:
         with Image.open(img_path) as im:
             w, h = im.size
@@ -112,15 +100,16 @@ def main():
 
         totals["count"] += 1
 
-    # Write CSV
-    csv_path = Path(args.csv)
+    return rows, totals
+
+def write_report(rows, csv_path: Path) -> None:
     with csv_path.open("w", newline="", encoding="utf-8") as f:
         wtr = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
         wtr.writeheader()
         wtr.writerows(rows)
 
-    # Print summary
-    print(f"\nTokenizer: {TOKENIZER_NAME}")
+def print_summary(totals, input_tokens: int, output_tokens: int) -> None:
+    print(f"\nTokenizer: {tokenizer_name()}")
     print(f"Images processed: {totals['count']}")
     print(f"Prompt tokens (input): {input_tokens}")
     print(f"Output tokens (per image): {output_tokens}\n")
@@ -133,7 +122,40 @@ def main():
         print(f"  Output cost total: ${t['output']:.6f}")
         print(f"  GRAND TOTAL      : ${t['total']:.6f}\n")
 
+def estimate_dir(image_dir: Path, prompt_text: str, output_tokens: int = 0, csv_path: Path = Path("image_cost_report.csv"),
+                 images=None):
+    """Estimate, write the CSV report and print the summary for every image under image_dir (or just images)."""
+    images = list(iter_images(image_dir)) if images is None else [Path(p) for p in images]
+    if not images:
+        raise SystemExit(f"No supported images found in: {image_dir}")
+
+    input_tokens = count_tokens(prompt_text, "gpt-4o")
+    output_tokens = max(0, int(output_tokens))
+    rows, totals = estimate_costs(images, input_tokens, output_tokens)
+
+    write_report(rows, csv_path)
+    print_summary(totals, input_tokens, output_tokens)
     print(f"CSV report written to: {csv_path.resolve()}")
+    return totals
+
+def main():
+    ap = argparse.ArgumentParser(description="Batch image cost estimator for GPT-4o and GPT-4o-mini")
+    ap.add_argument("image_dir", help="Directory containing images (searched recursively)")
+    ap.add_argument("prompt_file", help="Text file containing the prompt to send with each image")
+    ap.add_argument("--output-tokens", type=int, default=0, help="Expected output tokens per image (default: 0)")
+    ap.add_argument("--csv", default="image_cost_report.csv", help="Path to write CSV report")
+    args = ap.parse_args()
+
+    image_dir = Path(args.image_dir)
+    if not image_dir.exists():
+        raise SystemExit(f"Image directory not found: {image_dir}")
+
+    try:
+        prompt_text = Path(args.prompt_file).read_text(encoding="utf-8")
+    except Exception as e:
+        raise SystemExit(f"Failed to read prompt file: {e}")
+
+    estimate_dir(image_dir, prompt_text, args.output_tokens, Path(args.csv))
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+image_quality.py
+----------------
+Reject photos the model cannot read (blurred, dark, washed out by glare) before
+they cost an LLM call and come back as garbage.
+
+- Sharpness: variance of the Laplacian (dedup_images.laplacian_variance), at most
+  1024 px on the longest side
+- Exposure: from the brightness histogram; too dark when even the brightest 0.5%
+  of the pixels is dim (a night dashboard still has its lit digits), overexposed
+  when most of the photo is clipped white
+- Glare: share of near-white pixels in the middle of the photo, where the
+  display is framed
+- All of it is NumPy on the thumbnail, a few milliseconds per image
+- Rejected images are moved to <folder>/rejected/ with their reasons in
+  rejected/quality.json; pipeline.py runs this as its quality stage, and
+  watch_daemon.py / job_queue.py / stream_pipeline.py run screen_folder()
+  (dedup, then this gate) on each fill-up's thumbnail folder
+
+Usage:
+  python image_quality.py --folder images_thumbnails --dry-run
+  python image_quality.py --folder images_thumbnails --min-sharpness 60 --max-glare 0.1
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import metrics
+import profiling
+from dedup_images import DEFAULT_DISTANCE, DEFAULT_FOLDER, dedup_folder, laplacian_variance, list_images, sharpness_gray
+
+REJECTED_DIR = "rejected"
+REPORT_FILE = "quality.json"
+
+MIN_SHARPNESS = 25.0           # Laplacian variance; a dim, low-contrast pump LCD is ~80, a 2 px blur under 10
+MIN_BRIGHT_LEVEL = 60          # 0-255: the 99.5th percentile of brightness must reach this
+MAX_CLIPPED = 0.5              # share of the photo at 250+
+MAX_GLARE = 0.2                # share of near-white pixels in the display region
+GLARE_LEVEL = 240              # all of R, G and B at least this is glare
+DISPLAY_REGION = (0.2, 0.25, 0.8, 0.75)   # left, top, right, bottom as fractions of the photo
+
+
+class Quality(NamedTuple):
+    path: str
+    ok: bool
+    reasons: List[str]
+    sharpness: float
+    bright_level: int
+    clipped: float
+    glare: float
+
+
+########################
+def exposure(gray: np.ndarray) -> Tuple[int, float]:
+    """(99.5th percentile brightness, share of pixels at 250+) from the 256-bin histogram."""
+    hist = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+    cdf = np.cumsum(hist) / max(1, gray.size)
+    return int(np.searchsorted(cdf, 0.995)), float(hist[250:].sum() / max(1, gray.size))
+
+def glare_fraction(rgb: np.ndarray, region: Tuple[float, float, float, float] = DISPLAY_REGION) -> float:
+    h, w = rgb.shape[:2]
+    left, top, right, bottom = region
+    box = rgb[int(h * top):int(h * bottom), int(w * left):int(w * right)]
+    return float((box.min(axis=2) >= GLARE_LEVEL).mean()) if box.size else 0.0
+
+def assess(path: str, min_sharpness: float = MIN_SHARPNESS, max_glare: float = MAX_GLARE) -> Quality:
+    with metrics.timer("image_quality_seconds"), Image.open(path) as img:
+        gray = sharpness_gray(img)
+        rgb = np.asarray(img.convert("RGB"))
+    sharpness = laplacian_variance(gray)
+    bright_level, clipped = exposure(gray)
+    glare = glare_fraction(rgb)
+
+    reasons = []
+    if sharpness < min_sharpness:
+        reasons.append(f"blurry (sharpness {sharpness:.0f} < {min_sharpness:.0f})")
+    if bright_level < MIN_BRIGHT_LEVEL:
+        reasons.append(f"too dark (brightest pixels {bright_level} < {MIN_BRIGHT_LEVEL})")
+    if clipped > MAX_CLIPPED:
+        reasons.append(f"overexposed ({clipped:.0%} clipped)")
+    if glare > max_glare:
+        reasons.append(f"glare on the display ({glare:.0%} of it white)")
+    return Quality(path, not reasons, reasons, round(sharpness, 2), bright_level, round(clipped, 4), round(glare, 4))
+
+def gate_folder(folder: str, min_sharpness: float = MIN_SHARPNESS, max_glare: float = MAX_GLARE,
+                dry_run: bool = False) -> Tuple[List[str], List[Quality]]:
+    """
+    Move the images that fail into folder/rejected/ (reasons in rejected/quality.json).
+    Returns (the images left in folder, the rejected ones).
+    """
+    results = [assess(p, min_sharpness, max_glare) for p in list_images(folder)]
+    passed = [q.path for q in results if q.ok]
+    rejected = [q for q in results if not q.ok]
+    if rejected and not dry_run:
+        target = os.path.join(folder, REJECTED_DIR)
+        os.makedirs(target, exist_ok=True)
+        report_path = os.path.join(target, REPORT_FILE)
+        report: Dict[str, Dict] = {}
+        if os.path.exists(report_path):
+            with open(report_path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        for q in rejected:
+            os.replace(q.path, os.path.join(target, os.path.basename(q.path)))
+            report[os.path.basename(q.path)] = {k: v for k, v in q._asdict().items() if k not in ("path", "ok")}
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    metrics.count("images_rejected_total", len(rejected))
+    return passed, rejected
+
+def screen_folder(folder: str, dedup_distance: Optional[int] = DEFAULT_DISTANCE, quality: bool = True) -> List[str]:
+    """
+    pipeline.py's dedup and quality stages for one fill-up's thumbnail folder: set
+    near-duplicates (unless dedup_distance is None) and unreadable photos aside.
+    Returns the images left for the model.
+    """
+    if dedup_distance is not None:
+        kept, dupes = dedup_folder(folder, dedup_distance)
+        for group in dupes:
+            print(f"{os.path.basename(group[0].path)}: kept over {len(group) - 1} near-duplicate(s)")
+    if quality:
+        passed, rejected = gate_folder(folder)
+        for q in rejected:
+            print(f"⚠️  {os.path.basename(q.path)} not sent to the model: {'; '.join(q.reasons)}")
+    return list_images(folder)
+
+def add_arguments(ap) -> None:
+    """The screen_folder() options, as pipeline.py names them."""
+    ap.add_argument("--no-dedup", action="store_true", help="Send near-duplicate photos to the model too")
+    ap.add_argument("--no-quality", action="store_true", help="Send blurred / dark / glary photos to the model too")
+    ap.add_argument("--dedup-distance", type=int, default=DEFAULT_DISTANCE,
+                    help=f"Most differing hash bits (of 256) for two photos to count as duplicates (default: {DEFAULT_DISTANCE})")
+
+def main():
+    ap = argparse.ArgumentParser(description="Set aside photos too blurred, dark or glary for the model to read.")
+    ap.add_argument("--folder", default=DEFAULT_FOLDER, help=f"Folder of images (default: {DEFAULT_FOLDER})")
+    ap.add_argument("--min-sharpness", type=float, default=MIN_SHARPNESS,
+                    help=f"Lowest Laplacian variance that passes (default: {MIN_SHARPNESS:.0f})")
+    ap.add_argument("--max-glare", type=float, default=MAX_GLARE,
+                    help=f"Highest share of white pixels on the display that passes (default: {MAX_GLARE})")
+    ap.add_argument("--dry-run", action="store_true", help="Only report, move nothing")
+    ap.add_argument("--all", action="store_true", help="Also list the images that pass")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.folder):
+        raise SystemExit(f"ERROR: Folder not found: {args.folder}")
+    passed, rejected = gate_folder(args.folder, args.min_sharpness, args.max_glare, args.dry_run)
+    if args.all:
+        for path in passed:
+            print(f"ok       {os.path.basename(path)}")
+    for q in rejected:
+        print(f"{'REJECT' if args.dry_run else 'rejected'} {os.path.basename(q.path)}: {'; '.join(q.reasons)}")
+    print(f"{len(passed)} readable, {len(rejected)} rejected"
+          f"{'' if args.dry_run or not rejected else ' -> ' + os.path.join(args.folder, REJECTED_DIR)}")
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+job_queue.py
+------------
+Durable queue of fill-up jobs in the gasser database (PostgreSQL or the
+embedded SQLite backend), for long backfills that have to survive restarts.
+
+- One row per fill-up job (pair_images.py output): its photos, the stage it has
+  reached, status, attempt count, last error and the seconds each stage took
+- Workers claim the oldest runnable job in one UPDATE ... RETURNING; on
+  PostgreSQL the sub-select uses FOR UPDATE SKIP LOCKED, so several
+  `job_queue.py work` processes never get the same job
+- Progress is committed after every stage, so a job that fails or is
+  interrupted resumes at the stage it was in (a failed write never repeats
+  inference); failed jobs are retried until --max-attempts
+- claimed_at is a heartbeat, refreshed every time a stage's progress is saved;
+  jobs left "running" by a worker that died are put back once it is older
+  than --stale-minutes
+
+Usage:
+  python job_queue.py enqueue fillup_jobs.jsonl
+  python job_queue.py work [--runner chatgpt] [--limit 50]
+  python job_queue.py status
+  python job_queue.py retry [--job fillup-20250818T184956-3f2a9c1e]
+"""
+import argparse
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import gasser_db
+import image_quality
+import metadata_store
+import metrics
+import profiling
+from compute_mpg import recompute_mpg
+from fuel_stats import refresh_stats
+from read_update_metadata import location_values, update_locations
+from write_results_sql import reading_from_results, reading_id, write_llm_gauge_info_sql
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS pipeline_jobs (
+    id INT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    job_key     TEXT NOT NULL UNIQUE,
+    stage       TEXT NOT NULL DEFAULT 'metadata',
+    status      TEXT NOT NULL DEFAULT 'pending',
+    payload     TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    worker      TEXT,
+    claimed_at  TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    timings     TEXT NOT NULL DEFAULT '{}',
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS pipeline_jobs_claim_idx ON pipeline_jobs (status, id);
+"""
+
+SQLITE_CREATE_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS pipeline_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key     TEXT NOT NULL UNIQUE,
+    stage       TEXT NOT NULL DEFAULT 'metadata',
+    status      TEXT NOT NULL DEFAULT 'pending',
+    payload     TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    worker      TEXT,
+    claimed_at  TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    timings     TEXT NOT NULL DEFAULT '{{}}',
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT ({gasser_db.NOW_SQL})
+);
+CREATE INDEX IF NOT EXISTS pipeline_jobs_claim_idx ON pipeline_jobs (status, id);
+"""
+
+ENQUEUE_SQL = "INSERT INTO pipeline_jobs (job_key, payload) VALUES %s ON CONFLICT (job_key) DO NOTHING RETURNING job_key"
+
+# The sub-select picks the job and the UPDATE claims it in the same statement.
+# SQLite runs one writer at a time, so it needs no row lock.
+CLAIM_SQL = """
+UPDATE pipeline_jobs
+SET status = 'running', attempts = attempts + 1, worker = %(worker)s, claimed_at = %(now)s
+WHERE id = (
+    SELECT id FROM pipeline_jobs
+    WHERE status = 'pending' OR (status = 'failed' AND attempts < %(max_attempts)s)
+    ORDER BY id
+    LIMIT 1
+    {lock}
+)
+RETURNING id, job_key, stage, payload, attempts, timings
+"""
+
+# claimed_at doubles as the heartbeat that requeue_stale() checks
+SAVE_SQL = """
+UPDATE pipeline_jobs
+SET stage = %s, status = %s, payload = %s, timings = %s, last_error = %s, finished_at = %s, claimed_at = %s
+WHERE id = %s
+"""
+
+# running jobs whose last heartbeat is older than the cutoff
+REQUEUE_STALE_SQL = "UPDATE pipeline_jobs SET status = 'pending' WHERE status = 'running' AND claimed_at < %s"
+
+RETRY_SQL = "UPDATE pipeline_jobs SET status = 'pending', attempts = 0 WHERE status = 'failed'"
+
+STATUS_SQL = """
+SELECT stage, status, COUNT(*), MAX(attempts)
+FROM pipeline_jobs
+GROUP BY stage, status
+ORDER BY status, stage
+"""
+
+FAILED_SQL = "SELECT job_key, stage, attempts, last_error FROM pipeline_jobs WHERE status = 'failed' ORDER BY id LIMIT %s"
+
+TIMINGS_SQL = "SELECT timings FROM pipeline_jobs WHERE status = 'done'"
+
+Job = Dict[str, Any]
+
+
+########################
+def ensure_table() -> None:
+    with gasser_db.transaction() as cur:
+        gasser_db.execute_script(cur, SQLITE_CREATE_TABLE_SQL if gasser_db.SQLITE else CREATE_TABLE_SQL)
+
+def enqueue(jobs: List[Job]) -> int:
+    """Add pair_images.py jobs; jobs already in the queue (same job key) are left alone. Returns rows added."""
+    rows = [(job["job"], json.dumps(job, ensure_ascii=False)) for job in jobs]
+    if not rows:
+        return 0
+    with gasser_db.transaction() as cur:
+        added = {key for key, in gasser_db.execute_values(cur, ENQUEUE_SQL, rows, fetch=True)}
+    # a key listed twice in one batch is added once, like a key already in the queue
+    inserted = set(added)
+    for key, _ in rows:
+        if key in inserted:
+            inserted.discard(key)
+        else:
+            print(f"⚠️  {key} is already queued; skipped")
+    return len(added)
+
+def claim(worker: str, max_attempts: int) -> Optional[Job]:
+    statement = CLAIM_SQL.format(lock="" if gasser_db.SQLITE else "FOR UPDATE SKIP LOCKED")
+    with gasser_db.transaction() as cur:
+        cur.execute(statement, {"worker": worker, "now": datetime.now(timezone.utc), "max_attempts": max_attempts})
+        row = cur.fetchone()
+    if row is None:
+        return None
+    id, job_key, stage, payload, attempts, timings = row
+    return {"id": id, "job_key": job_key, "stage": stage, "payload": json.loads(payload),
+            "attempts": attempts, "timings": json.loads(timings)}
+
+def save(job: Job, stage: str, status: str, error: Optional[str] = None) -> None:
+    now = datetime.now(timezone.utc)
+    finished = now if status == "done" else None
+    with gasser_db.transaction() as cur:
+        cur.execute(SAVE_SQL, (stage, status, json.dumps(job["payload"], ensure_ascii=False),
+                               json.dumps(job["timings"]), error, finished, now, job["id"]))
+
+def requeue_stale(minutes: float) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+    with gasser_db.transaction() as cur:
+        cur.execute(REQUEUE_STALE_SQL, (cutoff,))
+        return cur.rowcount
+
+def retry_failed(job_key: Optional[str] = None) -> int:
+    with gasser_db.transaction() as cur:
+        if job_key:
+            cur.execute(RETRY_SQL + " AND job_key = %s", (job_key,))
+        else:
+            cur.execute(RETRY_SQL)
+        return cur.rowcount
+
+########################
+# Stages of one fill-up job; each reads and extends the job's payload
+
+def stage_metadata(worker, payload: Dict[str, Any]) -> None:
+    fill_time = worker.extract(payload["files"])
+    if fill_time is not None:
+        payload["fill_time"] = fill_time.isoformat()
+
+def stage_thumbnails(worker, payload: Dict[str, Any]) -> None:
+    payload["thumbnail_dir"] = os.path.join(worker.args.thumbnails, payload["job"])
+    worker.thumbnails(payload["files"], payload["thumbnail_dir"])
+    worker.screen(payload["thumbnail_dir"])
+
+def stage_analyze(worker, payload: Dict[str, Any]) -> None:
+    payload["results"] = worker.analyze(payload["thumbnail_dir"])
+
+def stage_write(worker, payload: Dict[str, Any]) -> None:
+    reading = reading_from_results(payload["results"])
+    odometer_file = reading[0]
+    if odometer_file in (None, "", "not found"):
+        raise ValueError("the model found no odometer photo in this job")
+    # a retry after a crash between the insert and the progress update must not insert twice
+    id = reading_id(odometer_file)
+    if id is None:
+        fill_time = datetime.fromisoformat(payload["fill_time"]) if payload.get("fill_time") else None
+        write_llm_gauge_info_sql(*reading, fill_time=fill_time)
+        id = reading_id(odometer_file)
+    payload["reading_id"] = id
+
+def stage_mpg(worker, payload: Dict[str, Any]) -> None:
+    # backfills arrive out of order, so only the neighbours of this reading are recomputed
+    recompute_mpg(around_id=payload["reading_id"])
+
+def stage_location(worker, payload: Dict[str, Any]) -> None:
+    store = metadata_store.open_store(worker.args.store)
+    try:
+        records = [metadata_store.find_by_filename(store, name) for name in payload["file_names"]]
+    finally:
+        store.close()
+    update_locations(location_values(r for r in records if r))
+
+STAGES: List[Tuple[str, Callable]] = [
+    ("metadata", stage_metadata),
+    ("thumbnails", stage_thumbnails),
+    ("analyze", stage_analyze),
+    ("write", stage_write),
+    ("mpg", stage_mpg),
+    ("location", stage_location),
+]
+STAGE_NAMES = [name for name, _ in STAGES]
+
+def run_job(worker, job: Job) -> bool:
+    """Run the job from the stage it reached, saving after every stage. Returns True when done."""
+    start = STAGE_NAMES.index(job["stage"]) if job["stage"] in STAGE_NAMES else 0
+    for i in range(start, len(STAGES)):
+        name, stage = STAGES[i]
+        t0 = time.perf_counter()
+        try:
+            with metrics.stage(name, items=1):
+                stage(worker, job["payload"])
+        except KeyboardInterrupt:
+            save(job, name, "pending")
+            raise
+        except (Exception, SystemExit) as e:
+            job["timings"][name] = round(time.perf_counter() - t0, 3)
+            save(job, name, "failed", f"{type(e).__name__}: {e}")
+            print(f"✗ {job['job_key']} failed in {name} (attempt {job['attempts']}): {e}")
+            return False
+        job["timings"][name] = round(time.perf_counter() - t0, 3)
+        next_stage = STAGE_NAMES[i + 1] if i + 1 < len(STAGES) else "done"
+        save(job, next_stage, "done" if next_stage == "done" else "running")
+    print(f"✓ {job['job_key']} done")
+    return True
+
+def work(args) -> Tuple[int, int]:
+    # imported here so enqueue/status/retry need neither exiftool nor the LLM client
+    from watch_daemon import Worker
+
+    stale = requeue_stale(args.stale_minutes)
+    if stale:
+        print(f"Requeued {stale} job(s) left running by a stopped worker")
+
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    worker = Worker(args)
+    done = failed = 0
+    try:
+        while args.limit is None or done + failed < args.limit:
+            job = claim(name, args.max_attempts)
+            if job is None:
+                break
+            print(f"\n=== {job['job_key']} from {job['stage']} (attempt {job['attempts']})")
+            if run_job(worker, job):
+                done += 1
+            else:
+                failed += 1
+    finally:
+        worker.close()
+        if done:
+            refresh_stats()
+    return done, failed
+
+def print_status() -> None:
+    with gasser_db.transaction() as cur:
+        cur.execute(STATUS_SQL)
+        counts = cur.fetchall()
+        cur.execute(FAILED_SQL, (20,))
+        failures = cur.fetchall()
+        cur.execute(TIMINGS_SQL)
+        timings = [json.loads(t) for (t,) in cur.fetchall()]
+
+    print(f"{'status':<8}  {'stage':<10}  {'jobs':>6}  {'max attempts':>12}")
+    for stage, status, count, attempts in counts:
+        print(f"{status:<8}  {stage:<10}  {count:>6}  {attempts:>12}")
+    if timings:
+        print("\nMean seconds per stage (done jobs):")
+        for name in STAGE_NAMES:
+            values = [t[name] for t in timings if name in t]
+            if values:
+                print(f"  {name:<10} {sum(values) / len(values):8.2f}")
+    if failures:
+        print("\nFailed:")
+        for job_key, stage, attempts, error in failures:
+            print(f"  {job_key}  {stage}  attempts={attempts}  {error}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Durable fill-up job queue with per-stage resume and retries.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    eq = sub.add_parser("enqueue", help="Add the jobs from pair_images.py")
+    eq.add_argument("jobs", help="Fill-up jobs JSONL (pair_images.py --jobs-out)")
+
+    wp = sub.add_parser("work", help="Claim and run jobs until the queue is empty")
+    wp.add_argument("--thumbnails", default="images_thumbnails", help="Thumbnail folder (one sub-folder per job)")
+    wp.add_argument("--store", default=metadata_store.DEFAULT_STORE, help="SQLite metadata store")
+    wp.add_argument("--runner", choices=["local", "chatgpt"], default="local",
+                    help="LM Studio (run_vision_query_locally.py) or OpenAI (run_vision_query_chatgpt.py)")
+    wp.add_argument("--model", default="gpt-4o-mini", help="OpenAI model for --runner chatgpt")
+    wp.add_argument("--mosaic", action="store_true",
+                    help="--runner local: one request per fill-up, the displays tiled into one image")
+    image_quality.add_arguments(wp)
+    wp.add_argument("--email", default="your_email@example.com", help="Contact email for Nominatim User-Agent")
+    wp.add_argument("--rate-sec", type=float, default=1.0, help="Delay between reverse geocode calls (seconds)")
+    wp.add_argument("--no-geo", action="store_true", help="Skip reverse geocoding")
+    wp.add_argument("--max-attempts", type=int, default=3, help="Attempts before a job stays failed (default: 3)")
+    wp.add_argument("--stale-minutes", type=float, default=30.0,
+                    help="Requeue running jobs with no stage progress for this long (default: 30)")
+    wp.add_argument("--limit", type=int, default=None, help="Stop after this many jobs")
+
+    sub.add_parser("status", help="Jobs per stage and status, stage timings and failures")
+
+    rp = sub.add_parser("retry", help="Reset failed jobs so they run again")
+    rp.add_argument("--job", default=None, help="Only this job key")
+    args = ap.parse_args()
+
+    with gasser_db.exit_on_db_error():
+        ensure_table()
+        if args.command == "enqueue":
+            with open(args.jobs, "r", encoding="utf-8") as f:
+                jobs = [json.loads(line) for line in f if line.strip()]
+            print(f"Enqueued {enqueue(jobs)} of {len(jobs)} jobs")
+        elif args.command == "work":
+            done, failed = work(args)
+            print(f"\n{done} done, {failed} failed")
+        elif args.command == "status":
+            print_status()
+        elif args.command == "retry":
+            print(f"Reset {retry_failed(args.job)} failed job(s)")
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+llm_ledger.py
+-------------
+Every vision model call, as measured: the llm_calls table holds one row per
+chat.completions request from either runner, with its real token usage
+(resp.usage), latency, model, image count and cost, linked to the fuel reading
+it produced.
+
+- call(): context manager around chat.completions.create; records the row (also
+  for failed calls) and the llm_request_seconds timer of metrics.py
+- cost_usd is the token cost at image_cost_batch.PRICES (OpenAI bills the images
+  as prompt tokens); estimated_usd is what image_cost_batch.py's per-megapixel
+  estimate says for the same images and prompt; local models cost 0
+- link_readings(): sets reading_id on calls whose images became a fuel reading
+  by file name equality through the llm_call_files table; link_reading() does it
+  for one new reading (write_results_sql.py calls it after every insert)
+- The ledger never stops inference: if the table cannot be written, a warning is
+  printed once and the run goes on (GASSER_LLM_LEDGER=0 turns it off)
+
+Usage:
+  python llm_ledger.py create
+  python llm_ledger.py report                    # actual vs estimated cost, tokens and latency per model
+  python llm_ledger.py report --since 2025-08-01 --by day
+  python llm_ledger.py recent --limit 20
+  python llm_ledger.py link                      # link older calls to their readings
+"""
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import gasser_db
+import metrics
+import profiling
+
+ENABLED = os.environ.get("GASSER_LLM_LEDGER", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# No foreign key: fuel_readings partitioned by year has a (id, fill_time) primary key.
+# llm_call_files has one row per image base name of a call, so calls are linked to
+# readings with an indexed equality join instead of matching the files JSON.
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id INT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    called_at         TIMESTAMPTZ NOT NULL DEFAULT now(),
+    runner            TEXT NOT NULL,
+    model             TEXT NOT NULL,
+    mode              TEXT,
+    files             TEXT NOT NULL,
+    images            INTEGER NOT NULL,
+    billable_mp       REAL,
+    prompt_tokens     INTEGER,
+    completion_tokens INTEGER,
+    latency_ms        REAL NOT NULL,
+    cost_usd          DOUBLE PRECISION,
+    estimated_usd     DOUBLE PRECISION,
+    status            TEXT NOT NULL,
+    error             TEXT,
+    reading_id        INTEGER
+);
+CREATE INDEX IF NOT EXISTS llm_calls_called_at_idx ON llm_calls (called_at);
+CREATE INDEX IF NOT EXISTS llm_calls_reading_idx ON llm_calls (reading_id);
+CREATE TABLE IF NOT EXISTS llm_call_files (
+    call_id   INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    PRIMARY KEY (call_id, file_name)
+);
+CREATE INDEX IF NOT EXISTS llm_call_files_file_name_idx ON llm_call_files (file_name);
+"""
+
+SQLITE_CREATE_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    called_at         TIMESTAMPTZ NOT NULL DEFAULT ({gasser_db.NOW_SQL}),
+    runner            TEXT NOT NULL,
+    model             TEXT NOT NULL,
+    mode              TEXT,
+    files             TEXT NOT NULL,
+    images            INTEGER NOT NULL,
+    billable_mp       REAL,
+    prompt_tokens     INTEGER,
+    completion_tokens INTEGER,
+    latency_ms        REAL NOT NULL,
+    cost_usd          REAL,
+    estimated_usd     REAL,
+    status            TEXT NOT NULL,
+    error             TEXT,
+    reading_id        INTEGER
+);
+CREATE INDEX IF NOT EXISTS llm_calls_called_at_idx ON llm_calls (called_at);
+CREATE INDEX IF NOT EXISTS llm_calls_reading_idx ON llm_calls (reading_id);
+CREATE TABLE IF NOT EXISTS llm_call_files (
+    call_id   INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    PRIMARY KEY (call_id, file_name)
+);
+CREATE INDEX IF NOT EXISTS llm_call_files_file_name_idx ON llm_call_files (file_name);
+"""
+
+INSERT_CALL_SQL = """
+INSERT INTO llm_calls (called_at, runner, model, mode, files, images, billable_mp, prompt_tokens,
+                       completion_tokens, latency_ms, cost_usd, estimated_usd, status, error)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+RETURNING id
+"""
+
+INSERT_FILES_SQL = "INSERT INTO llm_call_files (call_id, file_name) VALUES %s"
+
+# Calls recorded before llm_call_files existed (WHERE true: SQLite's INSERT ... SELECT ... ON CONFLICT)
+BACKFILL_FILES_SQL = """
+INSERT INTO llm_call_files (call_id, file_name)
+SELECT c.id, f.name
+FROM llm_calls AS c, json_array_elements_text(c.files::json) AS f(name)
+WHERE true
+ON CONFLICT DO NOTHING
+"""
+
+SQLITE_BACKFILL_FILES_SQL = """
+INSERT INTO llm_call_files (call_id, file_name)
+SELECT c.id, f.value
+FROM llm_calls AS c, json_each(c.files) AS f
+WHERE true
+ON CONFLICT DO NOTHING
+"""
+
+LINK_READINGS_SQL = """
+UPDATE llm_calls SET reading_id = r.id
+FROM llm_call_files AS f, fuel_readings AS r
+WHERE llm_calls.reading_id IS NULL
+  AND f.call_id = llm_calls.id
+  AND f.file_name NOT IN ('', 'not found')
+  AND (r.odometer_file = f.file_name OR r.gaspump_file = f.file_name)
+"""
+
+# One new reading: only the calls that read its two photos
+LINK_READING_SQL = """
+UPDATE llm_calls SET reading_id = (
+    SELECT id FROM fuel_readings
+    WHERE odometer_file = %(odometer_file)s OR gaspump_file = %(gaspump_file)s
+    ORDER BY id DESC
+    LIMIT 1
+)
+WHERE reading_id IS NULL
+  AND id IN (SELECT call_id FROM llm_call_files WHERE file_name IN (%(odometer_file)s, %(gaspump_file)s))
+"""
+
+REPORT_SQL = """
+SELECT {group_by}, runner, model, status, images, billable_mp, prompt_tokens, completion_tokens,
+       latency_ms, cost_usd, estimated_usd, reading_id
+FROM llm_calls
+WHERE called_at >= %s
+ORDER BY called_at
+"""
+
+RECENT_SQL = """
+SELECT id, called_at, runner, model, mode, images, prompt_tokens, completion_tokens,
+       latency_ms, cost_usd, estimated_usd, status, reading_id
+FROM llm_calls
+ORDER BY id DESC
+LIMIT %s
+"""
+
+_table_ready = False
+_disabled_reason: Optional[str] = None
+
+
+########################
+def ensure_table(cur) -> None:
+    gasser_db.execute_script(cur, SQLITE_CREATE_TABLE_SQL if gasser_db.SQLITE else CREATE_TABLE_SQL)
+
+def ensure_table_once(cur) -> None:
+    """ensure_table() on the first use in this process, not on every insert."""
+    global _table_ready
+    if not _table_ready:
+        ensure_table(cur)
+        _table_ready = True
+
+def backfill_files(cur) -> int:
+    cur.execute(SQLITE_BACKFILL_FILES_SQL if gasser_db.SQLITE else BACKFILL_FILES_SQL)
+    return cur.rowcount
+
+def token_cost(model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Optional[float]:
+    from image_cost_batch import PRICES
+
+    prices = PRICES.get(model)
+    if prices is None or prompt_tokens is None:
+        return None
+    return (prompt_tokens / 1000 * prices["input_per_1k"]
+            + (completion_tokens or 0) / 1000 * prices["output_per_1k"])
+
+def estimate(model: str, image_paths: Sequence[str], prompt_text: str):
+    """(billable megapixels, image_cost_batch.py's estimate for this call or None)."""
+    from image_cost_batch import PRICES, billable_mp, count_tokens
+    from PIL import Image
+
+    mp = 0.0
+    for path in image_paths:
+        try:
+            with Image.open(path) as im:
+                mp += billable_mp(*im.size)[1]
+        except OSError:
+            pass
+    prices = PRICES.get(model)
+    if prices is None:
+        return round(mp, 1), None
+    # the estimator prices each image plus the prompt's tokens, with no output tokens
+    return round(mp, 1), mp * prices["image_per_mp"] + count_tokens(prompt_text, model) / 1000 * prices["input_per_1k"]
+
+def record(row: Dict[str, Any]) -> None:
+    global _disabled_reason
+    if not ENABLED or _disabled_reason:
+        return
+    try:
+        with gasser_db.transaction() as cur:
+            ensure_table_once(cur)
+            cur.execute(INSERT_CALL_SQL, (
+                row["called_at"], row["runner"], row["model"], row["mode"], json.dumps(row["files"]),
+                row["images"], row["billable_mp"], row["prompt_tokens"], row["completion_tokens"],
+                row["latency_ms"], row["cost_usd"], row["estimated_usd"], row["status"], row["error"],
+            ))
+            call_id = cur.fetchone()[0]
+            names = dict.fromkeys(row["files"])
+            if names:
+                gasser_db.execute_values(cur, INSERT_FILES_SQL, [(call_id, name) for name in names])
+    except (gasser_db.DB_ERRORS + (SystemExit,)) as e:
+        # the ledger is bookkeeping; a missing database must not cost a model answer
+        _disabled_reason = str(e).strip()
+        print(f"⚠️  LLM ledger disabled for this run: {_disabled_reason}")
+
+class Call:
+    def __init__(self):
+        self.response = None
+
+@contextmanager
+def call(runner: str, model: str, image_paths: Sequence[str], prompt_text: str = "",
+         mode: Optional[str] = None) -> Iterator[Call]:
+    """Time one chat.completions request; set .response inside the block so its usage is recorded."""
+    c = Call()
+    called_at = datetime.now(timezone.utc)
+    t0 = time.perf_counter()
+    error = None
+    try:
+        yield c
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        latency = time.perf_counter() - t0
+        labels = {"runner": runner, "model": model, **({"mode": mode} if mode else {})}
+        metrics.observe("llm_request_seconds", latency, **labels)
+        if error:
+            metrics.count("llm_request_errors_total", **labels)
+
+        usage = getattr(c.response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if prompt_tokens is not None:
+            metrics.count("llm_prompt_tokens_total", prompt_tokens, runner=runner, model=model)
+            metrics.count("llm_completion_tokens_total", completion_tokens or 0, runner=runner, model=model)
+        if ENABLED and not _disabled_reason:
+            try:
+                mp, estimated = estimate(model, image_paths, prompt_text)
+            except ImportError:
+                mp, estimated = None, None
+            record({
+                "called_at": called_at,
+                "runner": runner,
+                "model": model,
+                "mode": mode,
+                "files": [os.path.basename(p) for p in image_paths],
+                "images": len(image_paths),
+                "billable_mp": mp,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "latency_ms": round(latency * 1000, 1),
+                # a local model has no per-token price
+                "cost_usd": 0.0 if runner == "local" else token_cost(model, prompt_tokens, completion_tokens),
+                "estimated_usd": estimated,
+                "status": "error" if error else "ok",
+                "error": error,
+            })
+
+def link_readings() -> int:
+    """Link unlinked calls to the reading made from their images. Returns the calls linked."""
+    if not ENABLED:
+        return 0
+    try:
+        with gasser_db.transaction() as cur:
+            ensure_table_once(cur)
+            cur.execute(LINK_READINGS_SQL)
+            return cur.rowcount
+    except (gasser_db.DB_ERRORS + (SystemExit,)) as e:
+        print(f"⚠️  LLM calls not linked to readings: {str(e).strip()}")
+        return 0
+
+def link_reading(odometer_file: Optional[str], gaspump_file: Optional[str]) -> int:
+    """Link the unlinked calls that read the photos of one reading. Returns the calls linked."""
+    params = {"odometer_file": None, "gaspump_file": None}
+    for key, name in (("odometer_file", odometer_file), ("gaspump_file", gaspump_file)):
+        if name not in (None, "", "not found"):
+            params[key] = os.path.basename(name)
+    if not ENABLED or not any(params.values()):
+        return 0
+    try:
+        with gasser_db.transaction() as cur:
+            ensure_table_once(cur)
+            cur.execute(LINK_READING_SQL, params)
+            return cur.rowcount
+    except (gasser_db.DB_ERRORS + (SystemExit,)) as e:
+        print(f"⚠️  LLM calls not linked to readings: {str(e).strip()}")
+        return 0
+
+########################
+def report(since: datetime, by: str) -> None:
+    group_by = {"model": "''", "day": "substr(CAST(called_at AS TEXT), 1, 10)"}[by]
+    with gasser_db.transaction() as cur:
+        ensure_table(cur)
+        cur.execute(REPORT_SQL.format(group_by=group_by), (since,))
+        rows = cur.fetchall()
+    if not rows:
+        print("No LLM calls recorded")
+        return
+
+    groups: Dict[tuple, List[tuple]] = {}
+    for row in rows:
+        groups.setdefault((row[0], row[1], row[2]), []).append(row)
+
+    print(f"{'day':<11}" if by == "day" else "", end="")
+    print(f"{'runner':<8} {'model':<30} {'calls':>5} {'err':>4} {'imgs':>5} "
+          f"{'prompt/img':>10} {'compl/call':>10} {'p50 ms':>8} {'p95 ms':>8} {'actual $':>10} {'estimate $':>10} {'act/est':>7}")
+    for (day, runner, model), calls in groups.items():
+        ok = [c for c in calls if c[3] == "ok"]
+        images = sum(c[4] for c in ok)
+        prompt = [c[6] for c in ok if c[6] is not None]
+        completion = [c[7] for c in ok if c[7] is not None]
+        latencies = sorted(c[8] for c in ok)
+        actual = [c[9] for c in calls if c[9] is not None]
+        estimated = [c[10] for c in calls if c[10] is not None]
+        actual_sum, estimate_sum = sum(actual), sum(estimated)
+        ratio = f"{actual_sum / estimate_sum:7.2f}" if actual and estimate_sum else f"{'-':>7}"
+        print(f"{day + ' ' if by == 'day' else ''}{runner:<8} {model[:30]:<30} {len(calls):>5} {len(calls) - len(ok):>4} "
+              f"{images:>5} {sum(prompt) / max(1, images):>10.0f} {sum(completion) / max(1, len(completion)):>10.0f} "
+              f"{metrics.quantile(latencies, 0.5) if latencies else float('nan'):>8.0f} "
+              f"{metrics.quantile(latencies, 0.95) if latencies else float('nan'):>8.0f} "
+              f"{actual_sum:>10.4f} {estimate_sum:>10.4f} {ratio}")
+
+    linked = sum(1 for r in rows if r[11] is not None)
+    readings = len({r[11] for r in rows if r[11] is not None})
+    print(f"\n{len(rows)} calls, {linked} linked to {readings} readings")
+    total = sum(r[9] for r in rows if r[9] is not None)
+    if readings:
+        per_reading = sum(r[9] for r in rows if r[9] is not None and r[11] is not None) / readings
+        print(f"Actual cost: ${total:.4f} total, ${per_reading:.4f} per reading")
+
+def recent(limit: int) -> None:
+    with gasser_db.transaction() as cur:
+        ensure_table(cur)
+        cur.execute(RECENT_SQL, (limit,))
+        rows = cur.fetchall()
+    for (id, called_at, runner, model, mode, images, prompt, completion, latency, cost, estimated, status, reading) in rows:
+        when = called_at.isoformat(timespec="seconds") if isinstance(called_at, datetime) else str(called_at)
+        cost_text = "-" if cost is None else f"${cost:.5f}"
+        estimate_text = "-" if estimated is None else f"${estimated:.5f}"
+        print(f"{id:>6} {when} {runner:<7} {model:<28} {mode or '':<6} imgs={images} tokens={prompt}/{completion} "
+              f"{latency:.0f}ms {cost_text} (est {estimate_text}) {status} reading={reading}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Token usage, latency and cost of every vision model call.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("create", help="Create the llm_calls table")
+    rp = sub.add_parser("report", help="Actual vs estimated cost, tokens and latency per runner and model")
+    rp.add_argument("--since", type=datetime.fromisoformat, default=datetime(1970, 1, 1),
+                    help="Only calls from this date (YYYY-MM-DD)")
+    rp.add_argument("--by", choices=["model", "day"], default="model", help="Group per model, or per day and model")
+    cp = sub.add_parser("recent", help="The latest calls")
+    cp.add_argument("--limit", type=int, default=20)
+    sub.add_parser("link", help="Link calls to the readings made from their images")
+    args = ap.parse_args()
+
+    with gasser_db.exit_on_db_error():
+        if args.command == "create":
+            with gasser_db.transaction() as cur:
+                ensure_table(cur)
+                filled = backfill_files(cur)
+            print(f"Tables llm_calls and llm_call_files ({filled} file rows backfilled)")
+        elif args.command == "report":
+            since = args.since if args.since.tzinfo else args.since.replace(tzinfo=timezone.utc)
+            report(since, args.by)
+        elif args.command == "recent":
+            recent(args.limit)
+        elif args.command == "link":
+            with gasser_db.transaction() as cur:
+                ensure_table(cur)
+                backfill_files(cur)
+            print(f"Linked {link_readings()} call(s)")
+
+if __name__ == "__main__":
+    profiling.run(main)
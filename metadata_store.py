@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+metadata_store.py
+-----------------
+Incremental manifest of image EXIF metadata, kept in a small SQLite file.
+
+- One row per image, keyed by absolute path, with the file size and mtime
+  that were current when the EXIF was extracted
+- exif_to_json_and_csv.py only re-extracts images whose size/mtime changed
+- image_metadata_full.json / .csv / .jsonl are materialized from the store,
+  after dropping entries whose image file no longer exists
+
+Usage:
+  python metadata_store.py export --json-out image_metadata_full.json --csv-out image_metadata_full.csv
+  python metadata_store.py lookup 2025-08-18T18-49-56+00-00_IMG_5798.jpg
+  python metadata_store.py prune
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import profiling
+
+DEFAULT_STORE = "image_metadata.sqlite"
+
+# EXIF tags extracted per image (exif_to_json_and_csv.py)
+DEFAULT_FIELDS = [
+    "File:FileName",
+    "EXIF:DateTimeOriginal",
+    "EXIF:Make",
+    "EXIF:Model",
+    "EXIF:LensModel",
+    "EXIF:ISO",
+    "EXIF:ShutterSpeedValue",
+    "EXIF:ApertureValue",
+    "EXIF:FocalLength",
+    "EXIF:ImageWidth",
+    "EXIF:ImageHeight",
+    "EXIF:GPSLongitudeRef",
+    "EXIF:GPSLatitudeRef",
+    "EXIF:GPSLatitude",
+    "EXIF:GPSLongitude",
+]
+
+# Column order of image_metadata_full.csv: the tags without their group prefix, then the derived fields
+CSV_COLUMNS = [tag.split(":")[-1] for tag in DEFAULT_FIELDS] + [
+    "GPSLatitudeFixed",
+    "GPSLongitudeFixed",
+    "Location",
+    "FilePath",
+]
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS image_metadata (
+    path       TEXT PRIMARY KEY,
+    file_name  TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    record     TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS image_metadata_file_name ON image_metadata (file_name);
+"""
+
+Signature = Tuple[int, int]
+
+# "2025-08-18T18-49-56+00-00_IMG_5798.jpg" (gasser.py / fix_date_attachement_files.py prefix)
+FILENAME_DATE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})T(\d{2})-(\d{2})-(\d{2})([+-]\d{2})-(\d{2})_")
+
+
+def open_store(store_path: str = DEFAULT_STORE) -> sqlite3.Connection:
+    conn = sqlite3.connect(store_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA_SQL)
+    return conn
+
+def open_store_if_exists(store_path: str = DEFAULT_STORE) -> Optional[sqlite3.Connection]:
+    return open_store(store_path) if os.path.exists(store_path) else None
+
+def store_key(file_path: str) -> str:
+    return os.path.normcase(os.path.abspath(file_path))
+
+def file_signature(file_path: str) -> Signature:
+    st = os.stat(file_path)
+    return st.st_size, st.st_mtime_ns
+
+def load_signatures(conn: sqlite3.Connection) -> Dict[str, Signature]:
+    """All known (size, mtime_ns) pairs in one query, keyed by store_key()."""
+    return {path: (size, mtime) for path, size, mtime in
+            conn.execute("SELECT path, size, mtime_ns FROM image_metadata")}
+
+def put_record(conn: sqlite3.Connection, file_path: str, signature: Signature, rec: Dict[str, Any]) -> None:
+    size, mtime_ns = signature
+    conn.execute(
+        """
+        INSERT INTO image_metadata (path, file_name, size, mtime_ns, record, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (path) DO UPDATE SET
+            file_name = excluded.file_name,
+            size = excluded.size,
+            mtime_ns = excluded.mtime_ns,
+            record = excluded.record,
+            updated_at = excluded.updated_at
+        """,
+        (store_key(file_path), os.path.basename(file_path), size, mtime_ns,
+         json.dumps(rec, ensure_ascii=False), time.time()),
+    )
+
+def iter_records(conn: sqlite3.Connection) -> Iterator[Dict[str, Any]]:
+    for (record,) in conn.execute("SELECT record FROM image_metadata ORDER BY path"):
+        yield json.loads(record)
+
+def find_by_filename(conn: sqlite3.Connection, file_name: str) -> Optional[Dict[str, Any]]:
+    """Indexed lookup of one image by its base file name."""
+    rows = conn.execute(
+        "SELECT path, record FROM image_metadata WHERE file_name = ?", (file_name,)
+    ).fetchall()
+    if len(rows) > 1:
+        raise ValueError(
+            f"Duplicate FileName found in store: {file_name}\n"
+            + "\n".join(f"  entry: {path}" for path, _ in rows)
+        )
+    return json.loads(rows[0][1]) if rows else None
+
+def prune_missing(conn: sqlite3.Connection) -> int:
+    """Drop entries whose image file no longer exists."""
+    gone = [(path,) for (path,) in conn.execute("SELECT path FROM image_metadata")
+            if not os.path.exists(path)]
+    conn.executemany("DELETE FROM image_metadata WHERE path = ?", gone)
+    conn.commit()
+    return len(gone)
+
+def exif_datetime(value: Any) -> Optional[datetime]:
+    """EXIF "YYYY:MM:DD HH:MM:SS" (no zone, treated as UTC like fix_date_attachement_files.py)."""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.strptime(value.strip(), "%Y:%m:%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def filename_datetime(file_name: Optional[str]) -> Optional[datetime]:
+    """Timestamp from the ISO date prefix that gasser.py puts on downloaded attachments."""
+    m = FILENAME_DATE_RE.match(os.path.basename(file_name or ""))
+    if not m:
+        return None
+    day, hh, mm, ss, tz_h, tz_m = m.groups()
+    try:
+        return datetime.fromisoformat(f"{day}T{hh}:{mm}:{ss}{tz_h}:{tz_m}")
+    except ValueError:
+        return None
+
+def fill_time_for(file_names: Iterable[Optional[str]], store: Optional[sqlite3.Connection] = None) -> Optional[datetime]:
+    """
+    When a fill-up happened: EXIF DateTimeOriginal of the first image found in the
+    store, else the Gmail date prefix of the first file name that has one.
+    """
+    names = [os.path.basename(n) for n in file_names if n]
+    if store is not None:
+        for name in names:
+            rec = find_by_filename(store, name)
+            taken = exif_datetime(rec.get("DateTimeOriginal")) if rec else None
+            if taken:
+                return taken
+    for name in names:
+        taken = filename_datetime(name)
+        if taken:
+            return taken
+    return None
+
+def export_json(conn: sqlite3.Connection, json_out: str) -> int:
+    records = list(iter_records(conn))
+    # Save JSON atomically
+    tmp_path = json_out + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, json_out)
+    return len(records)
+
+def export_csv(conn: sqlite3.Connection, csv_out: str) -> int:
+    count = 0
+    with open(csv_out, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_COLUMNS)
+        for rec in iter_records(conn):
+            writer.writerow([rec.get(col) for col in CSV_COLUMNS])
+            count += 1
+    return count
+
+def export_jsonl(conn: sqlite3.Connection, jsonl_out: str) -> int:
+    count = 0
+    with open(jsonl_out, "w", encoding="utf-8") as f:
+        for rec in iter_records(conn):
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def main():
+    ap = argparse.ArgumentParser(description="Query or export the incremental image metadata store.")
+    ap.add_argument("--store", default=DEFAULT_STORE, help=f"SQLite metadata store (default: {DEFAULT_STORE})")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="Materialize JSON/CSV/JSONL from the store")
+    exp.add_argument("--json-out", default="image_metadata_full.json", help="Output JSON file")
+    exp.add_argument("--csv-out", default="image_metadata_full.csv", help="Output CSV file")
+    exp.add_argument("--jsonl", default=None, help="Optional JSON Lines file (one JSON object per line)")
+
+    look = sub.add_parser("lookup", help="Print the metadata record for one file name")
+    look.add_argument("file_name")
+
+    sub.add_parser("prune", help="Remove entries whose image file no longer exists")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.store):
+        raise SystemExit(f"ERROR: Metadata store not found: {args.store}")
+
+    conn = open_store(args.store)
+    try:
+        if args.command == "export":
+            pruned = prune_missing(conn)
+            if pruned:
+                print(f"Removed {pruned} missing entries from {args.store}")
+            n = export_json(conn, args.json_out)
+            export_csv(conn, args.csv_out)
+            print(f"Exported {n} records to {args.json_out} and {args.csv_out}")
+            if args.jsonl:
+                export_jsonl(conn, args.jsonl)
+                print(f"Exported JSON Lines to {args.jsonl}")
+        elif args.command == "lookup":
+            rec = find_by_filename(conn, args.file_name)
+            if rec is None:
+                raise SystemExit(f"ERROR: {args.file_name} not found in {args.store}")
+            print(json.dumps(rec, indent=2, ensure_ascii=False))
+        elif args.command == "prune":
+            print(f"Removed {prune_missing(conn)} missing entries from {args.store}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+metrics.py
+----------
+Lightweight in-process instrumentation: counters, timers/histograms and
+per-stage throughput, exported as a JSON run summary and a Prometheus textfile.
+
+- count("geocode_errors_total")               counter
+- with timer("llm_request_seconds", runner=...)  histogram of durations
+- observe("payload_bytes", n)                 histogram of any value
+- with stage("thumbnails") as s: s.items += n  stage time, items and items/sec
+
+Histograms keep their raw observations (a run is at most a few thousand calls),
+so the summary reports exact p50 / p95.
+
+Nothing is written unless asked: --metrics-json / --metrics-prom on pipeline.py,
+stream_pipeline.py and watch_daemon.py, or set GASSER_METRICS_DIR and every
+script writes <dir>/run-<time>-<script>.json and <dir>/gasser.prom
+(node_exporter textfile collector format) when it exits.
+
+Usage:
+  python pipeline.py run --metrics-json run.json --metrics-prom /var/lib/node_exporter/gasser.prom
+  GASSER_METRICS_DIR=metrics python pipeline.py run
+  python metrics.py metrics/run-20250818T184956-pipeline.json     # print a summary
+"""
+import atexit
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+METRICS_DIR = os.environ.get("GASSER_METRICS_DIR")
+PREFIX = "gasser_"
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_counters: Dict[Key, float] = {}
+_histograms: Dict[Key, List[float]] = {}
+# stage -> [items, busy seconds, first start, last end]
+_stages: Dict[str, List[float]] = {}
+_started = time.time()
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def count(name: str, n: float = 1, **labels) -> None:
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + n
+
+def observe(name: str, value: float, **labels) -> None:
+    with _lock:
+        _histograms.setdefault(_key(name, labels), []).append(value)
+
+@contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """Time the block into histogram name; a block that raises also counts <name without _seconds>_errors_total."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        count(name.replace("_seconds", "") + "_errors_total", **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+def timed(name: str, **labels):
+    """Decorator form of timer()."""
+    def wrap(fn):
+        def inner(*args, **kwargs):
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        inner.__name__ = fn.__name__
+        inner.__doc__ = fn.__doc__
+        inner.__wrapped__ = fn
+        return inner
+    return wrap
+
+class StageRun:
+    def __init__(self, items: int):
+        self.items = items
+
+@contextmanager
+def stage(name: str, items: int = 0) -> Iterator[StageRun]:
+    """One run of a stage (or one item through it); set .items for throughput."""
+    run = StageRun(items)
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield run
+    except BaseException:
+        count("stage_errors_total", stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        observe("stage_seconds", elapsed, stage=name)
+        with _lock:
+            s = _stages.setdefault(name, [0, 0.0, start, start])
+            s[0] += run.items
+            s[1] += elapsed
+            s[2] = min(s[2], start)
+            s[3] = max(s[3], start + elapsed)
+
+def reset() -> None:
+    global _started
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _stages.clear()
+        _started = time.time()
+
+########################
+def quantile(sorted_values: List[float], q: float) -> float:
+    """Linear interpolation between closest ranks (numpy's default)."""
+    if not sorted_values:
+        return math.nan
+    pos = (len(sorted_values) - 1) * q
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+def _label_text(key: Key) -> str:
+    name, labels = key
+    return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+def summary() -> Dict[str, Any]:
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: sorted(v) for k, v in _histograms.items()}
+        stages = {k: list(v) for k, v in _stages.items()}
+
+    hist = {}
+    for key, values in histograms.items():
+        hist[_label_text(key)] = {
+            "count": len(values),
+            "sum": round(sum(values), 6),
+            "mean": round(sum(values) / len(values), 6),
+            "p50": round(quantile(values, 0.50), 6),
+            "p95": round(quantile(values, 0.95), 6),
+            "max": round(values[-1], 6),
+        }
+    stage_summary = {}
+    for name, (items, busy, first, last) in stages.items():
+        wall = last - first
+        stage_summary[name] = {
+            "items": int(items),
+            "busy_seconds": round(busy, 6),
+            "wall_seconds": round(wall, 6),
+            "items_per_sec": round(items / wall, 3) if wall > 0 else None,
+        }
+    return {
+        "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python",
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_started)),
+        "duration_seconds": round(time.time() - _started, 3),
+        "counters": {_label_text(k): v for k, v in counters.items()},
+        "histograms": hist,
+        "stages": stage_summary,
+    }
+
+def _prom_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def prometheus_text() -> str:
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: sorted(v) for k, v in _histograms.items()}
+        stages = {k: list(v) for k, v in _stages.items()}
+
+    lines = []
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            typed.add(name)
+        lines.append(f"{PREFIX}{name}{_prom_labels(labels)} {value}")
+    for (name, labels), values in sorted(histograms.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}{name} summary")
+            typed.add(name)
+        for q in (0.5, 0.95):
+            lines.append(f"{PREFIX}{name}{_prom_labels(labels, ('quantile', str(q)))} {quantile(values, q):.6f}")
+        lines.append(f"{PREFIX}{name}_sum{_prom_labels(labels)} {sum(values):.6f}")
+        lines.append(f"{PREFIX}{name}_count{_prom_labels(labels)} {len(values)}")
+    if stages:
+        lines.append(f"# TYPE {PREFIX}stage_items_per_second gauge")
+        for name, (items, _, first, last) in sorted(stages.items()):
+            rate = items / (last - first) if last > first else 0.0
+            lines.append(f'{PREFIX}stage_items_per_second{{stage="{name}"}} {rate:.3f}')
+    lines.append(f"# TYPE {PREFIX}last_run_timestamp_seconds gauge")
+    lines.append(f"{PREFIX}last_run_timestamp_seconds {time.time():.0f}")
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path: str, text: str) -> None:
+    # textfile collectors may read at any moment, so never expose a half-written file
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+def export(json_path: Optional[str] = None, prom_path: Optional[str] = None) -> None:
+    if json_path:
+        _write_atomic(json_path, json.dumps(summary(), indent=2))
+    if prom_path:
+        _write_atomic(prom_path, prometheus_text())
+
+def add_arguments(ap) -> None:
+    ap.add_argument("--metrics-json", default=None, metavar="PATH", help="Write a JSON run summary (timings, p50/p95, items/sec)")
+    ap.add_argument("--metrics-prom", default=None, metavar="PATH",
+                    help="Write Prometheus metrics for the node_exporter textfile collector (*.prom)")
+
+def export_args(args) -> None:
+    export(args.metrics_json, args.metrics_prom)
+
+def _export_at_exit() -> None:
+    with _lock:
+        empty = not (_counters or _histograms or _stages)
+    if empty:
+        return
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(_started))
+    export(os.path.join(METRICS_DIR, f"run-{stamp}-{script}.json"), os.path.join(METRICS_DIR, "gasser.prom"))
+
+if METRICS_DIR:
+    atexit.register(_export_at_exit)
+
+########################
+def print_summary(data: Dict[str, Any]) -> None:
+    print(f"{data['script']}  started {data['started']}  {data['duration_seconds']}s")
+    if data["stages"]:
+        print(f"\n{'stage':<14} {'items':>6} {'busy s':>9} {'items/s':>9}")
+        for name, s in data["stages"].items():
+            rate = "" if s["items_per_sec"] is None else f"{s['items_per_sec']:.3f}"
+            print(f"{name:<14} {s['items']:>6} {s['busy_seconds']:>9.3f} {rate:>9}")
+    if data["histograms"]:
+        print(f"\n{'timer':<48} {'count':>6} {'p50':>9} {'p95':>9} {'max':>9}")
+        for name, h in data["histograms"].items():
+            print(f"{name:<48} {h['count']:>6} {h['p50']:>9.4f} {h['p95']:>9.4f} {h['max']:>9.4f}")
+    if data["counters"]:
+        print()
+        for name, value in data["counters"].items():
+            print(f"{name:<48} {value:>6g}")
+
+def main():
+    if len(sys.argv) != 2:
+        raise SystemExit("Usage: python metrics.py <run summary .json>")
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        print_summary(json.load(f))
+
+if __name__ == "__main__":
+    main()
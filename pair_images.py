@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+pair_images.py
+--------------
+Group a backfill of mixed photos into fill-ups: the odometer and pump photos of
+one fill-up are taken minutes apart at the same station.
+
+- Every image in the metadata store gets a time (EXIF DateTimeOriginal, else the
+  Gmail date in its file name) and, when it has one, a GPS position
+- Images are sorted by time and swept once: an image joins the open group when
+  it is within --window minutes of the previous image and within --radius meters
+  of the group's first image with GPS; otherwise it starts a new group
+- Groups of --min-size or more images become one fill-up job (the model picks
+  the odometer and pump photo inside each job, as it does for attachments/);
+  single photos and images without a date are reported as unpaired
+
+Sorting is O(n log n) and the sweep O(n), so thousands of photos pair in one run.
+
+Usage:
+  python pair_images.py                                  # image_metadata.sqlite -> fillup_jobs.jsonl
+  python pair_images.py --metadata image_metadata_full.json --window 15 --radius 300
+  python pair_images.py --jobs-out jobs.jsonl --unpaired-out unpaired.txt
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import metadata_store
+import profiling
+
+DEFAULT_JOBS = "fillup_jobs.jsonl"
+EARTH_RADIUS_M = 6371000.0
+
+
+class Photo(NamedTuple):
+    taken_at: datetime
+    file_path: str
+    lat: Optional[float]
+    lng: Optional[float]
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def as_coord(val: Any) -> Optional[float]:
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+def photos_from_records(records: Iterable[Dict[str, Any]]) -> Tuple[List[Photo], List[str]]:
+    """(dated photos, paths of images without any date)."""
+    photos, undated = [], []
+    for rec in records:
+        file_path = rec.get("FilePath") or rec.get("FileName")
+        taken_at = (metadata_store.exif_datetime(rec.get("DateTimeOriginal"))
+                    or metadata_store.filename_datetime(rec.get("FileName") or file_path))
+        if taken_at is None:
+            undated.append(file_path)
+            continue
+        photos.append(Photo(taken_at, file_path,
+                            as_coord(rec.get("GPSLatitudeFixed")), as_coord(rec.get("GPSLongitudeFixed"))))
+    return photos, undated
+
+def sweep(photos: List[Photo], window_sec: float, radius_m: float, max_size: int) -> List[List[Photo]]:
+    """Sort by time and cut the sequence wherever the time gap or the distance gets too large."""
+    groups: List[List[Photo]] = []
+    current: List[Photo] = []
+    anchor: Optional[Photo] = None        # first photo of the group that has GPS
+
+    for photo in sorted(photos):
+        if current:
+            gap = (photo.taken_at - current[-1].taken_at).total_seconds()
+            far = (anchor is not None and photo.lat is not None and photo.lng is not None
+                   and haversine_m(anchor.lat, anchor.lng, photo.lat, photo.lng) > radius_m)
+            if gap > window_sec or far or len(current) >= max_size:
+                groups.append(current)
+                current, anchor = [], None
+        current.append(photo)
+        if anchor is None and photo.lat is not None and photo.lng is not None:
+            anchor = photo
+    if current:
+        groups.append(current)
+    return groups
+
+def job_key(group: List[Photo]) -> str:
+    """fillup-<first photo time>-<hash of the file names>: two groups can start in the same second."""
+    names = "\n".join(sorted(os.path.basename(p.file_path) for p in group))
+    digest = hashlib.sha1(names.encode("utf-8")).hexdigest()[:8]
+    return f"fillup-{group[0].taken_at.strftime('%Y%m%dT%H%M%S')}-{digest}"
+
+def job_for(group: List[Photo]) -> Dict[str, Any]:
+    located = [p for p in group if p.lat is not None and p.lng is not None]
+    first = group[0]
+    return {
+        "job": job_key(group),
+        "fill_time": first.taken_at.isoformat(),
+        "files": [p.file_path for p in group],
+        "file_names": [os.path.basename(p.file_path) for p in group],
+        "span_sec": int((group[-1].taken_at - first.taken_at).total_seconds()),
+        "lat": located[0].lat if located else None,
+        "lng": located[0].lng if located else None,
+        "distance_m": round(max((haversine_m(located[0].lat, located[0].lng, p.lat, p.lng)
+                                 for p in located), default=0.0), 1),
+    }
+
+def pair_records(records: Iterable[Dict[str, Any]], window_min: float, radius_m: float,
+                 min_size: int = 2, max_size: int = 4) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """(fill-up jobs, unpaired image paths)."""
+    photos, unpaired = photos_from_records(records)
+    jobs = []
+    for group in sweep(photos, window_min * 60, radius_m, max_size):
+        if len(group) >= min_size:
+            jobs.append(job_for(group))
+        else:
+            unpaired.extend(p.file_path for p in group)
+    return jobs, unpaired
+
+def load_records(source: str) -> List[Dict[str, Any]]:
+    if source.lower().endswith((".sqlite", ".db")):
+        store = metadata_store.open_store(source)
+        try:
+            return list(metadata_store.iter_records(store))
+        finally:
+            store.close()
+    with open(source, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_jobs(jobs: List[Dict[str, Any]], jobs_out: str) -> None:
+    with open(jobs_out, "w", encoding="utf-8") as f:
+        for job in jobs:
+            f.write(json.dumps(job, ensure_ascii=False) + "\n")
+
+def main():
+    ap = argparse.ArgumentParser(description="Pair odometer and pump photos into fill-up jobs by time and GPS.")
+    ap.add_argument("--metadata", default=None,
+                    help="image_metadata.sqlite or image_metadata_full.json (default: the store if present)")
+    ap.add_argument("--jobs-out", default=DEFAULT_JOBS, help=f"Fill-up jobs, one JSON object per line (default: {DEFAULT_JOBS})")
+    ap.add_argument("--unpaired-out", default=None, help="Optional file listing the images that were not paired")
+    ap.add_argument("--window", type=float, default=10.0, help="Max minutes between photos of one fill-up (default: 10)")
+    ap.add_argument("--radius", type=float, default=200.0, help="Max meters between photos of one fill-up (default: 200)")
+    ap.add_argument("--min-size", type=int, default=2, help="Photos needed for a fill-up (default: 2)")
+    ap.add_argument("--max-size", type=int, default=4, help="Most photos in one fill-up, retakes included (default: 4)")
+    args = ap.parse_args()
+
+    source = args.metadata
+    if source is None:
+        source = metadata_store.DEFAULT_STORE if os.path.exists(metadata_store.DEFAULT_STORE) else "image_metadata_full.json"
+    if not os.path.exists(source):
+        raise SystemExit(f"ERROR: Metadata not found: {source}")
+
+    records = load_records(source)
+    jobs, unpaired = pair_records(records, args.window, args.radius, args.min_size, args.max_size)
+    write_jobs(jobs, args.jobs_out)
+    if args.unpaired_out:
+        with open(args.unpaired_out, "w", encoding="utf-8") as f:
+            f.writelines(p + "\n" for p in unpaired)
+
+    print(f"Images:    {len(records)}")
+    print(f"Fill-ups:  {len(jobs)} -> {args.jobs_out}")
+    print(f"Unpaired:  {len(unpaired)}" + (f" -> {args.unpaired_out}" if args.unpaired_out else ""))
+
+if __name__ == "__main__":
+    profiling.run(main)
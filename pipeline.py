@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+pipeline.py
+-----------
+The dogasser.bat steps in one Python process: EXIF, thumbnails, near-duplicate
+removal, quality gate, cost estimate, inference, SQL write, MPG and location update.
+
+- Each stage is the importable function of its script, so the interpreter starts
+  and PIL / openai / psycopg2 / exiftool are imported once per run, not per step
+- Stages hand their results to the next one in memory (the results_llm dict, the
+  metadata store path); the database pool is shared by the three DB stages
+- results_llm.json and image_metadata_full.json / .csv are only written with
+  --checkpoint, and --results starts from a saved results_llm.json instead of
+  running inference again
+
+The stages form a small DAG. Each stage's fingerprint is a hash of its input
+files, the source of the code it runs, the options it reads and the
+fingerprints of the stages it depends on. A stage whose fingerprint matches the
+last successful run is skipped and its outputs are restored from the cache
+directory, so after a failure (or a change to compute_mpg.py) only the stages
+downstream of the change run again.
+
+Usage:
+  python pipeline.py run
+  python pipeline.py run --runner chatgpt --model gpt-4o-mini
+  python pipeline.py run --checkpoint --no-cost
+  python pipeline.py run --results results_llm.json      # skip EXIF/thumbnails/inference
+  python pipeline.py run --from mpg                       # re-run mpg and everything after it
+  python pipeline.py run --only write,mpg --dry-run       # show what would run
+"""
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import gasser_db
+import metadata_store
+import metrics
+import profiling
+from compute_mpg import recompute_mpg
+from fuel_stats import refresh_stats
+from read_update_metadata import update_reading_location
+from write_results_sql import reading_from_results, reading_id, write_llm_gauge_info_sql
+
+DEFAULT_CACHE_DIR = ".gasser_cache"
+RESULTS_FILE = "results_llm.json"
+METADATA_JSON = "image_metadata_full.json"
+METADATA_CSV = "image_metadata_full.csv"
+
+# Stage state passed from one stage to the next
+State = Dict[str, Any]
+
+
+########################
+def stage_metadata(args, state: State) -> int:
+    import exif_to_json_and_csv as exif
+
+    if not os.path.isdir(args.folder):
+        raise SystemExit(f"ERROR: Folder not found: {args.folder}")
+    files = exif.collect_files(args.folder, exif.DEFAULT_IMAGE_EXTENSIONS)
+    store = metadata_store.open_store(args.store)
+    try:
+        pending = exif.update_store(store, files, args.email, args.rate_sec, args.no_geo)
+        metadata_store.prune_missing(store)
+        if args.checkpoint:
+            metadata_store.export_json(store, METADATA_JSON)
+            metadata_store.export_csv(store, METADATA_CSV)
+    finally:
+        store.close()
+    print(f"{len(pending)} new/changed of {len(files)} images extracted into {args.store}")
+    return len(files)
+
+def stage_thumbnails(args, state: State) -> int:
+    from create_thumbnails import create_thumbnails
+
+    state["thumbnails"] = create_thumbnails(args.folder, args.thumbnails)
+    return len(state["thumbnails"])
+
+def stage_dedup(args, state: State) -> int:
+    from dedup_images import DUPLICATES_DIR, dedup_folder
+
+    kept, dupes = dedup_folder(args.thumbnails, args.dedup_distance)
+    for group in dupes:
+        print(f"{os.path.basename(group[0].path)}: kept over {len(group) - 1} near-duplicate(s)")
+    moved = sum(len(g) - 1 for g in dupes)
+    print(f"{len(kept)} distinct of {len(kept) + moved} thumbnails; duplicates in "
+          f"{os.path.join(args.thumbnails, DUPLICATES_DIR)}")
+    state["thumbnails"] = kept
+    return len(kept) + moved
+
+def stage_quality(args, state: State) -> int:
+    from image_quality import REJECTED_DIR, REPORT_FILE, gate_folder
+
+    passed, rejected = gate_folder(args.thumbnails)
+    for q in rejected:
+        print(f"⚠️  {os.path.basename(q.path)} not sent to the model: {'; '.join(q.reasons)}")
+    if rejected:
+        print(f"Rejected images and reasons: {os.path.join(args.thumbnails, REJECTED_DIR, REPORT_FILE)}")
+    print(f"{len(passed)} of {len(passed) + len(rejected)} thumbnails readable")
+    state["thumbnails"] = passed
+    return len(passed) + len(rejected)
+
+def stage_cost(args, state: State) -> None:
+    from image_cost_batch import estimate_dir
+
+    # only the thumbnails that go to the model, not the ones dedup set aside
+    estimate_dir(Path(args.thumbnails), Path(args.prompt_file).read_text(encoding="utf-8"), images=state["thumbnails"])
+
+def stage_analyze(args, state: State) -> int:
+    if args.runner == "chatgpt":
+        from run_vision_query_chatgpt import analyze_images
+        results = analyze_images(args.thumbnails, args.model)
+    else:
+        from run_vision_query_locally import analyze_images
+        results = analyze_images(args.thumbnails, mosaic=args.mosaic)
+
+    print(json.dumps(results, indent=2))
+    if args.checkpoint:
+        with open(RESULTS_FILE, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    state["results"] = results
+    return len(state.get("thumbnails") or ())
+
+def stage_write(args, state: State) -> None:
+    reading = reading_from_results(state["results"])
+    # a re-run (--from write, or after mpg failed) must not insert the same fill-up twice
+    id = reading_id(reading[0]) if reading[0] not in (None, "", "not found") else None
+    if id is not None:
+        print(f"⚠️  {reading[0]} is already in fuel_readings; not inserted again")
+    else:
+        id = write_llm_gauge_info_sql(*reading)
+    # mpg and location work on this reading, not on whichever row has the latest fill_time
+    state["reading_id"] = id
+    state["reading_files"] = [reading[0], reading[3]]
+
+def stage_mpg(args, state: State) -> None:
+    # a backfilled photo can be older than readings already in the table
+    changed = recompute_mpg(around_id=state["reading_id"])
+    print(f"MPG recomputed for {changed} readings around reading {state['reading_id']}")
+
+def stage_location(args, state: State) -> None:
+    update_reading_location(Path(args.store), state["reading_files"])
+    # the stats views read mpg and location, so they are refreshed once both are written
+    refresh_stats()
+
+########################
+# Stage DAG
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[Any, State], Optional[int]]                # returns the images it handled (None: one fill-up)
+    deps: Tuple[str, ...] = ()
+    code: Tuple[str, ...] = ()                                # modules whose source is fingerprinted
+    config: Tuple[str, ...] = ()                              # args the stage reads
+    inputs: Callable[[Any], List[str]] = lambda args: []      # files whose contents are fingerprinted
+    outputs: Tuple[str, ...] = ()                             # state keys restored from the cache
+
+def image_files(args) -> List[str]:
+    if not os.path.isdir(args.folder):
+        return []
+    return sorted(os.path.join(args.folder, n) for n in os.listdir(args.folder)
+                  if os.path.isfile(os.path.join(args.folder, n)))
+
+def runner_module(args) -> str:
+    return "run_vision_query_chatgpt" if args.runner == "chatgpt" else "run_vision_query_locally"
+
+# dogasser.bat order (a topological order of the DAG)
+STAGES: List[Stage] = [
+    Stage("metadata", stage_metadata, code=("exif_to_json_and_csv", "metadata_store"),
+          config=("folder", "store", "email", "no_geo", "checkpoint"), inputs=image_files),
+    Stage("thumbnails", stage_thumbnails, code=("create_thumbnails",),
+          config=("folder", "thumbnails"), inputs=image_files, outputs=("thumbnails",)),
+    Stage("dedup", stage_dedup, deps=("thumbnails",), code=("dedup_images",),
+          config=("thumbnails", "dedup_distance"), outputs=("thumbnails",)),
+    Stage("quality", stage_quality, deps=("thumbnails", "dedup"), code=("image_quality", "dedup_images"),
+          config=("thumbnails",), outputs=("thumbnails",)),
+    Stage("cost", stage_cost, deps=("thumbnails", "dedup", "quality"), code=("image_cost_batch",),
+          config=("prompt_file",), inputs=lambda args: [args.prompt_file]),
+    Stage("analyze", stage_analyze, deps=("thumbnails", "dedup", "quality"), code=(runner_module, "seven_segment_ocr"),
+          config=("runner", "model", "mosaic", "checkpoint"), outputs=("results",)),
+    Stage("write", stage_write, deps=("analyze", "metadata"), code=("write_results_sql", "gasser_db"),
+          outputs=("reading_id", "reading_files")),
+    Stage("mpg", stage_mpg, deps=("write",), code=("compute_mpg",)),
+    Stage("location", stage_location, deps=("write", "mpg", "metadata"), code=("read_update_metadata", "fuel_stats"),
+          config=("store",)),
+]
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+class StageCache:
+    """
+    <cache dir>/stages.json: fingerprint and outputs of each stage's last successful run.
+    <cache dir>/files.json:  sha256 of input files by path, reused while size and mtime match.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.dir = cache_dir
+        self.stages = self._load("stages.json")
+        self.files = self._load("files.json")
+
+    def _load(self, name: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.dir, name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, name: str, data: Dict[str, Any]) -> None:
+        os.makedirs(self.dir, exist_ok=True)
+        path = os.path.join(self.dir, name)
+        # Save JSON atomically
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def file_hash(self, path: str) -> str:
+        key = metadata_store.store_key(path)
+        try:
+            size, mtime_ns = metadata_store.file_signature(path)
+        except OSError:
+            return "missing"
+        known = self.files.get(key)
+        if known and known[0] == size and known[1] == mtime_ns:
+            return known[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        self.files[key] = [size, mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def done(self, name: str, fingerprint: str, state: State, outputs: Tuple[str, ...]) -> None:
+        self.stages[name] = {
+            "fingerprint": fingerprint,
+            "outputs": {key: state.get(key) for key in outputs},
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self._save("stages.json", self.stages)
+        self._save("files.json", self.files)
+
+def code_hash(module: str) -> str:
+    spec = importlib.util.find_spec(module)
+    if spec is None or not spec.origin:
+        return "missing"
+    with open(spec.origin, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def fingerprint(stage: Stage, args, cache: StageCache, upstream: Dict[str, str]) -> str:
+    modules = [m(args) if callable(m) else m for m in stage.code]
+    parts = {
+        "stage": inspect.getsource(stage.run),
+        "code": {m: code_hash(m) for m in modules},
+        "config": {key: getattr(args, key) for key in stage.config},
+        "inputs": {os.path.basename(p): cache.file_hash(p) for p in stage.inputs(args)},
+        "deps": {dep: upstream[dep] for dep in stage.deps},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def select_stages(args) -> Tuple[set, set]:
+    """(stages that may run, stages that must run) from --only / --from / --force / --no-cost / --results."""
+    allowed = set(STAGE_NAMES)
+    forced = set(STAGE_NAMES) if args.force else set()
+    if args.only:
+        allowed = set(args.only)
+    if args.from_stage:
+        downstream = set(STAGE_NAMES[STAGE_NAMES.index(args.from_stage):])
+        allowed &= downstream
+        forced |= downstream
+    if args.no_cost:
+        allowed.discard("cost")
+    if args.no_dedup:
+        allowed.discard("dedup")
+    if args.no_quality:
+        allowed.discard("quality")
+    if args.results:
+        allowed -= {"metadata", "thumbnails", "dedup", "quality", "cost", "analyze"}
+    return allowed, forced
+
+def run(args) -> State:
+    cache = StageCache(args.cache_dir)
+    allowed, forced = select_stages(args)
+    state: State = {}
+    fingerprints: Dict[str, str] = {}
+
+    if args.results:
+        with open(args.results, "r", encoding="utf-8") as f:
+            state["results"] = json.load(f)
+        # the saved results stand in for everything up to inference
+        fingerprints["analyze"] = cache.file_hash(args.results)
+        fingerprints["metadata"] = cache.file_hash(args.store) if os.path.exists(args.store) else "none"
+
+    started = time.perf_counter()
+    with gasser_db.exit_on_db_error():
+        for stage in STAGES:
+            if stage.name in fingerprints:
+                continue
+            fp = fingerprint(stage, args, cache, fingerprints)
+            fingerprints[stage.name] = fp
+            cached = cache.stages.get(stage.name)
+
+            if stage.name not in allowed:
+                # not selected: downstream stages use its last outputs, if it ever ran
+                if cached:
+                    fingerprints[stage.name] = cached["fingerprint"]
+                    state.update({k: v for k, v in cached["outputs"].items() if k not in state})
+                continue
+            if stage.name not in forced and cached and cached["fingerprint"] == fp:
+                print(f"=== {stage.name}: unchanged, skipped")
+                state.update({k: v for k, v in cached["outputs"].items() if k not in state})
+                continue
+            if args.dry_run:
+                print(f"=== {stage.name}: would run")
+                continue
+            missing = [key for dep in stage.deps for key in
+                       next(s for s in STAGES if s.name == dep).outputs if key not in state]
+            if missing:
+                raise SystemExit(f"ERROR: stage {stage.name} needs {', '.join(missing)}; "
+                                 f"run the stages before it first (no cached outputs)")
+
+            print(f"\n=== {stage.name} ===")
+            t0 = time.perf_counter()
+            with metrics.stage(stage.name) as m:
+                items = stage.run(args, state)
+                m.items = 1 if items is None else items
+            cache.done(stage.name, fp, state, stage.outputs)
+            print(f"--- {stage.name}: {time.perf_counter() - t0:.2f}s")
+    print(f"\nPipeline finished in {time.perf_counter() - started:.2f}s")
+    return state
+
+def stage_list(value: str) -> List[str]:
+    names = [n.strip() for n in value.split(",") if n.strip()]
+    unknown = [n for n in names if n not in STAGE_NAMES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown stage(s) {', '.join(unknown)}; choose from {', '.join(STAGE_NAMES)}")
+    return names
+
+########################
+def main():
+    ap = argparse.ArgumentParser(description="Run the whole gasser pipeline in one process.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    rp = sub.add_parser("run", help="EXIF, thumbnails, dedup, quality, cost, inference, SQL write, MPG and location")
+    rp.add_argument("--folder", default="./attachments", help="Folder with the downloaded images")
+    rp.add_argument("--thumbnails", default="images_thumbnails", help="Thumbnail folder sent to the model")
+    rp.add_argument("--store", default=metadata_store.DEFAULT_STORE, help="SQLite metadata store")
+    rp.add_argument("--prompt-file", default="prompt_file", help="Prompt used for the cost estimate")
+    rp.add_argument("--runner", choices=["local", "chatgpt"], default="local",
+                    help="LM Studio (run_vision_query_locally.py) or OpenAI (run_vision_query_chatgpt.py)")
+    rp.add_argument("--model", default="gpt-4o-mini", help="OpenAI model for --runner chatgpt")
+    rp.add_argument("--mosaic", action="store_true",
+                    help="--runner local: one request per fill-up, the displays tiled into one image")
+    rp.add_argument("--email", default="your_email@example.com", help="Contact email for Nominatim User-Agent")
+    rp.add_argument("--rate-sec", type=float, default=1.0, help="Delay between reverse geocode calls (seconds)")
+    rp.add_argument("--no-geo", action="store_true", help="Skip reverse geocoding")
+    rp.add_argument("--no-cost", action="store_true", help="Skip the cost estimate")
+    rp.add_argument("--no-dedup", action="store_true", help="Send near-duplicate photos to the model too")
+    rp.add_argument("--no-quality", action="store_true", help="Send blurred / dark / glary photos to the model too")
+    rp.add_argument("--dedup-distance", type=int, default=24,
+                    help="Most differing hash bits (of 256) for two photos to count as duplicates (default: 24)")
+    rp.add_argument("--checkpoint", action="store_true",
+                    help=f"Also write {RESULTS_FILE}, {METADATA_JSON} and {METADATA_CSV}")
+    rp.add_argument("--results", default=None, metavar="JSON",
+                    help="Start from a saved results_llm.json (skips EXIF, thumbnails, cost and inference)")
+    rp.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Stage cache (default: {DEFAULT_CACHE_DIR})")
+    sel = rp.add_mutually_exclusive_group()
+    sel.add_argument("--from", dest="from_stage", choices=STAGE_NAMES,
+                     help="Re-run this stage and every stage after it, even if unchanged")
+    sel.add_argument("--only", type=stage_list, metavar="STAGE[,STAGE]",
+                     help=f"Run only these stages ({', '.join(STAGE_NAMES)}), skipping unchanged ones")
+    rp.add_argument("--force", action="store_true", help="Run every selected stage even if unchanged")
+    rp.add_argument("--dry-run", action="store_true", help="Only show which stages would run")
+    metrics.add_arguments(rp)
+    args = ap.parse_args()
+
+    if args.command == "run":
+        try:
+            run(args)
+        finally:
+            metrics.export_args(args)
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+profiling.py
+------------
+--profile for every gasser script: run main() under cProfile and tracemalloc and
+write the reports to a directory of their own, without hand-wrapping anything.
+
+  profiles/<script>-<time>-<pid>/
+    profile.pstats    cProfile stats (python -m pstats, snakeviz, ...)
+    profile.txt       top functions by cumulative and by own time
+    allocations.txt   top allocation sites still holding memory at the end, and the traced peak
+    summary.json      wall / CPU time, peak RSS (this process and children such as
+                      exiftool or the thumbnail pool), traced peak, exit status
+
+Each script ends with profiling.run(main); the flag is taken out of sys.argv
+before main() parses its arguments, so it works with any argparse setup:
+
+  --profile              write under GASSER_PROFILE_DIR (default: profiles)
+  --profile=DIR          write under DIR
+
+GASSER_PROFILE_TOP sets how many functions / allocation sites are listed (default: 25).
+cProfile only sees the main thread (and the event loop, for the asyncio scripts);
+tracemalloc sees allocations from every thread. Module imports happen before
+main() and are not included.
+
+Usage:
+  python exif_to_json_and_csv.py --folder ./attachments --profile
+  python pipeline.py run --profile=/tmp/gasser-profiles
+  python -m pstats profiles/pipeline-20250818T184956-4242/profile.pstats
+"""
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+PROFILE_DIR = os.environ.get("GASSER_PROFILE_DIR", "profiles")
+TOP_N = int(os.environ.get("GASSER_PROFILE_TOP", "25"))
+
+
+def take_flag(argv) -> Tuple[Optional[str], list]:
+    """(profile directory or None, argv without --profile / --profile=DIR)."""
+    directory = None
+    rest = []
+    for arg in argv:
+        if arg == "--profile":
+            directory = PROFILE_DIR
+        elif arg.startswith("--profile="):
+            directory = arg.split("=", 1)[1] or PROFILE_DIR
+        else:
+            rest.append(arg)
+    return directory, rest
+
+########################
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    try:
+        import resource
+    except ImportError:
+        return {"self": _windows_peak_rss_mb(), "children": None}
+    # kilobytes on Linux, bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+def _windows_peak_rss_mb() -> Optional[float]:
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+    except (AttributeError, OSError):
+        return None
+
+def write_reports(run_dir: str, profiler, snapshot, traced_peak: int, summary: Dict) -> None:
+    import io
+    import pstats
+
+    profiler.dump_stats(os.path.join(run_dir, "profile.pstats"))
+    with open(os.path.join(run_dir, "profile.txt"), "w", encoding="utf-8") as f:
+        for order in ("cumulative", "tottime"):
+            buf = io.StringIO()
+            pstats.Stats(profiler, stream=buf).strip_dirs().sort_stats(order).print_stats(TOP_N)
+            f.write(f"==== top {TOP_N} by {order} ====\n{buf.getvalue()}\n")
+
+    stats = snapshot.statistics("lineno")
+    with open(os.path.join(run_dir, "allocations.txt"), "w", encoding="utf-8") as f:
+        f.write(f"traced peak: {traced_peak / (1024 * 1024):.2f} MB\n")
+        f.write(f"still allocated at exit: {sum(s.size for s in stats) / (1024 * 1024):.2f} MB "
+                f"in {sum(s.count for s in stats)} blocks\n\n")
+        f.write(f"==== top {TOP_N} allocation sites ====\n")
+        for s in stats[:TOP_N]:
+            frame = s.traceback[0]
+            f.write(f"{s.size / 1024:10.1f} KiB {s.count:8d} blocks  {frame.filename}:{frame.lineno}\n")
+
+    pstats_rows = pstats.Stats(profiler).sort_stats("cumulative")
+    top = []
+    for (filename, lineno, func) in pstats_rows.fcn_list[:TOP_N]:
+        cc, nc, tt, ct, _ = pstats_rows.stats[(filename, lineno, func)]
+        top.append({"function": f"{os.path.basename(filename)}:{lineno}({func})",
+                    "calls": nc, "own_seconds": round(tt, 6), "cumulative_seconds": round(ct, 6)})
+    summary["top_functions"] = top
+    with open(os.path.join(run_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+def run(main: Callable[[], None]) -> None:
+    """Call main(); with --profile on the command line, under cProfile and tracemalloc."""
+    directory, argv = take_flag(sys.argv)
+    sys.argv[:] = argv
+    if directory is None:
+        main()
+        return
+
+    import cProfile
+    import tracemalloc
+
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    run_dir = os.path.join(directory, f"{script}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}")
+    os.makedirs(run_dir, exist_ok=True)
+
+    status = 0
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    profiler.enable()
+    try:
+        main()
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        raise
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        profiler.disable()
+        wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+        snapshot = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss = peak_rss_mb()
+        write_reports(run_dir, profiler, snapshot, traced_peak, {
+            "script": script,
+            "argv": sys.argv[1:],
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - wall)),
+            "exit": status,
+            "wall_seconds": round(wall, 3),
+            "cpu_seconds": round(cpu, 3),
+            "peak_rss_mb": rss["self"],
+            "children_peak_rss_mb": rss["children"],
+            "traced_peak_mb": round(traced_peak / (1024 * 1024), 2),
+        })
+        print(f"Profile: {run_dir} (wall {wall:.2f}s, cpu {cpu:.2f}s, "
+              f"peak RSS {rss['self']} MB, traced peak {traced_peak / (1024 * 1024):.1f} MB)", file=sys.stderr)
@@ -8,6 +8,8 @@ from typing import Any, Dict, List, Optional
 import exiftool
 import requests
 
+import profiling
+
 # ---- Default configuration (can be overridden by CLI) ----
 DEFAULT_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".heic", ".png")
 DEFAULT_FIELDS = [
@@ -150,4 +152,4 @@ def main():
         print(f"   Also wrote JSON Lines to: {args.jsonl}")
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -3,6 +3,8 @@ import json
 import sys
 from pathlib import Path
 
+import profiling
+
 def main():
     # Default filename if not provided
     default_file = "results_llm.json"
@@ -39,4 +41,4 @@ def main():
     print(f"Gallons: {gas.get('bottom_value_gallons')}")
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -1,61 +1,105 @@
+import argparse
 import json
 import sys
 from pathlib import Path
 
-import sys
-import psycopg2
-from psycopg2 import sql
-from psycopg2.extras import DictCursor
-import os
-from dotenv import load_dotenv
+import gasser_db
+import metadata_store
+import profiling
+from fuel_stats import refresh_stats
+
+
+# The metadata's (file_name, lat, lng, location) rows are loaded into a temporary table a
+# page at a time (gasser_db.execute_values), so a batch of any size stays one UPDATE.
+CREATE_LOCATION_VALUES_SQL = """
+DROP TABLE IF EXISTS location_values;
+CREATE TEMP TABLE location_values (
+    file_name TEXT,
+    lat       DOUBLE PRECISION,
+    lng       DOUBLE PRECISION,
+    location  TEXT
+);
+"""
+
+INSERT_LOCATION_VALUES_SQL = "INSERT INTO location_values (file_name, lat, lng, location) VALUES %s"
+
+LOCATION_VALUES = "SELECT file_name, lat, lng, location FROM location_values"
 
+# Every metadata record joined to the reading it belongs to, in one statement.
+# The odometer photo wins when both photos of a reading have GPS. Each branch repeats the
+# unique indexes' predicate so the partial indexes can serve the join, and rows that already
+# hold these values are left alone, so re-running is a no-op.
+BATCH_UPDATE_LOCATION_SQL = f"""
+WITH v (file_name, lat, lng, location) AS ({LOCATION_VALUES}),
+matched AS (
+    SELECT DISTINCT ON (id) id, lat, lng, location
+    FROM (
+        SELECT r.id, v.lat, v.lng, v.location, 1 AS preference
+        FROM fuel_readings r JOIN v ON r.odometer_file = v.file_name
+        WHERE r.odometer_file NOT IN ('', 'not found')
+        UNION ALL
+        SELECT r.id, v.lat, v.lng, v.location, 2 AS preference
+        FROM fuel_readings r JOIN v ON r.gaspump_file = v.file_name
+        WHERE r.gaspump_file NOT IN ('', 'not found')
+    ) candidates
+    ORDER BY id, preference
+)
+UPDATE fuel_readings f
+SET lat = m.lat, lng = m.lng, location = m.location
+FROM matched m
+WHERE f.id = m.id
+  AND (f.lat, f.lng, f.location) IS DISTINCT FROM (m.lat, m.lng, m.location)
+"""
 
-load_dotenv();
+# The embedded SQLite backend has no DISTINCT ON or row-value IS DISTINCT FROM
+SQLITE_BATCH_UPDATE_LOCATION_SQL = f"""
+WITH v (file_name, lat, lng, location) AS ({LOCATION_VALUES}),
+matched AS (
+    SELECT id, lat, lng, location
+    FROM (
+        SELECT id, lat, lng, location,
+               ROW_NUMBER() OVER (PARTITION BY id ORDER BY preference) AS pick
+        FROM (
+            SELECT r.id, v.lat, v.lng, v.location, 1 AS preference
+            FROM fuel_readings r JOIN v ON r.odometer_file = v.file_name
+            WHERE r.odometer_file NOT IN ('', 'not found')
+            UNION ALL
+            SELECT r.id, v.lat, v.lng, v.location, 2 AS preference
+            FROM fuel_readings r JOIN v ON r.gaspump_file = v.file_name
+            WHERE r.gaspump_file NOT IN ('', 'not found')
+        )
+    )
+    WHERE pick = 1
+)
+UPDATE fuel_readings AS f
+SET lat = m.lat, lng = m.lng, location = m.location
+FROM matched AS m
+WHERE f.id = m.id
+  AND (f.lat IS NOT m.lat OR f.lng IS NOT m.lng OR f.location IS NOT m.location)
+"""
 
 
 
 ########################
-#def find_id_by_filename():
-PGHOST      = os.environ.get("PGHOST")
-PGUSER      = os.environ.get("PGUSER")
-PGPASSWORD  = os.environ.get("PGPASSWORD")  
-PGPORT      = os.environ.get("PGPORT")
-PGDATABASE  = os.environ.get("PGDATABASE")
-
-DB_CONFIG = {
-    "dbname": PGDATABASE,
-    "user":   PGUSER,
-    "password": PGPASSWORD,
-    "host": PGHOST,
-    "port": PGPORT
-    }
-    
 def find_id_by_filename():
-    query = "select * from fuel_readings order by id desc limit 2; "
+    """id and odometer file name of the newest reading."""
+    with gasser_db.transaction() as cur:
+        gasser_db.execute_prepared(cur, "latest_readings", gasser_db.LATEST_READINGS_SQL, (1,))
 
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.autocommit = True
-  
-        #server side cursor
-        cur = conn.cursor()
-        cur.execute(query)
-        
         #this is current gas fill up
         row = cur.fetchone()
 
-        if row:
-            id         = row[0]
-            file_name1 = row[1]
-  
-        # even though we autocommit .. a commit can't hurt
-        conn.commit()  # <-- Required to make changes permanent
+    if row:
+        id         = row[0]
+        file_name1 = row[1]
 
-    except psycopg2.Error as e:
-        print(f"PostgreSQL error: {e}")
-        sys.exit(1)
+    return id, file_name1
 
-    return id, file_name1, cur 
+
+def update_location(id, lat, lng, location):
+    with gasser_db.transaction() as cur:
+        gasser_db.execute_prepared(cur, "update_location", gasser_db.UPDATE_LOCATION_SQL,
+                                   (lat, lng, location, id))
 
 
 def load_image_metadata_as_dict(file_path):
@@ -76,59 +120,143 @@ def load_image_metadata_as_dict(file_path):
 
     return data_dict
 
-if __name__ == "__main__":
+
+def load_image_metadata_for(file_path, filename):
+    """Metadata for one filename: indexed lookup in the SQLite store, or a full JSON load."""
+    if file_path.suffix.lower() in (".sqlite", ".db"):
+        store = metadata_store.open_store(str(file_path))
+        try:
+            rec = metadata_store.find_by_filename(store, filename)
+        finally:
+            store.close()
+        return {filename: rec} if rec else {}
+    return load_image_metadata_as_dict(file_path)
+
+def iter_image_metadata(file_path):
+    """Every metadata record, from the SQLite store or the JSON export."""
+    if file_path.suffix.lower() in (".sqlite", ".db"):
+        store = metadata_store.open_store(str(file_path))
+        try:
+            yield from metadata_store.iter_records(store)
+        finally:
+            store.close()
+    else:
+        yield from load_image_metadata_as_dict(file_path).values()
+
+
+def location_values(records):
+    """(file_name, lat, lng, location) for every metadata record that has GPS."""
+    values = []
+    for rec in records:
+        lat = rec.get("GPSLatitudeFixed")
+        lng = rec.get("GPSLongitudeFixed")
+        if lat is None or lng is None:
+            continue
+        values.append((rec["FileName"], float(lat), float(lng), str(rec.get("Location"))))
+    return values
+
+
+def update_locations(values):
+    """Geotag the readings whose photos are in values, in one UPDATE. Returns rows changed."""
+    if not values:
+        return 0
+    with gasser_db.transaction() as cur:
+        gasser_db.execute_script(cur, CREATE_LOCATION_VALUES_SQL)
+        gasser_db.execute_values(cur, INSERT_LOCATION_VALUES_SQL, values)
+        cur.execute(SQLITE_BATCH_UPDATE_LOCATION_SQL if gasser_db.SQLITE else BATCH_UPDATE_LOCATION_SQL)
+        changed = cur.rowcount
+        cur.execute("DROP TABLE location_values")
+        return changed
+
+
+def update_reading_location(file_path, file_names):
+    """Geotag the reading whose photos are file_names (odometer photo first). Returns rows changed."""
+    records = []
+    for name in file_names:
+        if name in (None, "", "not found"):
+            continue
+        rec = load_image_metadata_for(file_path, name).get(name)
+        if rec:
+            records.append(rec)
+    return update_locations(location_values(records))
+
+
+def update_all_locations(file_path):
+    """Geotag every reading that has a matching image with GPS. Returns (images with GPS, rows changed)."""
+    values = location_values(iter_image_metadata(file_path))
+    return len(values), update_locations(values)
+
+
+def update_latest_location(json_file):
     # Read the Database to get the id and the filename to update
-    id, fn , cur = find_id_by_filename()
+    id, fn = find_id_by_filename()
 
-    # Get filename from command-line or use default
-    json_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("image_metadata_full.json")
+    image_metadata = load_image_metadata_for(json_file, fn)
+    print(f"Loaded {len(image_metadata)} records from {json_file}")
+    for filename, metadata in image_metadata.items():
+        print(f"File: {filename}")
+        print(f"  Location: {metadata['Location']}")
+        print(f"  GPSLatitudeFixed:  {metadata['GPSLatitudeFixed']}")
+        print(f"  GPSlongitudeFixed: {metadata['GPSLongitudeFixed']}")
 
-    if not json_file.exists():
-        print(f"Error: File '{json_file}' not found.")
-        sys.exit(1)
+        location = {metadata['Location']}
+        lat = {metadata['GPSLatitudeFixed']}
+        lng = {metadata['GPSLongitudeFixed']}
 
-    try:
-        image_metadata = load_image_metadata_as_dict(json_file)
-        print(f"Loaded {len(image_metadata)} records from {json_file}")
-        for filename, metadata in image_metadata.items():
-            print(f"File: {filename}")
-            print(f"  Location: {metadata['Location']}")
-            print(f"  GPSLatitudeFixed:  {metadata['GPSLatitudeFixed']}")
-            print(f"  GPSlongitudeFixed: {metadata['GPSLongitudeFixed']}")
-
-            location = {metadata['Location']}
-            lat = {metadata['GPSLatitudeFixed']}
-            lng = {metadata['GPSLongitudeFixed']}
-
-            if fn == filename:
-                print ("found it:")
-                print (id)
-                print (location)
-                print (lat)
-                print (lng)
-       
-                location = next(iter(location))  # get the single value from the set
-                location = str(location)       # ensure it's a string
+        if fn == filename:
+            print ("found it:")
+            print (id)
+            print (location)
+            print (lat)
+            print (lng)
    
-                lat = next(iter(lat))  # get the single value from the set
-                lat = float(lat)       # ensure it's a float
+            location = next(iter(location))  # get the single value from the set
+            location = str(location)       # ensure it's a string
 
-                lng = next(iter(lng))  # get the single value from the set
-                lng = float(lng)       # ensure it's a float
-   
+            lat = next(iter(lat))  # get the single value from the set
+            lat = float(lat)       # ensure it's a float
+
+            lng = next(iter(lng))  # get the single value from the set
+            lng = float(lng)       # ensure it's a float
 
 
-                #now lets update the lat,lng,location for  record id 
-                cur.execute("""
-                    UPDATE fuel_readings
-                    SET lat = %s , lng = %s, location = %s
-                    WHERE id = %s
-                   
-                """, (lat, lng,location,id))
 
+            #now lets update the lat,lng,location for  record id 
+            update_location(id, lat, lng, location)
 
 
+def main():
+    ap = argparse.ArgumentParser(description="Copy image GPS/location metadata into fuel_readings.")
+    ap.add_argument("metadata", nargs="?", default=None,
+                    help="image_metadata.sqlite or image_metadata_full.json (default: the store if present)")
+    ap.add_argument("--all", action="store_true",
+                    help="Update every reading with matching metadata in one batched statement")
+    args = ap.parse_args()
 
+    # Get filename from command-line or use default (the metadata store if there is one)
+    if args.metadata:
+        json_file = Path(args.metadata)
+    elif Path(metadata_store.DEFAULT_STORE).exists():
+        json_file = Path(metadata_store.DEFAULT_STORE)
+    else:
+        json_file = Path("image_metadata_full.json")
+
+    if not json_file.exists():
+        print(f"Error: File '{json_file}' not found.")
+        sys.exit(1)
+
+    try:
+        with gasser_db.exit_on_db_error():
+            if args.all:
+                matched, changed = update_all_locations(json_file)
+                print(f"{matched} images with GPS, {changed} readings updated")
+            else:
+                update_latest_location(json_file)
+            # fuel_stats_locations groups by location
+            refresh_stats()
 
     except ValueError as e:
         print("ERROR:", e)
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -3,9 +3,11 @@
 """
 llm_gauge_extractor.py (JSON-first version)
 ------------------------------------------
-- Sends ALL images in a directory to an OpenAI vision model
+- Sends ALL images in a directory to an OpenAI vision model, except the pump
+  displays seven_segment_ocr.py reads locally with confidence
 - Requests a STRICT JSON response first; falls back to text parsing if needed
-- Normalizes blank numeric fields to "0"
+- Blank, non-numeric or impossible-zero readings become null (NULL in
+  fuel_readings) and are listed under "unreadable" (write_results_sql.normalize_data)
 - Prints from normalized JSON and writes JSON to disk
 
 Usage:
@@ -23,6 +25,12 @@ from dotenv import load_dotenv
 from PIL import Image
 from openai import OpenAI, BadRequestError
 
+import llm_ledger
+import metrics
+import profiling
+import seven_segment_ocr
+from write_results_sql import normalize_data
+
 VALID_MODELS = {
     "gpt-4o",
     "gpt-4o-mini",
@@ -34,6 +42,8 @@ MODEL_DEFAULT = "gpt-4o-mini"
 DEFAULT_DIR = "images_thumbnails"
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
 
+_client: Optional[OpenAI] = None
+
 PROMPT_JSON = """You will receive a set of images with their file names.
 Identify the SINGLE best Odometer image (trip meter top, total mileage bottom) and the SINGLE best Gas Pump image (dollars top, gallons bottom).
 Return ONLY valid JSON with this structure:
@@ -80,7 +90,7 @@ Bottom value (gallons): <value or ''>
 """
 
 def encode_image_as_jpeg_data_uri(path: str) -> str:
-    with Image.open(path) as im:
+    with metrics.timer("image_encode_seconds"), Image.open(path) as im:
         im = im.convert("RGB")
         buf = BytesIO()
         im.save(buf, format="JPEG", quality=95)
@@ -109,8 +119,15 @@ def build_user_content(image_paths: List[str], prompt_text: str):
         content.append({"type": "image_url", "image_url": {"url": uri, "detail": "high"}})
     return content
 
+def get_client() -> OpenAI:
+    """One OpenAI client per process, so a long-running caller reuses its connections."""
+    global _client
+    if _client is None:
+        _client = OpenAI()
+    return _client
+
 def call_openai_json_first(image_paths: List[str], model: str) -> Dict:
-    client = OpenAI()
+    client = get_client()
 
     # 1) Try strict JSON mode
     try:
@@ -118,13 +135,15 @@ def call_openai_json_first(image_paths: List[str], model: str) -> Dict:
             {"role": "system", "content": "You are a precise vision assistant."},
             {"role": "user", "content": build_user_content(image_paths, PROMPT_JSON)},
         ]
-        resp = client.chat.completions.create(
-            model=model,
-            messages=msgs,
-            temperature=0.0,
-            response_format={"type": "json_object"},
-            max_tokens=800,
-        )
+        with llm_ledger.call("chatgpt", model, image_paths, PROMPT_JSON, mode="json") as call:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=msgs,
+                temperature=0.0,
+                response_format={"type": "json_object"},
+                max_tokens=800,
+            )
+            call.response = resp
         txt = resp.choices[0].message.content.strip()
         data = json.loads(txt)
         return data
@@ -140,12 +159,14 @@ def call_openai_json_first(image_paths: List[str], model: str) -> Dict:
         {"role": "system", "content": "You are a precise vision assistant. Follow the user's formatting exactly."},
         {"role": "user", "content": build_user_content(image_paths, PROMPT_FALLBACK_TEXT)},
     ]
-    resp = client.chat.completions.create(
-        model=model,
-        messages=msgs,
-        temperature=0.0,
-        max_tokens=900,
-    )
+    with llm_ledger.call("chatgpt", model, image_paths, PROMPT_FALLBACK_TEXT, mode="text") as call:
+        resp = client.chat.completions.create(
+            model=model,
+            messages=msgs,
+            temperature=0.0,
+            max_tokens=900,
+        )
+        call.response = resp
     text = resp.choices[0].message.content.strip()
     parsed = extract_json_from_text(text)
     parsed["raw_text"] = text
@@ -185,22 +206,34 @@ def extract_json_from_text(text: str) -> Dict[str, Dict[str, Optional[str]]]:
         },
     }
 
-def zero_if_blank(v: Optional[str]) -> str:
-    return "0" if (v is None or str(v).strip() == "") else str(v)
-
-def normalize_data(data: Dict) -> Dict:
-    # Ensure keys exist
-    data.setdefault("odometer_image", {})
-    data.setdefault("gas_pump_image", {})
-    # Normalize numeric fields
-    data["odometer_image"]["top_value_trip"] = zero_if_blank(data["odometer_image"].get("top_value_trip"))
-    data["odometer_image"]["bottom_value_total_mileage"] = zero_if_blank(data["odometer_image"].get("bottom_value_total_mileage"))
-    data["gas_pump_image"]["top_value_dollars"] = zero_if_blank(data["gas_pump_image"].get("top_value_dollars"))
-    data["gas_pump_image"]["bottom_value_gallons"] = zero_if_blank(data["gas_pump_image"].get("bottom_value_gallons"))
-    # Default file names if missing
-    data["odometer_image"]["file"] = data["odometer_image"].get("file") or "not found"
-    data["gas_pump_image"]["file"] = data["gas_pump_image"].get("file") or "not found"
-    return data
+def analyze_images(dir_path: str = DEFAULT_DIR, model: str = MODEL_DEFAULT) -> Dict:
+    """Send every image in dir_path in one request; returns the normalized results_llm dictionary."""
+    # Gather images
+    image_paths = list_images(dir_path)
+
+    # Pump displays the seven-segment decoder reads with confidence are not sent to the model
+    local = {p: r for p, r in ((p, seven_segment_ocr.confident_pump(p)) for p in image_paths) if r}
+    ask = [p for p in image_paths if p not in local]
+
+    # Call LLM (JSON-first)
+    data = call_openai_json_first(ask, model) if ask else {}
+    if local:
+        path, pump = max(local.items(), key=lambda item: item[1].confidence)
+        dollars, gallons = seven_segment_ocr.pump_values(pump)
+        data["gas_pump_image"] = {
+            "file": os.path.basename(path),
+            "top_value_dollars": dollars,
+            "bottom_value_gallons": gallons,
+        }
+        data["read_locally"] = [os.path.basename(p) for p in local]
+
+    # Attach metadata
+    data["input_files"] = [os.path.basename(p) for p in image_paths]
+    data["model"] = model
+    data["source_dir"] = os.path.abspath(dir_path)
+
+    # Normalize blanks / zeros -> null
+    return normalize_data(data)
 
 def main():
     ap = argparse.ArgumentParser()
@@ -219,19 +252,7 @@ def main():
     if not os.getenv("OPENAI_API_KEY"):
         raise SystemExit("ERROR: OPENAI_API_KEY not found. Put it in a .env file or set the environment variable.")
 
-    # Gather images
-    image_paths = list_images(args.dir)
-
-    # Call LLM (JSON-first)
-    data = call_openai_json_first(image_paths, args.model)
-
-    # Attach metadata
-    data["input_files"] = [os.path.basename(p) for p in image_paths]
-    data["model"] = args.model
-    data["source_dir"] = os.path.abspath(args.dir)
-
-    # Normalize blanks -> "0"
-    data = normalize_data(data)
+    data = analyze_images(args.dir, args.model)
 
     # Pretty print from normalized data
     if not args.no_pretty:
@@ -252,4 +273,4 @@ def main():
     print(f"\nWrote JSON to {args.json_out}")
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
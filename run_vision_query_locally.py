@@ -1,11 +1,27 @@
+import argparse
 import base64
-from openai import OpenAI
+import os
 import json 
 import re 
+from io import BytesIO
 from pathlib import Path
 
-# Point to your local LMStudio server
-client = OpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
+import llm_ledger
+import profiling
+import seven_segment_ocr
+from write_results_sql import normalize_data
+
+# Point to your local LMStudio server (LMSTUDIO_BASE_URL for another host, or the benchmark mock server)
+LMSTUDIO_BASE_URL = os.environ.get("LMSTUDIO_BASE_URL", "http://localhost:1234/v1")
+_client = None
+
+def get_client():
+    """One LM Studio client per process, made on first use; importing openai alone takes ~0.4 s."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(base_url=LMSTUDIO_BASE_URL, api_key="lm-studio")
+    return _client
 
 FIRST_PROMPT_TEXT = (
     "is this a fuel gauge with an odometer or is it a digital display showing fuel prices"
@@ -13,6 +29,19 @@ FIRST_PROMPT_TEXT = (
     "if it is a odometer I need you to return as json the odometer reading"
     )
 
+# --mosaic: the displays of all of a fill-up's photos in one image, one request
+MOSAIC_PROMPT_TEXT = (
+    "The image is {n} tiles side by side, numbered 1 to {n} from the left in the bar above each tile. "
+    "Each tile is the display from one photo: a car odometer (trip meter on top, total mileage below) "
+    "or a gas pump (dollars on top, gallons below). "
+    "Return ONLY this JSON, numbers as strings without $ or commas, '' when unreadable: "
+    '{"odometer": {"tile": <tile number or null>, "trip": "", "total_mileage": ""}, '
+    '"pump": {"tile": <tile number or null>, "dollars": "", "gallons": ""}}'
+    )
+MOSAIC_TILE = (512, 320)     # width, height of each display in the composite
+MOSAIC_LABEL = 40            # height of the numbered bar above each tile
+MOSAIC_BACKGROUND = (128, 128, 128)
+
 model="qwen/qwen2.5-7b-instruct-q8_0" # The model alias in LMStudio
 
 
@@ -63,24 +92,26 @@ def process_an_image(IMAGE_PATH,file):
         return # Exit if image couldn't be encoded
 
     try:
-        response = client.chat.completions.create(
-            model=model , # The model alias in LMStudio
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": FIRST_PROMPT_TEXT},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
+        with llm_ledger.call("local", model, [IMAGE_PATH], FIRST_PROMPT_TEXT, mode="single") as call:
+            response = get_client().chat.completions.create(
+                model=model , # The model alias in LMStudio
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": FIRST_PROMPT_TEXT},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/png;base64,{base64_image}"
+                                },
                             },
-                        },
-                    ],
-                }
-            ],
-            max_tokens=100, # Limit the length of the response
-        )
+                        ],
+                    }
+                ],
+                max_tokens=100, # Limit the length of the response
+            )
+            call.response = response
         
         # 2. Get the answer from the model's response
         answer = response.choices[0].message.content
@@ -125,38 +156,159 @@ def process_an_image(IMAGE_PATH,file):
     data_dict['file'] = file
     return data_dict
 
+################################################
+# --- Mosaic: one composite image per fill-up ---
+def crop_display(image_path):
+    """The photo cut down to the digits of its display, with a margin; the whole photo when none is found."""
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+    box = seven_segment_ocr.display_box(img)
+    if box:
+        left, top, right, bottom = box
+        mx, my = (right - left) // 10, (bottom - top) // 5
+        img = img.crop((max(0, left - mx), max(0, top - my), min(img.width, right + mx), min(img.height, bottom + my)))
+    return img
+
+def build_mosaic(image_paths):
+    """The displays side by side in MOSAIC_TILE cells, each under a bar with its number (1, 2, ...)."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = MOSAIC_TILE
+    mosaic = Image.new("RGB", (width * len(image_paths), MOSAIC_LABEL + height), MOSAIC_BACKGROUND)
+    draw = ImageDraw.Draw(mosaic)
+    font = ImageFont.load_default(size=MOSAIC_LABEL - 10)
+    for i, image_path in enumerate(image_paths):
+        tile = crop_display(image_path)
+        tile.thumbnail((width - 16, height - 16), Image.LANCZOS)
+        x = i * width
+        mosaic.paste(tile, (x + (width - tile.width) // 2, MOSAIC_LABEL + (height - tile.height) // 2))
+        draw.rectangle((x, 0, x + width - 1, MOSAIC_LABEL - 1), fill="white", outline="black")
+        draw.text((x + 10, 4), str(i + 1), fill="black", font=font)
+    return mosaic
+
+def process_mosaic(image_paths):
+    """Ask about all of image_paths in one request; returns the parsed JSON answer, None on failure."""
+    buffer = BytesIO()
+    build_mosaic(image_paths).save(buffer, format="JPEG", quality=90)
+    base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    prompt = MOSAIC_PROMPT_TEXT.replace("{n}", str(len(image_paths)))
+
+    try:
+        with llm_ledger.call("local", model, image_paths, prompt, mode="mosaic") as call:
+            response = get_client().chat.completions.create(
+                model=model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
+                        ],
+                    }
+                ],
+                max_tokens=150,
+            )
+            call.response = response
+        return parse_answer(response.choices[0].message.content)
+    except Exception as e:
+        print(f"\nAn error occurred: {e}")
+        print("Please ensure LMStudio is running and the model is loaded correctly.")
+        return None
+
+def tile_file(files, answer_part):
+    """The file name of the tile the model named, or None."""
+    if not isinstance(answer_part, dict):
+        return None
+    try:
+        tile = int(answer_part.get("tile"))
+    except (TypeError, ValueError):
+        return None
+    return files[tile - 1] if 1 <= tile <= len(files) else None
+
 ########################################
 
-# --- Main execution ---
-def main():
+def new_results(path_to_check):
+    return {
+        'odometer_image': {},
+        'gas_pump_image': {},
+        'model': model,
+        'source_dir': path_to_check,
+        'input_files': []
+    }
 
+def analyze_mosaic(path_to_check):
+    """--mosaic: one request for the whole folder; returns the results_llm dictionary."""
+    file_names = sorted(item.name for item in Path(path_to_check).iterdir() if item.is_file())
+    results_llm_dict = new_results(path_to_check)
 
-    # Define the directory you want to search.
-    # 
-    # probably should be configurable
-    path_to_check = './images_thumbnails'
+    ask = []
+    for file in file_names:
+        pump = seven_segment_ocr.confident_pump(path_to_check + "/" + file)
+        if pump and not results_llm_dict['gas_pump_image']:
+            print(f"Read the pump display locally (confidence {pump.confidence:.2f}).")
+            dollars, gallons = seven_segment_ocr.pump_values(pump)
+            results_llm_dict['gas_pump_image'] = {
+                'file': file, 'top_value_dollars': dollars, 'bottom_value_gallons': gallons}
+            results_llm_dict['input_files'].append(file)
+        elif not pump:
+            ask.append(file)
+    if not ask:
+        return results_llm_dict
+
+    answer = process_mosaic([path_to_check + "/" + file for file in ask])
+    if not isinstance(answer, dict):
+        return results_llm_dict
+    odometer, pump = answer.get('odometer'), answer.get('pump')
+    odometer_file, pump_file = tile_file(ask, odometer), tile_file(ask, pump)
+    if odometer_file and odometer_file == pump_file:
+        # one photo cannot be both displays; neither number can be trusted
+        print(f"⚠️  The model named tile {ask.index(odometer_file) + 1} for both the odometer and the pump; answer rejected.")
+        return results_llm_dict
+    if odometer_file:
+        results_llm_dict['odometer_image'] = {
+            'file': odometer_file,
+            'bottom_value_total_mileage': odometer.get('total_mileage'),
+            'top_value_trip': odometer.get('trip'),
+        }
+        results_llm_dict['input_files'].append(odometer_file)
+    if pump_file and not results_llm_dict['gas_pump_image']:
+        results_llm_dict['gas_pump_image'] = {
+            'file': pump_file,
+            'top_value_dollars': pump.get('dollars'),
+            'bottom_value_gallons': pump.get('gallons'),
+        }
+        results_llm_dict['input_files'].append(pump_file)
+    return results_llm_dict
+
+# --- Analyze a directory of images ---
+def analyze_images(path_to_check='./images_thumbnails', mosaic=False):
+    """
+    Ask the model about every image in path_to_check (in one request with mosaic); returns the
+    results_llm dictionary, normalized like the ChatGPT runner's (unreadable numbers are null).
+    """
+    if mosaic:
+        return normalize_data(analyze_mosaic(path_to_check))
     directory_path = Path(path_to_check)
 
     # Use a list comprehension to get the names of all files.
     file_names = [item.name for item in directory_path.iterdir() if item.is_file()]
 
-    results_llm_dict = {
-        'odometer_image': {},
-        'gas_pump_image': {},
-        'model': "",
-        'source_dir': "",
-        'input_files': []
-}
+    results_llm_dict = new_results(path_to_check)
     
     # Print the results 
     for file in file_names:
         IMAGE_PATH = path_to_check + "/" +  file
 
-        results_llm_dict['source_dir'] = path_to_check
-        results_llm_dict['model'] = model
-
-        
-        data_dict = process_an_image(IMAGE_PATH,file)
+        # a pump display the seven-segment decoder reads with confidence never goes to the model
+        pump = seven_segment_ocr.confident_pump(IMAGE_PATH)
+        if pump:
+            print(f"Read the pump display locally (confidence {pump.confidence:.2f}).")
+            dollars, gallons = seven_segment_ocr.pump_values(pump)
+            data_dict = {'price': dollars, 'gallons': gallons, 'file': file}
+        else:
+            data_dict = process_an_image(IMAGE_PATH,file)
         print (data_dict)
         print ("")
 
@@ -172,15 +324,30 @@ def main():
             results_llm_dict['gas_pump_image']['bottom_value_gallons'] = data_dict['gallons']
             results_llm_dict['input_files'].append(file)
 
+    return normalize_data(results_llm_dict)
+
+def write_results(results_llm_dict, file_path="results_llm.json"):
+    with open(file_path, "w") as json_file:
+        json.dump(results_llm_dict, json_file, indent=4)
+
+########################################
+
+# --- Main execution ---
+def main():
+    ap = argparse.ArgumentParser(description="Read the odometer and pump photos with the local LM Studio model.")
+    ap.add_argument("--dir", default="./images_thumbnails", help="Directory of images (default: ./images_thumbnails)")
+    ap.add_argument("--mosaic", action="store_true",
+                    help="Tile the cropped displays into one image and ask for all four numbers in one request")
+    args = ap.parse_args()
+
+    results_llm_dict = analyze_images(args.dir, args.mosaic)
+
     #print ( results_llm_dict ) 
     json_results_llm= json.dumps(results_llm_dict)
     print ( json_results_llm )
 
     #write json_results_llm to  results_llm.json (todo jsw)
-    file_path = "results_llm.json"
-    with open(file_path, "w") as json_file:
-        json.dump(results_llm_dict, json_file, indent=4)
+    write_results(results_llm_dict, "results_llm.json")
 
 if __name__ == "__main__":
-    main()
-
+    profiling.run(main)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+seven_segment_ocr.py
+--------------------
+Read dollars and gallons off a pump display locally, in milliseconds, so the
+vision model is only asked about the photos this cannot read with confidence.
+
+- Pump displays are seven-segment LCDs (dark digits on a light panel) or LEDs
+  (lit digits on a dark panel); both polarities are tried and the surer read wins
+- Otsu threshold for the display panel (row / column projections), then a
+  local threshold inside it; text rows and digit boxes from projections, italic
+  digits sheared upright, and each of the seven segments sampled in its part
+  of the digit box
+- Confidence (0-1) is the weakest segment decision of the weakest digit, and 0
+  unless there are two decimal numbers whose price per gallon makes sense; an
+  odometer photo therefore reads as "not a pump", not as a wrong number
+- Both runners use read_pump() first (GASSER_OCR=0 turns it off,
+  GASSER_OCR_MIN_CONFIDENCE sets the bar, default 0.6) and send the model only
+  what is left
+
+Usage:
+  python seven_segment_ocr.py --folder images_thumbnails
+  python seven_segment_ocr.py --folder bench_images --truth bench_images/ground_truth.json
+"""
+import argparse
+import json
+import os
+import re
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import metrics
+import profiling
+from dedup_images import DEFAULT_FOLDER, list_images
+
+ENABLED = os.environ.get("GASSER_OCR", "1").strip().lower() not in ("0", "false", "no", "off")
+MIN_CONFIDENCE = float(os.environ.get("GASSER_OCR_MIN_CONFIDENCE", "0.6"))
+
+MAX_SIDE = 640                       # photos are read at most this big; thumbnails as they are
+PRICE_PER_GALLON = (1.0, 10.0)       # a reading outside this is not dollars / gallons
+GALLONS = (0.1, 100.0)
+SEGMENT_ON = 0.3                     # share of a segment's area that is lit when the segment is on
+SEGMENT_MARGIN = 0.2                 # share this far from SEGMENT_ON is a sure decision
+SLANTS = (0.05, 0.1, 0.15, 0.2, 0.25)  # italic shears tried (columns per row)
+
+# segments a..g, as in benchmarks/synthetic_gauges.py
+DIGITS = {
+    "abcdef": "0", "bc": "1", "abdeg": "2", "abcdg": "3", "bcfg": "4",
+    "acdfg": "5", "acdefg": "6", "abc": "7", "abcdefg": "8", "abcdfg": "9",
+    # common variants: 6 and 9 without their tail, 7 with a side bar
+    "cdefg": "6", "abcfg": "9", "abcf": "7",
+}
+# (left, right, top, bottom) of each segment as fractions of the digit box
+SEGMENT_BOXES = {
+    "a": (0.30, 0.70, 0.00, 0.15),
+    "b": (0.75, 1.00, 0.20, 0.40),
+    "c": (0.75, 1.00, 0.60, 0.80),
+    "d": (0.30, 0.70, 0.85, 1.00),
+    "e": (0.00, 0.25, 0.60, 0.80),
+    "f": (0.00, 0.25, 0.20, 0.40),
+    "g": (0.30, 0.70, 0.43, 0.57),
+}
+NUMBER = re.compile(r"^\d+\.\d+$")
+
+
+class PumpReading(NamedTuple):
+    dollars: Optional[float]
+    gallons: Optional[float]
+    confidence: float
+    rows: List[str]          # every text row read, for the log
+    polarity: str            # "lcd" (dark digits) or "led" (lit digits)
+
+
+########################
+# Image helpers
+
+def otsu(values: np.ndarray) -> int:
+    """Threshold between the dark and the light class of a uint8 array (values <= t are dark)."""
+    p = np.bincount(values.ravel(), minlength=256).astype(np.float64)
+    p /= max(1.0, p.sum())
+    w0 = np.cumsum(p)
+    mu = np.cumsum(p * np.arange(256))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mu[-1] * w0 - mu) ** 2 / (w0 * (1 - w0))
+    if np.isnan(between).all():
+        return int(values.max())   # a single level: all of it is one class
+    return int(np.nanargmax(between))
+
+def runs(flags: np.ndarray, max_gap: int = 0) -> List[Tuple[int, int]]:
+    """[start, end) of every run of True, joining runs at most max_gap apart."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flags.astype(np.int8), [0]))))
+    merged: List[Tuple[int, int]] = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        if merged and start - merged[-1][1] <= max_gap:
+            merged[-1] = (merged[-1][0], int(end))
+        else:
+            merged.append((int(start), int(end)))
+    return merged
+
+def to_gray(img: Image.Image) -> np.ndarray:
+    gray = img.convert("L")
+    gray.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+    return np.asarray(gray, dtype=np.uint8)
+
+def load_gray(path: str) -> np.ndarray:
+    with Image.open(path) as img:
+        return to_gray(img)
+
+def local_mean(gray: np.ndarray, size: int) -> np.ndarray:
+    """Mean of the size x size window around every pixel (integral image; clipped at the edges)."""
+    h, w = gray.shape
+    ii = np.pad(gray.astype(np.float64), ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    r = size // 2
+    y0, y1 = np.clip(np.arange(h) - r, 0, h), np.clip(np.arange(h) + r + 1, 0, h)
+    x0, x1 = np.clip(np.arange(w) - r, 0, w), np.clip(np.arange(w) + r + 1, 0, w)
+    total = ii[y1][:, x1] - ii[y0][:, x1] - ii[y1][:, x0] + ii[y0][:, x0]
+    return total / ((y1 - y0)[:, None] * (x1 - x0)[None, :])
+
+def despeckle(mask: np.ndarray) -> np.ndarray:
+    """Opening with a 3x3 square: dust and scratches go, segments stay."""
+    m = np.pad(mask, 1)
+    eroded = np.ones_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            eroded &= m[dy:dy + mask.shape[0], dx:dx + mask.shape[1]]
+    e = np.pad(eroded, 1)
+    opened = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            opened |= e[dy:dy + mask.shape[0], dx:dx + mask.shape[1]]
+    return opened
+
+def deslant(row: np.ndarray) -> np.ndarray:
+    """Undo italic digits: the shear that makes the column profile sharpest (straight segments)."""
+    h, w = row.shape
+    best, best_score = row, float((row.sum(axis=0).astype(np.float64) ** 2).sum())
+    for slant in SLANTS:
+        shift = np.round(slant * (h - 1 - np.arange(h))).astype(int)
+        sheared = np.zeros((h, w + int(shift.max())), dtype=bool)
+        for y in range(h):
+            sheared[y, shift.max() - shift[y]:shift.max() - shift[y] + w] = row[y]
+        score = float((sheared.sum(axis=0).astype(np.float64) ** 2).sum())
+        if score > best_score:
+            best, best_score = sheared, score
+    return best
+
+def find_panel(lit: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """(top, bottom, left, right) of the display: the largest block that is mostly unlit."""
+    h, w = lit.shape
+    unlit = ~lit
+    rows = runs(unlit.mean(axis=1) > 0.4, max_gap=max(1, h // 50))
+    if not rows:
+        return None
+    top, bottom = max(rows, key=lambda r: r[1] - r[0])
+    cols = runs(unlit[top:bottom].mean(axis=0) > 0.4, max_gap=max(1, w // 50))
+    if not cols:
+        return None
+    left, right = max(cols, key=lambda c: c[1] - c[0])
+    if bottom - top < h // 10 or right - left < w // 5:
+        return None
+    return top, bottom, left, right
+
+########################
+# Reading
+
+def read_digit(box: np.ndarray) -> Tuple[str, float]:
+    """(digit or "?", confidence) of one digit box of lit pixels."""
+    h, w = box.shape
+    if w < 0.4 * h:
+        # a "1" is just its two right segments: a narrow box lit along its whole height
+        filled = box.any(axis=1).mean()
+        return ("1", float(min(1.0, filled))) if filled > 0.8 else ("?", 0.0)
+    lit = ""
+    confidence = 1.0
+    for seg, (x0, x1, y0, y1) in SEGMENT_BOXES.items():
+        region = box[int(y0 * h):max(int(y0 * h) + 1, int(y1 * h)), int(x0 * w):max(int(x0 * w) + 1, int(x1 * w))]
+        share = float(region.mean()) if region.size else 0.0
+        if share >= SEGMENT_ON:
+            lit += seg
+        # how far the share is from the on/off line, 1 when clearly one or the other
+        confidence = min(confidence, min(1.0, abs(share - SEGMENT_ON) / SEGMENT_MARGIN))
+    digit = DIGITS.get(lit)
+    return (digit, confidence) if digit else ("?", 0.0)
+
+def read_row(row: np.ndarray) -> Tuple[str, float]:
+    """(text, confidence) of one row of digits and decimal points."""
+    row = deslant(row)
+    band_h = row.shape[0]
+    text, confidence = "", 1.0
+    cols = runs(row.sum(axis=0) >= max(1, int(0.05 * band_h)), max_gap=max(1, int(0.06 * band_h)))
+    for left, right in cols:
+        part = row[:, left:right]
+        lit_rows = np.flatnonzero(part.any(axis=1))
+        top, bottom = int(lit_rows[0]), int(lit_rows[-1]) + 1
+        height, width = bottom - top, right - left
+        if height >= 0.6 * band_h:
+            # the whole row height: a 4 or a 7 has no segment at the top or bottom of the box
+            digit, conf = read_digit(part)
+            text += digit
+            confidence = min(confidence, conf)
+        elif height <= 0.3 * band_h and bottom >= 0.75 * band_h and width <= 0.35 * band_h:
+            text += "."
+        elif height * width > 0.02 * band_h * band_h:
+            # something that is neither a digit nor a point
+            text += "?"
+            confidence = 0.0
+    return text, confidence
+
+def read_display(gray: np.ndarray, polarity: str) -> Tuple[Optional[Tuple[int, int, int, int]], List[Tuple[str, float]]]:
+    """
+    (box, text rows top to bottom) for lit = dark ("lcd") or light ("led") pixels; box is
+    (top, bottom, left, right) in gray of the text read, or of the panel when no row was
+    read, None when there is no display.
+    """
+    t = otsu(gray)
+    lit = gray <= t if polarity == "lcd" else gray > t
+    panel = find_panel(lit)
+    if panel is None:
+        return None, []
+    top, bottom, left, right = panel
+    my, mx = (bottom - top) // 60, (right - left) // 60
+    inner = gray[top + my:bottom - my, left + mx:right - mx]
+    if inner.size == 0:
+        return panel, []
+    # against the local background, half a digit around: displays are lit unevenly
+    t = otsu(inner)
+    dark, light = inner[inner <= t], inner[inner > t]
+    if not dark.size or not light.size:
+        return panel, []
+    contrast = 0.25 * (float(light.mean()) - float(dark.mean()))
+    background = local_mean(inner, max(15, inner.shape[0] // 4) | 1)
+    lit = despeckle(inner < background - contrast if polarity == "lcd" else inner > background + contrast)
+
+    h = lit.shape[0]
+    spans = [(r0, r1) for r0, r1 in runs(lit.mean(axis=1) > 0.03, max_gap=max(1, h // 30)) if r1 - r0 >= 0.08 * h]
+    if not spans:
+        return panel, []
+    r0, r1 = spans[0][0], spans[-1][1]
+    cols = np.flatnonzero(lit[r0:r1].any(axis=0))
+    box = (top + my + r0, top + my + r1, left + mx + int(cols[0]), left + mx + int(cols[-1]) + 1)
+    return box, [read_row(lit[r0:r1]) for r0, r1 in spans]
+
+def pump_numbers(rows: List[Tuple[str, float]]) -> Tuple[Optional[float], Optional[float], float]:
+    """(dollars, gallons, confidence) from the first two decimal numbers: dollars above gallons."""
+    numbers = [(float(text), text, conf) for text, conf in rows if NUMBER.match(text)]
+    if len(numbers) < 2:
+        return None, None, 0.0
+    (dollars, dollars_text, c1), (gallons, gallons_text, c2) = numbers[:2]
+    if not (GALLONS[0] <= gallons <= GALLONS[1]) or not (
+            PRICE_PER_GALLON[0] <= dollars / gallons <= PRICE_PER_GALLON[1]):
+        return None, None, 0.0
+    confidence = min(c1, c2)
+    # pumps show cents and thousandths of a gallon; other layouts are read, but less surely
+    if len(dollars_text.split(".")[1]) != 2 or len(gallons_text.split(".")[1]) != 3:
+        confidence *= 0.8
+    return dollars, gallons, confidence
+
+def read_pump(path: str) -> PumpReading:
+    """Dollars and gallons of a pump photo; confidence 0 when it is not one (or unreadable)."""
+    with metrics.timer("ocr_seconds"):
+        gray = load_gray(path)
+        best = PumpReading(None, None, 0.0, [], "")
+        for polarity in ("lcd", "led"):
+            _, rows = read_display(gray, polarity)
+            dollars, gallons, confidence = pump_numbers(rows)
+            if confidence > best.confidence or not best.rows:
+                best = PumpReading(dollars, gallons, round(confidence, 3), [t for t, _ in rows], polarity)
+    return best
+
+def display_box(img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """(left, top, right, bottom) of the display's digits in img, for cropping; None when none is found."""
+    gray = to_gray(img)
+    found = []
+    for polarity in ("lcd", "led"):
+        box, rows = read_display(gray, polarity)
+        if box is not None:
+            found.append((sum(ch.isdigit() for text, _ in rows for ch in text), box))
+    if not found:
+        return None
+    # the polarity that shows digits is the display's
+    top, bottom, left, right = max(found, key=lambda f: f[0])[1]
+    scale = img.width / gray.shape[1]
+    return int(left * scale), int(top * scale), int(right * scale), int(bottom * scale)
+
+def confident_pump(path: str) -> Optional[PumpReading]:
+    """The local read when it is sure enough to skip the model (and OCR is on), else None."""
+    if not ENABLED:
+        return None
+    reading = read_pump(path)
+    if reading.confidence >= MIN_CONFIDENCE:
+        metrics.count("ocr_reads_total")
+        return reading
+    metrics.count("ocr_fallbacks_total")
+    return None
+
+def pump_values(reading: PumpReading) -> Tuple[str, str]:
+    """(dollars, gallons) as the results_llm text both runners store: "%.2f" and "%.3f"."""
+    return f"{reading.dollars:.2f}", f"{reading.gallons:.3f}"
+
+########################
+def main():
+    ap = argparse.ArgumentParser(description="Read pump displays locally with a seven-segment decoder.")
+    ap.add_argument("--folder", default=DEFAULT_FOLDER, help=f"Folder of images (default: {DEFAULT_FOLDER})")
+    ap.add_argument("--truth", default=None, help="ground_truth.json from benchmarks/synthetic_gauges.py, to score the reads")
+    ap.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                    help=f"Confidence to trust a read (default: {MIN_CONFIDENCE}, GASSER_OCR_MIN_CONFIDENCE)")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.folder):
+        raise SystemExit(f"ERROR: Folder not found: {args.folder}")
+    truth = {}
+    if args.truth:
+        with open(args.truth, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        truth = {f["gaspump_file"]: f for f in data["fillups"]}
+
+    trusted = right = wrong = 0
+    t0 = time.perf_counter()
+    paths = list_images(args.folder)
+    for path in paths:
+        r = read_pump(path)
+        name = os.path.basename(path)
+        sure = r.confidence >= args.min_confidence
+        trusted += sure
+        verdict = ""
+        if name in truth and sure:
+            ok = abs(r.dollars - truth[name]["dollars"]) < 0.005 and abs(r.gallons - truth[name]["gallons"]) < 0.0005
+            right += ok
+            wrong += not ok
+            verdict = "  correct" if ok else f"  WRONG (is {truth[name]['dollars']} / {truth[name]['gallons']})"
+        reading = f"${r.dollars} {r.gallons} gal" if r.dollars is not None else "not a pump read"
+        print(f"{name}: {reading}  confidence {r.confidence:.2f} ({r.polarity}; rows {r.rows}){verdict}")
+
+    elapsed = time.perf_counter() - t0
+    print(f"\n{trusted} of {len(paths)} image(s) read with confidence >= {args.min_confidence} "
+          f"in {elapsed * 1000 / max(1, len(paths)):.1f} ms per image")
+    if truth:
+        print(f"against {args.truth}: {right} correct, {wrong} wrong of {len(truth)} pump photos")
+
+if __name__ == "__main__":
+    profiling.run(main)
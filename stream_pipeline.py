@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+stream_pipeline.py
+------------------
+Streaming version of the pipeline for large backfills: every image moves
+through the stages on its own, over bounded asyncio queues, instead of each
+stage finishing for all images before the next one starts.
+
+  images -> exif -> geocode -> thumbnail -> (pair complete) -> inference -> DB writer
+
+- exif:      one exiftool process, in its own thread (images unchanged since
+             the metadata store last saw them skip exiftool and geocoding)
+- geocode:   async, one Nominatim request per --rate-sec
+- thumbnail: a process pool (--thumb-workers), CPU-bound resizing in parallel
+- inference: --infer-workers fill-ups in flight at once, once all the photos
+             of a fill-up have their thumbnails and have been through the
+             near-duplicate and quality screens (image_quality.screen_folder)
+- DB:        a single writer task (gasser_db_async): insert, MPG around the
+             new reading, location
+
+Every image's time in each stage is recorded (metrics.py); --metrics-json shows
+per-stage p50/p95 and items/sec, so the stage that holds the others back is visible.
+
+Each queue holds at most --queue-size items, so a slow stage holds back the
+ones in front of it instead of piling up images in memory, and the first
+fill-up reaches the database while later photos are still being read.
+
+Usage:
+  python stream_pipeline.py --jobs fillup_jobs.jsonl
+  python stream_pipeline.py --folder ./attachments            # the folder is one fill-up
+  python stream_pipeline.py --jobs fillup_jobs.jsonl --runner chatgpt --infer-workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import exiftool
+
+import exif_to_json_and_csv as exif
+import gasser_db_async
+import image_quality
+import llm_ledger
+import metadata_store
+import metrics
+import profiling
+from create_thumbnails import THUMBNAIL_EXTENSIONS, create_thumbnail
+from read_update_metadata import location_values
+from write_results_sql import reading_from_results
+
+
+class Image(NamedTuple):
+    job: str
+    path: str
+    rec: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_result: Optional[float] = None
+        self.images = 0
+        self.written = 0
+        self.failed: List[str] = []
+
+    def result(self) -> None:
+        self.written += 1
+        metrics.count("fillups_written_total")
+        if self.first_result is None:
+            self.first_result = time.perf_counter() - self.started
+            metrics.observe("first_result_seconds", self.first_result)
+
+
+########################
+class StreamPipeline:
+    def __init__(self, args, jobs: List[Dict[str, Any]]):
+        self.args = args
+        self.jobs = {job["job"]: job for job in jobs}
+        size = args.queue_size
+        self.to_exif: asyncio.Queue = asyncio.Queue(size)
+        self.to_geo: asyncio.Queue = asyncio.Queue(size)
+        self.to_thumb: asyncio.Queue = asyncio.Queue(size)
+        self.to_join: asyncio.Queue = asyncio.Queue(size)
+        self.to_infer: asyncio.Queue = asyncio.Queue(size)
+        self.to_db: asyncio.Queue = asyncio.Queue(size)
+        self.arrived: Dict[str, List[Image]] = {}
+        self.stats = Stats()
+
+        self.store = metadata_store.open_store(args.store)
+        self.known = metadata_store.load_signatures(self.store)
+        self.exif_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exiftool")
+        self.thumb_pool = ProcessPoolExecutor(max_workers=args.thumb_workers)
+        self.et = exiftool.ExifTool()
+        self.exif_thread.submit(self.et.run).result()
+        self.last_geocode = 0.0
+
+        if args.runner == "chatgpt":
+            import run_vision_query_chatgpt as runner
+            self.analyze = lambda d: runner.analyze_images(d, args.model)
+        else:
+            import run_vision_query_locally as runner
+            self.analyze = lambda d: runner.analyze_images(d, mosaic=args.mosaic)
+        runner.get_client()
+        self.screen = lambda d: image_quality.screen_folder(d, None if args.no_dedup else args.dedup_distance,
+                                                            not args.no_quality)
+
+    def close(self) -> None:
+        self.exif_thread.submit(self.et.terminate).result()
+        self.exif_thread.shutdown()
+        self.thumb_pool.shutdown()
+        self.store.close()
+
+    ########################
+    async def feed(self) -> None:
+        for job in self.jobs.values():
+            for path in job["files"]:
+                self.stats.images += 1
+                await self.to_exif.put(Image(job["job"], path))
+
+    async def exif_stage(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            img = await self.to_exif.get()
+            try:
+                sig = metadata_store.file_signature(img.path)
+                if self.known.get(metadata_store.store_key(img.path)) == sig and not self.args.force:
+                    rec = metadata_store.find_by_filename(self.store, os.path.basename(img.path))
+                    await self.to_thumb.put(img._replace(rec=rec))
+                else:
+                    with metrics.stage("exif", items=1):
+                        rec = await loop.run_in_executor(
+                            self.exif_thread, exif.extract_record, self.et, img.path, self.args.email, 0, True)
+                    rec["_signature"] = sig
+                    await self.to_geo.put(img._replace(rec=rec))
+            except Exception as e:
+                await self.to_join.put(img._replace(error=f"exif: {e}"))
+            finally:
+                self.to_exif.task_done()
+
+    async def geo_stage(self) -> None:
+        while True:
+            img = await self.to_geo.get()
+            try:
+                rec = dict(img.rec)
+                sig = rec.pop("_signature")
+                lat, lng = rec.get("GPSLatitudeFixed"), rec.get("GPSLongitudeFixed")
+                if not self.args.no_geo and lat is not None and lng is not None:
+                    # Nominatim's usage policy: at most one request per rate_sec
+                    wait = self.last_geocode + self.args.rate_sec - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self.last_geocode = time.monotonic()
+                    with metrics.stage("geocode", items=1):
+                        rec["Location"] = await asyncio.to_thread(exif.reverse_geocode, lat, lng, self.args.email)
+                metadata_store.put_record(self.store, img.path, sig, rec)
+                self.store.commit()
+                await self.to_thumb.put(img._replace(rec=rec))
+            except Exception as e:
+                await self.to_join.put(img._replace(error=f"geocode: {e}"))
+            finally:
+                self.to_geo.task_done()
+
+    async def thumb_stage(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            img = await self.to_thumb.get()
+            try:
+                if img.path.lower().endswith(THUMBNAIL_EXTENSIONS):
+                    job_dir = os.path.join(self.args.thumbnails, img.job)
+                    os.makedirs(job_dir, exist_ok=True)
+                    # timed here: thumbnail_seconds recorded inside the worker processes is not sent back
+                    with metrics.stage("thumbnail", items=1):
+                        await loop.run_in_executor(self.thumb_pool, create_thumbnail,
+                                                   img.path, os.path.join(job_dir, os.path.basename(img.path)))
+                await self.to_join.put(img)
+            except Exception as e:
+                await self.to_join.put(img._replace(error=f"thumbnail: {e}"))
+            finally:
+                self.to_thumb.task_done()
+
+    async def join_stage(self) -> None:
+        """Hold each image until every photo of its fill-up has arrived."""
+        while True:
+            img = await self.to_join.get()
+            try:
+                arrived = self.arrived.setdefault(img.job, [])
+                arrived.append(img)
+                job = self.jobs[img.job]
+                if len(arrived) == len(job["files"]):
+                    del self.arrived[img.job]
+                    errors = [i.error for i in arrived if i.error]
+                    if errors:
+                        self.fail(img.job, "; ".join(errors))
+                    else:
+                        await self.to_infer.put((job, [i.rec for i in arrived if i.rec]))
+            finally:
+                self.to_join.task_done()
+
+    async def infer_stage(self) -> None:
+        while True:
+            job, records = await self.to_infer.get()
+            try:
+                job_dir = os.path.join(self.args.thumbnails, job["job"])
+                with metrics.stage("screen", items=len(records)):
+                    await asyncio.to_thread(self.screen, job_dir)
+                with metrics.stage("inference", items=len(records)):
+                    results = await asyncio.to_thread(self.analyze, job_dir)
+                await self.to_db.put((job, records, results))
+            except Exception as e:
+                self.fail(job["job"], f"inference: {e}")
+            finally:
+                self.to_infer.task_done()
+
+    async def db_stage(self) -> None:
+        while True:
+            job, records, results = await self.to_db.get()
+            try:
+                with metrics.stage("db", items=1):
+                    await self.write(job, records, results)
+                self.stats.result()
+                print(f"✓ {job['job']} written ({time.perf_counter() - self.stats.started:.1f}s)")
+            except Exception as e:
+                self.fail(job["job"], f"database: {e}")
+            finally:
+                self.to_db.task_done()
+
+    async def write(self, job: Dict[str, Any], records: List[Dict[str, Any]], results: Dict[str, Any]) -> None:
+        reading = reading_from_results(results)
+        if reading[0] in (None, "", "not found"):
+            raise ValueError("the model found no odometer photo")
+        fill_time = (metadata_store.fill_time_for([reading[0], reading[3]], self.store)
+                     or (datetime.fromisoformat(job["fill_time"]) if job.get("fill_time") else None))
+        id = await gasser_db_async.reading_id(reading[0])
+        if id is None:
+            id = await gasser_db_async.insert_reading(reading, fill_time)
+            await asyncio.to_thread(llm_ledger.link_reading, reading[0], reading[3])
+        await gasser_db_async.recompute_mpg(around_id=id)
+        await gasser_db_async.update_locations(location_values(records))
+
+    def fail(self, job: str, error: str) -> None:
+        self.stats.failed.append(job)
+        metrics.count("fillups_failed_total", stage=error.split(":", 1)[0])
+        print(f"✗ {job}: {error}")
+
+    ########################
+    async def run(self) -> Stats:
+        a = self.args
+        workers = (
+            [self.exif_stage(), self.geo_stage(), self.join_stage(), self.db_stage()]
+            + [self.thumb_stage() for _ in range(a.thumb_workers)]
+            + [self.infer_stage() for _ in range(a.infer_workers)]
+        )
+        tasks = [asyncio.create_task(w) for w in workers]
+        try:
+            await self.feed()
+            # drain front to back: once a queue is empty for good, nothing more can reach the next one
+            for q in (self.to_exif, self.to_geo, self.to_thumb, self.to_join, self.to_infer, self.to_db):
+                await q.join()
+            if self.stats.written:
+                await gasser_db_async.refresh_stats()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await gasser_db_async.close_pool()
+        return self.stats
+
+########################
+def load_jobs(args) -> List[Dict[str, Any]]:
+    if args.jobs:
+        with open(args.jobs, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    files = exif.collect_files(args.folder, exif.DEFAULT_IMAGE_EXTENSIONS)
+    if not files:
+        raise SystemExit(f"ERROR: No images found in {args.folder}")
+    return [{"job": time.strftime("fillup-%Y%m%dT%H%M%S"), "files": files}]
+
+def main():
+    ap = argparse.ArgumentParser(description="Stream images through EXIF, thumbnails, inference and the DB over bounded queues.")
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--jobs", default=None, help="Fill-up jobs JSONL from pair_images.py")
+    src.add_argument("--folder", default="./attachments", help="Treat every image in this folder as one fill-up")
+    ap.add_argument("--thumbnails", default="images_thumbnails", help="Thumbnail folder (one sub-folder per fill-up)")
+    ap.add_argument("--store", default=metadata_store.DEFAULT_STORE, help="SQLite metadata store")
+    ap.add_argument("--runner", choices=["local", "chatgpt"], default="local",
+                    help="LM Studio (run_vision_query_locally.py) or OpenAI (run_vision_query_chatgpt.py)")
+    ap.add_argument("--model", default="gpt-4o-mini", help="OpenAI model for --runner chatgpt")
+    ap.add_argument("--mosaic", action="store_true",
+                    help="--runner local: one request per fill-up, the displays tiled into one image")
+    image_quality.add_arguments(ap)
+    ap.add_argument("--email", default="your_email@example.com", help="Contact email for Nominatim User-Agent")
+    ap.add_argument("--rate-sec", type=float, default=1.0, help="Delay between reverse geocode calls (seconds)")
+    ap.add_argument("--no-geo", action="store_true", help="Skip reverse geocoding")
+    ap.add_argument("--force", action="store_true", help="Re-extract EXIF even for unchanged images")
+    ap.add_argument("--queue-size", type=int, default=8, help="Items each stage queue holds (default: 8)")
+    ap.add_argument("--thumb-workers", type=int, default=os.cpu_count() or 2,
+                    help="Thumbnail processes (default: CPU count)")
+    ap.add_argument("--infer-workers", type=int, default=1,
+                    help="Fill-ups sent to the model at once (default: 1, one local GPU)")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+
+    jobs = load_jobs(args)
+    pipeline = StreamPipeline(args, jobs)
+    try:
+        stats = asyncio.run(pipeline.run())
+    finally:
+        pipeline.close()
+        metrics.export_args(args)
+
+    elapsed = time.perf_counter() - stats.started
+    print(f"\nImages:        {stats.images}")
+    print(f"Fill-ups:      {stats.written} written, {len(stats.failed)} failed of {len(jobs)}")
+    if stats.first_result is not None:
+        print(f"First result:  {stats.first_result:.1f}s")
+    print(f"Total:         {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    profiling.run(main)
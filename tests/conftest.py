@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+# the scripts are top-level modules of the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# gasser_db picks its backend when it is imported. The tests run on a temporary SQLite
+# file, or, with GASSER_TEST_PGDATABASE set, on that (scratch) PostgreSQL database,
+# whose tables they drop and re-create.
+PG_TEST_DATABASE = os.environ.get("GASSER_TEST_PGDATABASE")
+if PG_TEST_DATABASE:
+    os.environ["GASSER_DB_BACKEND"] = "postgres"
+    os.environ["PGDATABASE"] = PG_TEST_DATABASE
+else:
+    os.environ["GASSER_DB_BACKEND"] = "sqlite"
+os.environ["GASSER_LLM_LEDGER"] = "0"
+
+import gasser_db  # noqa: E402
+
+requires_postgres = pytest.mark.skipif(gasser_db.SQLITE, reason="needs GASSER_TEST_PGDATABASE (PostgreSQL)")
+
+# every table the tests may create, dropped before each PostgreSQL test
+PG_TABLES = "fuel_readings, pipeline_jobs, llm_call_files, llm_calls"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """gasser_db on an empty fuel_readings table (with its indexes and triggers)."""
+    import create_gasser_table
+
+    gasser_db.close_pool()
+    monkeypatch.setattr(gasser_db, "SQLITE_PATH", str(tmp_path / "gasser.sqlite"))
+    index_sql = create_gasser_table.CREATE_INDEXES_SQL.format(key_suffix="", fill_time_using="")
+    with gasser_db.transaction() as cur:
+        if gasser_db.SQLITE:
+            cur.execute(create_gasser_table.SQLITE_CREATE_TABLE_SQL)
+            gasser_db.execute_script(cur, index_sql)
+            gasser_db.execute_script(cur, create_gasser_table.SQLITE_TOUCH_TRIGGER_SQL)
+        else:
+            cur.execute(f"DROP TABLE IF EXISTS {PG_TABLES} CASCADE")
+            cur.execute(create_gasser_table.CREATE_TABLE_SQL)
+            gasser_db.execute_script(cur, index_sql)
+            gasser_db.execute_script(cur, create_gasser_table.TOUCH_TRIGGER_SQL)
+    yield gasser_db
+    gasser_db.close_pool()
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from bulk_ingest_results import ingest_readings, staging_rows
+from conftest import requires_postgres
+
+DATED = "2025-03-01T10-00-00+00-00_IMG_1.jpg"
+UNDATED = "IMG_2.jpg"
+
+
+def doc(odometer_file, mileage, dollars="35.00", gallons="10.000"):
+    return {
+        "odometer_image": {"file": odometer_file, "top_value_trip": "300", "bottom_value_total_mileage": mileage},
+        "gas_pump_image": {"file": f"pump-{odometer_file}", "top_value_dollars": dollars, "bottom_value_gallons": gallons},
+    }
+
+@pytest.fixture
+def documents(tmp_path, monkeypatch):
+    # no image_metadata.sqlite here: fill times come from the file name prefix
+    monkeypatch.chdir(tmp_path)
+    return [
+        ("a.json", doc(DATED, "10300")),
+        ("b.json", doc(UNDATED, "10600")),
+        ("c.json", doc("not found", "10900")),
+        ("d.json", doc("IMG_3.jpg", "10,9OO")),
+        ("e.json", doc(DATED, "10300")),          # the same photo again
+    ]
+
+def test_staging_rows(documents):
+    rows, skipped = staging_rows(documents)
+    assert skipped == 1
+    assert [(source, odometer_file, fill_time) for source, odometer_file, *_, fill_time in rows] == [
+        ("a.json", DATED, "2025-03-01T10:00:00+00:00"),
+        ("b.json", UNDATED, ""),
+        ("d.json", "IMG_3.jpg", ""),
+        ("e.json", DATED, "2025-03-01T10:00:00+00:00"),
+    ]
+
+@requires_postgres
+def test_ingest_dated_and_undated(db, documents):
+    rows, _ = staging_rows(documents)
+    assert ingest_readings(rows) == (2, [("d.json", "IMG_3.jpg")])
+    with db.transaction() as cur:
+        cur.execute("SELECT odometer_file, total_mileage, fill_time FROM fuel_readings ORDER BY id")
+        readings = cur.fetchall()
+    # undated readings get -infinity like every other insert, never NULL
+    assert readings == [
+        (UNDATED, 10600, datetime.min.replace(tzinfo=timezone.utc)),
+        (DATED, 10300, datetime(2025, 3, 1, 10, tzinfo=timezone.utc)),
+    ]
+    # already present
+    assert ingest_readings(rows) == (0, [("d.json", "IMG_3.jpg")])
+
+@requires_postgres
+def test_single_insert_of_undated_reading(db):
+    with db.transaction() as cur:
+        db.execute_prepared(cur, "insert_reading", db.INSERT_READING_SQL, (UNDATED, 0, 10600, "", 35, 10, None))
+        cur.execute("SELECT fill_time FROM fuel_readings")
+        assert cur.fetchone()[0] == datetime.min.replace(tzinfo=timezone.utc)
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from compute_mpg import recompute_mpg
+
+# (odometer_file, total_mileage, gallons, dollars, day in 2025-03)
+READINGS = [
+    ("", 10000, 0, 0, None),              # the seed row from write_firsttime_sql.py
+    ("a.jpg", 10300, 10.0, 35.0, 1),
+    ("b.jpg", 10600, 12.0, 42.0, 8),
+    ("c.jpg", 10900, 10.0, 36.0, 15),
+]
+
+
+def insert(cur, odometer_file, mileage, gallons, dollars, day):
+    fill_time = datetime(2025, 3, day, tzinfo=timezone.utc) if day else "-infinity"
+    cur.execute("INSERT INTO fuel_readings (odometer_file, total_mileage, gallons, dollars, fill_time) "
+                "VALUES (%s, %s, %s, %s, %s)", (odometer_file, mileage, gallons, dollars, fill_time))
+    cur.execute("SELECT id FROM fuel_readings WHERE odometer_file = %s", (odometer_file,))
+    return cur.fetchone()[0]
+
+def mpg_by_file(db):
+    with db.transaction() as cur:
+        cur.execute("SELECT odometer_file, mpg, price_per_gal FROM fuel_readings")
+        return {f: (mpg, price) for f, mpg, price in cur.fetchall()}
+
+@pytest.fixture
+def readings(db):
+    with db.transaction() as cur:
+        return {r[0]: insert(cur, *r) for r in READINGS}
+
+def test_recompute_all(db, readings):
+    assert recompute_mpg() == len(READINGS)
+    mpg = mpg_by_file(db)
+    assert mpg[""] == (None, None)
+    assert mpg["a.jpg"] == (30.0, 3.5)
+    assert mpg["b.jpg"] == (25.0, 3.5)
+    assert mpg["c.jpg"] == (30.0, 3.6)
+
+def test_recompute_around_a_backfilled_reading(db, readings):
+    recompute_mpg()
+    with db.transaction() as cur:
+        id = insert(cur, "late.jpg", 10750, 5.0, 17.5, 10)
+        cur.execute("UPDATE fuel_readings SET mpg = -1")
+    # only the new reading and the one after it
+    assert recompute_mpg(around_id=id) == 2
+    mpg = mpg_by_file(db)
+    assert mpg["late.jpg"][0] == 30.0      # 10750 - 10600 over 5 gallons
+    assert mpg["c.jpg"][0] == 15.0         # 10900 - 10750 over 10 gallons
+    assert mpg["a.jpg"][0] == mpg["b.jpg"][0] == -1
+
+def test_recompute_around_a_deleted_reading(db, readings):
+    recompute_mpg()
+    with db.transaction() as cur:
+        cur.execute("DELETE FROM fuel_readings WHERE id = %s", (readings["b.jpg"],))
+    assert recompute_mpg(around_time=datetime(2025, 3, 8, tzinfo=timezone.utc)) == 1
+    assert mpg_by_file(db)["c.jpg"][0] == 60.0   # 10900 - 10300 over 10 gallons
+
+def test_undated_readings_sort_first(db, readings):
+    with db.transaction() as cur:
+        cur.execute("INSERT INTO fuel_readings (odometer_file, total_mileage, gallons, dollars) "
+                    "VALUES ('undated.jpg', 9000, 10, 30)")
+    recompute_mpg()
+    mpg = mpg_by_file(db)
+    assert mpg["undated.jpg"][0] is None   # first of all, no previous reading
+    assert mpg[""][0] is None              # the seed row has no gallons
+    assert mpg["a.jpg"][0] == 30.0
+
+def test_missing_reading_id(db):
+    with pytest.raises(ValueError):
+        recompute_mpg(around_id=12345)
+
+def test_recompute_around_the_undated_seed_row(db, readings):
+    with db.transaction() as cur:
+        cur.execute("UPDATE fuel_readings SET mpg = -1")
+    # its own -infinity fill time has to come back as -infinity to match
+    assert recompute_mpg(around_id=readings[""]) == 2
+    mpg = mpg_by_file(db)
+    assert (mpg[""][0], mpg["a.jpg"][0], mpg["b.jpg"][0]) == (None, 30.0, -1)
@@ -0,0 +1,56 @@
+import sys
+
+import pytest
+
+import create_gasser_table
+
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["create_gasser_table.py", *args])
+    create_gasser_table.main()
+
+@pytest.fixture
+def duplicates(db, tmp_path, monkeypatch):
+    """A table from before the unique file indexes, with a results file written twice."""
+    monkeypatch.chdir(tmp_path)
+    with db.transaction() as cur:
+        cur.execute("DROP INDEX fuel_readings_odometer_file_key")
+        cur.execute("DROP INDEX fuel_readings_gaspump_file_key")
+        db.execute_values(cur, "INSERT INTO fuel_readings (odometer_file, gaspump_file, total_mileage) VALUES %s", [
+            ("", "", 10000),
+            ("a.jpg", "pa.jpg", 10300),
+            ("a.jpg", "pa.jpg", 10300),
+            ("b.jpg", "pb.jpg", 10600),
+            ("c.jpg", "pb.jpg", 10900),
+            ("not found", "not found", 0),
+            ("not found", "not found", 0),
+        ])
+    return db
+
+def test_migrate_deletes_duplicates_before_indexing(duplicates, monkeypatch, capsys):
+    run(monkeypatch, "--migrate")
+    assert "2 duplicate readings deleted" in capsys.readouterr().out
+    with duplicates.transaction() as cur:
+        cur.execute("SELECT id, odometer_file FROM fuel_readings ORDER BY id")
+        assert cur.fetchall() == [(1, ""), (2, "a.jpg"), (4, "b.jpg"), (6, "not found"), (7, "not found")]
+        cur.execute("SELECT COUNT(*) FROM fuel_readings WHERE fill_time IS NULL")
+        assert cur.fetchone() == (0,)
+    # the unique index is in place now
+    with pytest.raises(duplicates.DB_ERRORS):
+        with duplicates.transaction() as cur:
+            cur.execute("INSERT INTO fuel_readings (odometer_file) VALUES ('a.jpg')")
+
+def test_migrate_twice(duplicates, monkeypatch, capsys):
+    run(monkeypatch, "--migrate")
+    capsys.readouterr()
+    run(monkeypatch, "--migrate")
+    assert "duplicate" not in capsys.readouterr().out
+
+def test_create_drops_and_recreates(db, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with db.transaction() as cur:
+        cur.execute("INSERT INTO fuel_readings (odometer_file) VALUES ('a.jpg')")
+    run(monkeypatch)
+    with db.transaction() as cur:
+        cur.execute("SELECT COUNT(*) FROM fuel_readings")
+        assert cur.fetchone() == (0,)
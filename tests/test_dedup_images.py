@@ -0,0 +1,38 @@
+import random
+
+from dedup_images import BKTree, ImageHash, cluster, hamming
+
+
+def test_bktree_matches_brute_force():
+    rng = random.Random(7)
+    keys = [rng.getrandbits(32) for _ in range(300)]
+    tree = BKTree()
+    for i, key in enumerate(keys):
+        tree.add(key, i)
+    for probe in keys[:20] + [rng.getrandbits(32) for _ in range(20)]:
+        for radius in (0, 6, 12):
+            expected = sorted((hamming(probe, k), i) for i, k in enumerate(keys) if hamming(probe, k) <= radius)
+            assert sorted(tree.search(probe, radius)) == expected
+
+def test_bktree_empty():
+    assert BKTree().search(0, 10) == []
+
+def test_cluster_groups_near_duplicates_sharpest_first():
+    base = (1 << 256) - 1
+    hashes = [
+        ImageHash("a.jpg", base, base, 10.0),
+        ImageHash("b.jpg", base ^ 0b111, base ^ 0b1, 50.0),     # 3 / 1 bits from a
+        ImageHash("c.jpg", 0, 0, 30.0),                        # 256 bits from both
+    ]
+    groups = cluster(hashes, max_distance=24)
+    assert sorted([h.path for h in g] for g in groups) == [["b.jpg", "a.jpg"], ["c.jpg"]]
+
+def test_cluster_needs_both_hashes_close():
+    hashes = [ImageHash("a.jpg", 0, 0, 1.0), ImageHash("b.jpg", 0, (1 << 40) - 1, 2.0)]
+    assert len(cluster(hashes, max_distance=24)) == 2
+
+def test_cluster_is_transitive():
+    # a~b and b~c, although a and c are further apart than the distance
+    a, b, c = 0, (1 << 20) - 1, (1 << 40) - 1
+    hashes = [ImageHash("a.jpg", a, a, 1.0), ImageHash("b.jpg", b, b, 2.0), ImageHash("c.jpg", c, c, 3.0)]
+    assert [len(g) for g in cluster(hashes, max_distance=24)] == [3]
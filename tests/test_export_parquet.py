@@ -0,0 +1,79 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("pyarrow")
+import pyarrow.dataset as ds
+
+import export_parquet
+
+
+def insert(cur, odometer_file, mileage, fill_time):
+    cur.execute("INSERT INTO fuel_readings (odometer_file, total_mileage, gallons, dollars, fill_time) "
+                "VALUES (%s, %s, 10, 35, %s)", (odometer_file, mileage, fill_time))
+
+def dataset(path):
+    table = ds.dataset(path, format="parquet", partitioning="hive").to_table()
+    return {row["odometer_file"]: row for row in table.to_pylist()}
+
+def year_files(path, year):
+    return sorted(os.listdir(os.path.join(path, f"year={year}")))
+
+@pytest.fixture
+def readings(db):
+    with db.transaction() as cur:
+        insert(cur, "", 10000, "-infinity")
+        insert(cur, "a.jpg", 10300, datetime(2024, 6, 1, tzinfo=timezone.utc))
+        insert(cur, "b.jpg", 10600, datetime(2024, 12, 31, 23, 0, tzinfo=timezone.utc))
+        insert(cur, "c.jpg", 10900, datetime(2025, 1, 5, tzinfo=timezone.utc))
+    return db
+
+def test_readings_export_rewrites_only_changed_years(readings, tmp_path):
+    path = str(tmp_path / "fuel_readings")
+    assert export_parquet.export_readings(str(tmp_path)) == 4
+    assert sorted(dataset(path)) == ["", "a.jpg", "b.jpg", "c.jpg"]
+    assert dataset(path)["b.jpg"]["year"] == 2024
+    assert export_parquet.export_readings(str(tmp_path)) == 0
+
+    files_2025 = year_files(path, 2025)
+    time.sleep(0.01)   # updated_at has millisecond resolution on SQLite
+    with readings.transaction() as cur:
+        cur.execute("UPDATE fuel_readings SET mpg = 30 WHERE odometer_file = 'a.jpg'")
+    assert export_parquet.export_readings(str(tmp_path)) == 2     # both 2024 rows
+    assert dataset(path)["a.jpg"]["mpg"] == 30.0
+    assert year_files(path, 2025) == files_2025
+
+    with readings.transaction() as cur:
+        cur.execute("DELETE FROM fuel_readings WHERE odometer_file = 'c.jpg'")
+    assert export_parquet.export_readings(str(tmp_path)) == 0
+    assert sorted(dataset(path)) == ["", "a.jpg", "b.jpg"]
+    assert not os.path.exists(os.path.join(path, "year=2025"))
+
+def test_full_export_after_state_removed(readings, tmp_path):
+    export_parquet.export_readings(str(tmp_path))
+    os.remove(tmp_path / "fuel_readings" / export_parquet.STATE_FILE)
+    assert export_parquet.export_readings(str(tmp_path)) == 4
+    assert len(dataset(str(tmp_path / "fuel_readings"))) == 4
+
+def test_metadata_export_rewrites_only_changed_years(tmp_path):
+    records = [
+        {"FileName": "a.jpg", "FilePath": "/p/a.jpg", "DateTimeOriginal": "2024:06:01 10:00:00", "ISO": 100},
+        {"FileName": "b.jpg", "FilePath": "/p/b.jpg", "DateTimeOriginal": "2025:06:01 10:00:00", "ISO": 100},
+        {"FileName": "IMG_1.jpg", "FilePath": "/p/IMG_1.jpg"},
+    ]
+    source = tmp_path / "image_metadata_full.json"
+    source.write_text(json.dumps(records), encoding="utf-8")
+    out = tmp_path / "parquet"
+    assert export_parquet.export_metadata(str(source), str(out)) == 3
+    assert export_parquet.export_metadata(str(source), str(out)) == 0
+
+    records[1]["ISO"] = 400
+    source.write_text(json.dumps(records[1:]), encoding="utf-8")
+    assert export_parquet.export_metadata(str(source), str(out)) == 1
+    table = ds.dataset(str(out / "image_metadata_full"), format="parquet", partitioning="hive").to_table()
+    rows = {row["file_name"]: row for row in table.to_pylist()}
+    assert sorted(rows) == ["IMG_1.jpg", "b.jpg"]
+    assert rows["b.jpg"]["iso"] == 400
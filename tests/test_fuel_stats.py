@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+
+from compute_mpg import recompute_mpg
+from conftest import requires_postgres
+from fuel_stats import create_stats, query_stats, refresh_stats
+
+
+@requires_postgres
+def test_rolling_stats_match_the_stored_mpg(db):
+    with db.transaction() as cur:
+        db.execute_values(cur, "INSERT INTO fuel_readings (odometer_file, total_mileage, gallons, dollars, fill_time) VALUES %s", [
+            ("", 10000, 0, 0, datetime.min.replace(tzinfo=timezone.utc)),
+            ("a.jpg", 10300, 10, 35, datetime(2025, 3, 1, tzinfo=timezone.utc)),
+            ("b.jpg", 10600, 12, 42, datetime(2025, 3, 8, tzinfo=timezone.utc)),
+        ])
+        # a legacy row written before fill_time existed sorts first, not last
+        cur.execute("INSERT INTO fuel_readings (odometer_file, total_mileage, gallons, dollars) VALUES ('old.jpg', 9700, 10, 30)")
+    recompute_mpg()
+    create_stats()
+    assert sorted(refresh_stats()) == ["fuel_stats_locations", "fuel_stats_monthly", "fuel_stats_rolling"]
+
+    columns, rows = query_stats("rolling", 10)
+    rolling = [dict(zip(columns, row)) for row in rows]
+    with db.transaction() as cur:
+        cur.execute("SELECT id, mpg FROM fuel_readings WHERE mpg IS NOT NULL")
+        stored = dict(cur.fetchall())
+    assert {r["id"]: float(r["mpg"]) for r in rolling} == stored
+    assert [r["miles"] for r in rolling] == [300, 300]
+
+    columns, rows = query_stats("monthly", 12)
+    monthly = dict(zip(columns, rows[0]))
+    assert (monthly["fill_ups"], monthly["miles"], float(monthly["mpg"])) == (2, 600, 27.27)
@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+
+import gasser_db
+
+
+def test_placeholders_translate_to_sqlite():
+    sql = "SELECT * FROM t WHERE a = %s AND b = %(name)s AND c = $2 AND d LIKE 'x%%'"
+    assert gasser_db._sqlite_sql(sql) == "SELECT * FROM t WHERE a = ? AND b = :name AND c = ?2 AND d LIKE 'x%'"
+
+def test_prepared_insert_and_latest(db):
+    with db.transaction() as cur:
+        for odometer_file, mileage, fill_time in [("a.jpg", 1000, datetime(2025, 1, 1, tzinfo=timezone.utc)),
+                                                  ("b.jpg", 1300, datetime(2025, 2, 1, tzinfo=timezone.utc))]:
+            db.execute_prepared(cur, "insert_reading", db.INSERT_READING_SQL,
+                                (odometer_file, 0, mileage, "", 30, 10, fill_time))
+        db.execute_prepared(cur, "latest_readings", db.LATEST_READINGS_SQL, (1,))
+        latest = cur.fetchone()
+    assert latest[1] == "b.jpg"
+    assert latest[12] == datetime(2025, 2, 1, tzinfo=timezone.utc)
+
+def test_execute_values(db):
+    with db.transaction() as cur:
+        db.execute_values(cur, "INSERT INTO fuel_readings (odometer_file, total_mileage) VALUES %s",
+                          [("a.jpg", 1), ("b.jpg", 2), ("c.jpg", 3)])
+        cur.execute("SELECT COUNT(*), SUM(total_mileage) FROM fuel_readings")
+        assert cur.fetchone() == (3, 6)
+
+def test_transaction_rolls_back_on_error(db):
+    try:
+        with db.transaction() as cur:
+            cur.execute("INSERT INTO fuel_readings (odometer_file) VALUES (%s)", ("a.jpg",))
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    with db.transaction() as cur:
+        cur.execute("SELECT COUNT(*) FROM fuel_readings")
+        assert cur.fetchone() == (0,)
+
+def test_infinity_round_trips(db):
+    with db.transaction() as cur:
+        cur.execute("INSERT INTO fuel_readings (odometer_file, fill_time) VALUES ('', '-infinity')")
+        cur.execute("SELECT fill_time FROM fuel_readings")
+        seed_time = cur.fetchone()[0]
+        assert seed_time == datetime.min.replace(tzinfo=timezone.utc)
+        # written back as a parameter it still compares as -infinity
+        cur.execute("SELECT COUNT(*) FROM fuel_readings WHERE fill_time = %s", (seed_time,))
+        assert cur.fetchone() == (1,)
+
+def test_execute_values_pages(db):
+    rows = [(f"{i}.jpg", i) for i in range(250)]
+    with db.transaction() as cur:
+        assert db.execute_values(cur, "INSERT INTO fuel_readings (odometer_file, total_mileage) VALUES %s", rows,
+                                 page_size=100) == 250
+        cur.execute("SELECT COUNT(*), SUM(total_mileage) FROM fuel_readings")
+        assert cur.fetchone() == (250, sum(range(250)))
+        assert db.execute_values(cur, "INSERT INTO fuel_readings (odometer_file) VALUES %s", []) == 0
+
+def test_execute_values_fetch_returning_across_pages(db):
+    rows = [(f"{i}.jpg", i) for i in range(5)]
+    statement = "INSERT INTO fuel_readings (odometer_file, total_mileage) VALUES %s ON CONFLICT DO NOTHING RETURNING odometer_file"
+    with db.transaction() as cur:
+        db.execute_values(cur, "INSERT INTO fuel_readings (odometer_file, total_mileage) VALUES %s", rows[1:2])
+        added = db.execute_values(cur, statement, rows, page_size=2, fetch=True)
+    assert sorted(added) == [("0.jpg",), ("2.jpg",), ("3.jpg",), ("4.jpg",)]
+
+def test_execute_values_beyond_the_sqlite_variable_limit(db):
+    # 40000 rows x 2 values in default pages; a single VALUES list would exceed 32766 variables
+    rows = [(f"{i}.jpg", i) for i in range(40000)]
+    with db.transaction() as cur:
+        assert db.execute_values(cur, "INSERT INTO fuel_readings (odometer_file, total_mileage) VALUES %s", rows) == 40000
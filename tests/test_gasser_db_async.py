@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import gasser_db_async
+from conftest import requires_postgres
+
+UNDATED = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def run(coro):
+    async def with_pool():
+        try:
+            return await coro
+        finally:
+            if not gasser_db_async.gasser_db.SQLITE:
+                await gasser_db_async.close_pool()
+    return asyncio.run(with_pool())
+
+def mpg_by_file(db):
+    with db.transaction() as cur:
+        cur.execute("SELECT odometer_file, mpg FROM fuel_readings")
+        return dict(cur.fetchall())
+
+@pytest.fixture
+def legacy(db):
+    """A reading from before fill_time existed (NULL), then a dated one."""
+    with db.transaction() as cur:
+        cur.execute("INSERT INTO fuel_readings (odometer_file, total_mileage, gallons, dollars) VALUES ('old.jpg', 10000, 10, 30)")
+        cur.execute("INSERT INTO fuel_readings (odometer_file, total_mileage, gallons, dollars, fill_time) "
+                    "VALUES ('a.jpg', 10300, 10, 35, %s)", (datetime(2025, 3, 1, tzinfo=timezone.utc),))
+        cur.execute("SELECT id FROM fuel_readings WHERE odometer_file = 'a.jpg'")
+        return cur.fetchone()[0]
+
+def test_recompute_around_the_neighbour_of_an_undated_row(db, legacy):
+    # a.jpg's previous reading has no fill time; it is still next to itself
+    assert run(gasser_db_async.recompute_mpg(around_id=legacy)) == 1
+    assert mpg_by_file(db)["a.jpg"] == 30.0
+
+def test_recompute_unknown_id(db):
+    with pytest.raises(ValueError):
+        run(gasser_db_async.recompute_mpg(around_id=12345))
+
+def test_insert_undated_reading(db):
+    reading = ("a.jpg", "300", "10300", "pump.jpg", "35.00", "10.000")
+    id = run(gasser_db_async.insert_reading(reading))
+    with db.transaction() as cur:
+        cur.execute("SELECT id, total_mileage, fill_time FROM fuel_readings")
+        assert cur.fetchone() == (id, 10300, UNDATED)
+
+@requires_postgres
+def test_copy_readings_dated_and_undated(db):
+    dated = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    readings = [
+        (("a.jpg", "300", "10300", "pa.jpg", "35.00", "10.000"), dated),
+        (("b.jpg", "300", "10600", "pb.jpg", "35.00", "10.000"), None),
+        (("not found", None, None, "", None, None), None),
+    ]
+    assert run(gasser_db_async.copy_readings(readings)) == 2
+    assert run(gasser_db_async.copy_readings(readings)) == 0
+    with db.transaction() as cur:
+        cur.execute("SELECT odometer_file, fill_time FROM fuel_readings ORDER BY id")
+        assert cur.fetchall() == [("b.jpg", UNDATED), ("a.jpg", dated)]
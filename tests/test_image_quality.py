@@ -0,0 +1,60 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from image_quality import REJECTED_DIR, REPORT_FILE, gate_folder, screen_folder
+
+
+def display(seed=0):
+    """A grey photo with a lit seven-segment-like display in the middle."""
+    rng = np.random.default_rng(seed)
+    img = np.full((240, 320), 90, dtype=np.uint8)
+    for x in range(90, 230, 35):
+        img[80:160, x:x + 6] = 220             # vertical segments
+        img[80:86, x:x + 25] = 220             # top segments
+        img[154:160, x:x + 25] = 220           # bottom segments
+    img = np.clip(img + rng.normal(0, 4, img.shape), 0, 255).astype(np.uint8)
+    return Image.fromarray(img).convert("RGB")
+
+@pytest.fixture
+def thumbnails(tmp_path):
+    folder = tmp_path / "images_thumbnails"
+    folder.mkdir()
+    display().save(folder / "sharp.jpg", quality=95)
+    display(1).filter(ImageFilter.GaussianBlur(6)).save(folder / "blurred.jpg", quality=95)
+    Image.eval(display(2), lambda v: v // 6).save(folder / "dark.jpg", quality=95)
+    glare = np.asarray(display(3)).copy()
+    glare[70:170, 80:240] = 255
+    Image.fromarray(glare).save(folder / "glare.jpg", quality=95)
+    return folder
+
+def test_gate_moves_unreadable_photos_aside(thumbnails):
+    passed, rejected = gate_folder(str(thumbnails))
+    assert [os.path.basename(p) for p in passed] == ["sharp.jpg"]
+    reasons = {os.path.basename(q.path): q.reasons for q in rejected}
+    assert reasons["blurred.jpg"][0].startswith("blurry")
+    assert any(r.startswith("too dark") for r in reasons["dark.jpg"])
+    assert any(r.startswith("glare") for r in reasons["glare.jpg"])
+    assert not any(r.startswith("too dark") for r in reasons["blurred.jpg"] + reasons["glare.jpg"])
+
+    assert sorted(os.listdir(thumbnails)) == [REJECTED_DIR, "sharp.jpg"]
+    with open(thumbnails / REJECTED_DIR / REPORT_FILE, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    assert sorted(report) == ["blurred.jpg", "dark.jpg", "glare.jpg"]
+    assert report["dark.jpg"]["bright_level"] < 60
+
+def test_dry_run_moves_nothing(thumbnails):
+    passed, rejected = gate_folder(str(thumbnails), dry_run=True)
+    assert (len(passed), len(rejected)) == (1, 3)
+    assert len(os.listdir(thumbnails)) == 4
+
+def test_thresholds_are_options(thumbnails):
+    passed, _ = gate_folder(str(thumbnails), min_sharpness=0, max_glare=1.0, dry_run=True)
+    assert sorted(os.path.basename(p) for p in passed) == ["blurred.jpg", "glare.jpg", "sharp.jpg"]
+
+def test_screen_folder_without_quality_keeps_everything(thumbnails):
+    assert len(screen_folder(str(thumbnails), dedup_distance=None, quality=False)) == 4
+    assert [os.path.basename(p) for p in screen_folder(str(thumbnails), dedup_distance=None)] == ["sharp.jpg"]
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import job_queue
+
+
+def job(key):
+    return {"job": key, "files": [f"{key}-odo.jpg", f"{key}-pump.jpg"]}
+
+@pytest.fixture
+def queue(db):
+    job_queue.ensure_table()
+    job_queue.enqueue([job("fillup-1"), job("fillup-2")])
+    return db
+
+def set_claimed_at(db, when):
+    with db.transaction() as cur:
+        cur.execute("UPDATE pipeline_jobs SET claimed_at = %s", (when,))
+
+def test_enqueue_skips_known_jobs(queue, capsys):
+    assert job_queue.enqueue([job("fillup-1"), job("fillup-3"), job("fillup-3")]) == 1
+    out = capsys.readouterr().out
+    assert "fillup-1 is already queued; skipped" in out
+    assert out.count("fillup-3 is already queued; skipped") == 1
+
+def test_claim_oldest_first(queue):
+    first = job_queue.claim("w1", max_attempts=3)
+    second = job_queue.claim("w2", max_attempts=3)
+    assert (first["job_key"], second["job_key"]) == ("fillup-1", "fillup-2")
+    assert first["stage"] == "metadata" and first["attempts"] == 1
+    assert first["payload"] == job("fillup-1")
+    assert job_queue.claim("w3", max_attempts=3) is None
+
+def test_failed_job_retried_until_max_attempts(queue):
+    j = job_queue.claim("w", max_attempts=2)
+    job_queue.save(j, "analyze", "failed", "boom")
+    # a failed job is claimed again before the newer pending ones
+    again = job_queue.claim("w", max_attempts=2)
+    assert again["job_key"] == "fillup-1"
+    assert (again["stage"], again["attempts"]) == ("analyze", 2)
+    job_queue.save(again, "analyze", "failed", "boom")
+    job_queue.save(job_queue.claim("w", max_attempts=2), "write", "done")    # fillup-2
+    assert job_queue.claim("w", max_attempts=2) is None
+
+    assert job_queue.retry_failed("fillup-1") == 1
+    assert job_queue.claim("w", max_attempts=2)["attempts"] == 1
+
+def test_requeue_stale_uses_heartbeat(queue):
+    j = job_queue.claim("w", max_attempts=3)
+    set_claimed_at(queue, datetime.now(timezone.utc) - timedelta(hours=1))
+    # a stage finished: the heartbeat is fresh again
+    job_queue.save(j, "thumbnails", "running")
+    assert job_queue.requeue_stale(30) == 0
+
+    set_claimed_at(queue, datetime.now(timezone.utc) - timedelta(hours=1))
+    assert job_queue.requeue_stale(30) == 1
+    resumed = job_queue.claim("w2", max_attempts=3)
+    assert (resumed["job_key"], resumed["stage"]) == ("fillup-1", "thumbnails")
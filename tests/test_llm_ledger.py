@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+import llm_ledger
+from write_results_sql import write_llm_gauge_info_sql
+
+
+@pytest.fixture
+def ledger(db, tmp_path, monkeypatch):
+    # conftest turns the ledger off for the other tests
+    monkeypatch.setattr(llm_ledger, "ENABLED", True)
+    monkeypatch.setattr(llm_ledger, "_table_ready", False)
+    monkeypatch.setattr(llm_ledger, "_disabled_reason", None)
+    # no image_metadata.sqlite here
+    monkeypatch.chdir(tmp_path)
+    return db
+
+def model_call(*files, prompt_tokens=900):
+    with llm_ledger.call("local", "qwen2.5-vl", [f"images_thumbnails/{name}" for name in files]) as c:
+        c.response = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=40))
+
+def calls(db):
+    with db.transaction() as cur:
+        cur.execute("SELECT files, prompt_tokens, cost_usd, status, reading_id FROM llm_calls ORDER BY id")
+        return cur.fetchall()
+
+def reading_ids(db):
+    with db.transaction() as cur:
+        cur.execute("SELECT odometer_file, id FROM fuel_readings")
+        return dict(cur.fetchall())
+
+def test_new_reading_links_only_its_calls(ledger):
+    model_call("odo.jpg", "pump.jpg")
+    model_call("other-odo.jpg", "other-pump.jpg")
+    id = write_llm_gauge_info_sql("odo.jpg", "300", "10300", "pump.jpg", "35.00", "10.0")
+    assert calls(ledger) == [
+        ('["odo.jpg", "pump.jpg"]', 900, 0.0, "ok", id),
+        ('["other-odo.jpg", "other-pump.jpg"]', 900, 0.0, "ok", None),
+    ]
+
+def test_pump_photo_alone_links_the_call(ledger):
+    # the model could not find the odometer photo; the pump photo still ties the call to the reading
+    model_call("pump.jpg")
+    id = write_llm_gauge_info_sql("not found", "300", "10300", "pump.jpg", "35.00", "10.0")
+    assert calls(ledger)[0][4] == id
+    assert llm_ledger.link_reading("not found", None) == 0
+
+def test_link_readings_catches_up_on_older_calls(ledger):
+    model_call("odo.jpg", "pump.jpg")
+    with ledger.transaction() as cur:
+        cur.execute("INSERT INTO fuel_readings (odometer_file, gaspump_file) VALUES ('odo.jpg', 'pump.jpg')")
+    assert llm_ledger.link_readings() == 1
+    assert llm_ledger.link_readings() == 0
+    assert calls(ledger)[0][4] == reading_ids(ledger)["odo.jpg"]
+
+def test_failed_call_is_recorded(ledger):
+    with pytest.raises(RuntimeError):
+        with llm_ledger.call("local", "qwen2.5-vl", ["odo.jpg"]):
+            raise RuntimeError("model down")
+    assert calls(ledger) == [('["odo.jpg"]', None, 0.0, "error", None)]
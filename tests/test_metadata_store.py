@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+import metadata_store
+
+exif_to_json_and_csv = pytest.importorskip("exif_to_json_and_csv")
+
+
+class RecordingExifTool:
+    """Answers execute() like `exiftool -G -j -n` and remembers which files were read."""
+
+    def __init__(self):
+        self.files = []
+
+    def execute(self, *args):
+        path = args[-1].decode("utf-8")
+        self.files.append(os.path.basename(path))
+        return json.dumps([{"File:FileName": os.path.basename(path), "EXIF:DateTimeOriginal": "2025:08:18 18:49:56"}])
+
+
+@pytest.fixture
+def images(tmp_path):
+    folder = tmp_path / "attachments"
+    folder.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        (folder / name).write_bytes(b"jpeg " + name.encode())
+    return folder
+
+@pytest.fixture
+def store(tmp_path):
+    conn = metadata_store.open_store(str(tmp_path / "image_metadata.sqlite"))
+    yield conn
+    conn.close()
+
+def update(store, folder, et):
+    files = exif_to_json_and_csv.collect_files(str(folder), exif_to_json_and_csv.DEFAULT_IMAGE_EXTENSIONS)
+    return exif_to_json_and_csv.update_store(store, files, "", 0, no_geo=True, et=et)
+
+def test_only_new_or_changed_images_are_extracted(store, images):
+    et = RecordingExifTool()
+    assert len(update(store, images, et)) == 2
+    assert update(store, images, et) == []
+    assert et.files == ["a.jpg", "b.jpg"]
+
+    (images / "b.jpg").write_bytes(b"a longer jpeg than before")
+    (images / "c.jpg").write_bytes(b"jpeg c")
+    assert [os.path.basename(p) for p in update(store, images, et)] == ["b.jpg", "c.jpg"]
+    assert et.files == ["a.jpg", "b.jpg", "b.jpg", "c.jpg"]
+
+    rec = metadata_store.find_by_filename(store, "c.jpg")
+    assert rec["DateTimeOriginal"] == "2025:08:18 18:49:56"
+    assert rec["Location"] == "No GPS data"
+
+def test_prune_missing_drops_deleted_images(store, images, tmp_path):
+    update(store, images, RecordingExifTool())
+    os.remove(images / "a.jpg")
+    assert metadata_store.prune_missing(store) == 1
+    assert metadata_store.prune_missing(store) == 0
+    assert metadata_store.find_by_filename(store, "a.jpg") is None
+
+    csv_out = tmp_path / "image_metadata_full.csv"
+    assert metadata_store.export_csv(store, str(csv_out)) == 1
+    header, row = csv_out.read_text(encoding="utf-8").splitlines()
+    assert header.split(",") == metadata_store.CSV_COLUMNS
+    assert row.startswith("b.jpg,")
+
+def test_fill_time_prefers_exif_then_file_name(store, images):
+    update(store, images, RecordingExifTool())
+    assert metadata_store.fill_time_for(["a.jpg"], store).isoformat() == "2025-08-18T18:49:56+00:00"
+    assert metadata_store.fill_time_for(["2025-08-19T07-00-00+02-00_IMG_1.jpg"], store).isoformat() == "2025-08-19T07:00:00+02:00"
+    assert metadata_store.fill_time_for(["IMG_1.jpg"], store) is None
@@ -0,0 +1,26 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from metrics import quantile
+
+
+def test_quantile_empty():
+    assert math.isnan(quantile([], 0.5))
+
+def test_quantile_single():
+    assert quantile([4.0], 0.0) == quantile([4.0], 0.95) == 4.0
+
+def test_quantile_interpolates():
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert quantile(values, 0.0) == 1.0
+    assert quantile(values, 0.5) == 2.5
+    assert quantile(values, 1.0) == 4.0
+
+@pytest.mark.parametrize("q", [0.05, 0.5, 0.9, 0.95, 0.99])
+def test_quantile_matches_numpy(q):
+    rng = random.Random(3)
+    values = sorted(rng.uniform(0, 100) for _ in range(101))
+    assert quantile(values, q) == pytest.approx(float(np.percentile(values, q * 100)))
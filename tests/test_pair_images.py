@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+from pair_images import Photo, job_key, pair_records, sweep
+
+T0 = datetime(2025, 8, 18, 18, 49, tzinfo=timezone.utc)
+HOME = (40.0, -75.0)
+AWAY = (40.05, -75.0)        # about 5.6 km north
+
+
+def photo(minutes, name, where=HOME):
+    lat, lng = where if where else (None, None)
+    return Photo(T0 + timedelta(minutes=minutes), name, lat, lng)
+
+def names(groups):
+    return [[p.file_path for p in g] for g in groups]
+
+def test_sweep_cuts_on_time_gap():
+    photos = [photo(0, "odo"), photo(3, "pump"), photo(3 * 24 * 60, "next-odo"), photo(3 * 24 * 60 + 2, "next-pump")]
+    assert names(sweep(photos, 600, 500, 4)) == [["odo", "pump"], ["next-odo", "next-pump"]]
+
+def test_sweep_sorts_by_time():
+    photos = [photo(2, "pump"), photo(0, "odo")]
+    assert names(sweep(photos, 600, 500, 4)) == [["odo", "pump"]]
+
+def test_sweep_cuts_on_distance():
+    photos = [photo(0, "odo"), photo(2, "pump"), photo(4, "elsewhere", AWAY)]
+    assert names(sweep(photos, 600, 500, 4)) == [["odo", "pump"], ["elsewhere"]]
+
+def test_sweep_keeps_photos_without_gps():
+    photos = [photo(0, "odo", None), photo(2, "pump"), photo(3, "retake", None)]
+    assert names(sweep(photos, 600, 500, 4)) == [["odo", "pump", "retake"]]
+
+def test_sweep_max_size():
+    photos = [photo(i, f"p{i}") for i in range(5)]
+    assert names(sweep(photos, 600, 500, 2)) == [["p0", "p1"], ["p2", "p3"], ["p4"]]
+
+def test_pair_records_jobs_and_unpaired():
+    records = [
+        {"FileName": "2025-08-18T18-49-56+00-00_IMG_1.jpg", "GPSLatitudeFixed": 40.0, "GPSLongitudeFixed": -75.0},
+        {"FileName": "2025-08-18T18-51-10+00-00_IMG_2.jpg", "GPSLatitudeFixed": 40.0, "GPSLongitudeFixed": -75.0},
+        {"FileName": "2025-08-25T09-00-00+00-00_IMG_3.jpg"},
+        {"FileName": "IMG_4.jpg"},
+    ]
+    jobs, unpaired = pair_records(records, window_min=10, radius_m=500)
+    assert len(jobs) == 1
+    assert jobs[0]["job"].startswith("fillup-20250818T184956-")
+    assert jobs[0]["file_names"] == ["2025-08-18T18-49-56+00-00_IMG_1.jpg", "2025-08-18T18-51-10+00-00_IMG_2.jpg"]
+    assert jobs[0]["span_sec"] == 74
+    assert sorted(unpaired) == ["2025-08-25T09-00-00+00-00_IMG_3.jpg", "IMG_4.jpg"]
+
+def test_job_keys_of_groups_starting_in_the_same_second_differ():
+    # two cars at one station, both odometers photographed at 18:49:00
+    first = [photo(0, "a/odo.jpg"), photo(2, "a/pump.jpg")]
+    second = [photo(0, "b/odo2.jpg"), photo(3, "b/pump2.jpg")]
+    assert job_key(first) != job_key(second)
+    assert job_key(first).startswith("fillup-20250818T184900-")
+    # the key only depends on the group, so re-pairing the same photos gives the same key
+    assert job_key(first) == job_key([photo(0, "elsewhere/odo.jpg"), photo(2, "elsewhere/pump.jpg")])
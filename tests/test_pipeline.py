@@ -0,0 +1,135 @@
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import pipeline
+
+BACKFILL = "2025-03-10T10-00-00+00-00_odo.jpg"
+
+
+def insert(cur, odometer_file, mileage, gallons, day):
+    cur.execute("INSERT INTO fuel_readings (odometer_file, gaspump_file, total_mileage, gallons, dollars, fill_time) "
+                "VALUES (%s, %s, %s, %s, 35, %s)",
+                (odometer_file, f"pump-{odometer_file}", mileage, gallons, datetime(2025, 3, day, tzinfo=timezone.utc)))
+
+def readings_by_file(db):
+    with db.transaction() as cur:
+        cur.execute("SELECT id, odometer_file, mpg, location FROM fuel_readings")
+        return {f: (id, mpg, location) for id, f, mpg, location in cur.fetchall()}
+
+def results(odometer_file, mileage, gallons):
+    return {
+        "odometer_image": {"file": odometer_file, "top_value_trip": "150", "bottom_value_total_mileage": mileage},
+        "gas_pump_image": {"file": "pump.jpg", "top_value_dollars": "17.50", "bottom_value_gallons": gallons},
+    }
+
+@pytest.fixture
+def args(db, tmp_path, monkeypatch):
+    # no image_metadata.sqlite in the working directory: the fill time comes from the file name
+    monkeypatch.chdir(tmp_path)
+    with db.transaction() as cur:
+        insert(cur, "a.jpg", 10300, 10.0, 1)
+        insert(cur, "b.jpg", 10600, 12.0, 8)
+        insert(cur, "c.jpg", 10900, 10.0, 15)       # the latest fill_time
+    store = tmp_path / "image_metadata_full.json"
+    store.write_text(json.dumps([
+        {"FileName": "pump.jpg", "GPSLatitudeFixed": 40.0, "GPSLongitudeFixed": -75.0, "Location": "Backfill place"},
+        {"FileName": "c.jpg", "GPSLatitudeFixed": 1.0, "GPSLongitudeFixed": 1.0, "Location": "Latest place"},
+    ]), encoding="utf-8")
+    return SimpleNamespace(store=str(store))
+
+def test_backfilled_reading_gets_its_own_mpg_and_location(db, args):
+    state = {"results": results(BACKFILL, "10750", "5.0")}
+    pipeline.stage_write(args, state)
+    readings = readings_by_file(db)
+    assert state["reading_id"] == readings[BACKFILL][0]
+    assert state["reading_files"] == [BACKFILL, "pump.jpg"]
+
+    pipeline.stage_mpg(args, state)
+    pipeline.stage_location(args, state)
+    readings = readings_by_file(db)
+    assert readings[BACKFILL][1:] == (30.0, "Backfill place")    # 10750 - 10600 over 5 gallons
+    assert readings["c.jpg"][1:] == (15.0, None)                 # the reading after it, not geotagged
+    assert readings["a.jpg"][1] is None                          # outside the recompute window
+
+def test_rerun_of_write_reuses_the_reading(db, args):
+    state = {"results": results(BACKFILL, "10750", "5.0")}
+    pipeline.stage_write(args, state)
+    first = state["reading_id"]
+    pipeline.stage_write(args, state)
+    assert state["reading_id"] == first
+    assert len(readings_by_file(db)) == 4
+
+def test_unreadable_odometer_photo_still_gets_its_id(db, args):
+    state = {"results": results("not found", "10750", "5.0")}
+    pipeline.stage_write(args, state)
+    assert state["reading_id"] == readings_by_file(db)["not found"][0]
+
+########################
+# stage cache
+
+def run_args(tmp_path, store, **options):
+    defaults = dict(
+        folder=str(tmp_path / "attachments"), thumbnails=str(tmp_path / "thumbnails"), store=store,
+        prompt_file=str(tmp_path / "prompt_file"), runner="local", model="gpt-4o-mini", mosaic=False,
+        email="", rate_sec=0, no_geo=True, no_cost=False, no_dedup=False, no_quality=False, dedup_distance=24,
+        checkpoint=False, results=str(tmp_path / "results_llm.json"), cache_dir=str(tmp_path / "cache"),
+        from_stage=None, only=None, force=False, dry_run=False,
+    )
+    defaults.update(options)
+    return SimpleNamespace(**defaults)
+
+def ran(capsys):
+    return [line[4:-4] for line in capsys.readouterr().out.splitlines() if line.startswith("=== ") and line.endswith(" ===")]
+
+@pytest.fixture
+def cached_run(args, tmp_path, capsys):
+    (tmp_path / "results_llm.json").write_text(json.dumps(results(BACKFILL, "10750", "5.0")), encoding="utf-8")
+    state = pipeline.run(run_args(tmp_path, args.store))
+    assert ran(capsys) == ["write", "mpg", "location"]
+    return state
+
+def test_unchanged_stages_are_skipped(db, cached_run, tmp_path, capsys):
+    state = pipeline.run(run_args(tmp_path, str(tmp_path / "image_metadata_full.json")))
+    out = capsys.readouterr().out
+    for name in ("write", "mpg", "location"):
+        assert f"=== {name}: unchanged, skipped" in out
+    # the write stage's outputs come back from the cache
+    assert state["reading_id"] == cached_run["reading_id"]
+    assert len(readings_by_file(db)) == 4
+
+def test_changed_input_reruns_downstream_stages(db, cached_run, tmp_path, capsys):
+    store = tmp_path / "image_metadata_full.json"
+    records = json.loads(store.read_text(encoding="utf-8"))
+    records[0]["Location"] = "Moved place"
+    store.write_text(json.dumps(records), encoding="utf-8")
+    pipeline.run(run_args(tmp_path, str(store)))
+    assert ran(capsys) == ["write", "mpg", "location"]
+    assert readings_by_file(db)[BACKFILL][2] == "Moved place"
+    assert len(readings_by_file(db)) == 4
+
+def test_from_reruns_with_cached_outputs(db, cached_run, tmp_path, capsys):
+    with db.transaction() as cur:
+        cur.execute("UPDATE fuel_readings SET mpg = NULL")
+    pipeline.run(run_args(tmp_path, str(tmp_path / "image_metadata_full.json"), from_stage="mpg"))
+    assert ran(capsys) == ["mpg", "location"]
+    assert readings_by_file(db)[BACKFILL][1] == 30.0
+
+def test_fingerprint_follows_config_and_dependencies(tmp_path):
+    cache = pipeline.StageCache(str(tmp_path / "cache"))
+    location = next(s for s in pipeline.STAGES if s.name == "location")
+    upstream = {"write": "w", "mpg": "m", "metadata": "x"}
+    base = pipeline.fingerprint(location, run_args(tmp_path, "a.sqlite"), cache, upstream)
+    assert pipeline.fingerprint(location, run_args(tmp_path, "a.sqlite", model="other"), cache, upstream) == base
+    assert pipeline.fingerprint(location, run_args(tmp_path, "b.sqlite"), cache, upstream) != base
+    assert pipeline.fingerprint(location, run_args(tmp_path, "a.sqlite"), cache, dict(upstream, mpg="m2")) != base
+
+def test_select_stages(tmp_path):
+    allowed, forced = pipeline.select_stages(run_args(tmp_path, "a.sqlite", from_stage="mpg"))
+    assert allowed == forced == {"mpg", "location"}
+    allowed, forced = pipeline.select_stages(run_args(tmp_path, "a.sqlite", only=["write", "cost"], no_cost=True))
+    assert (allowed, forced) == ({"write"}, set())
+    allowed, _ = pipeline.select_stages(run_args(tmp_path, "a.sqlite"))
+    assert "analyze" not in allowed and "location" in allowed
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from read_update_metadata import location_values, update_all_locations, update_locations
+
+
+def insert(cur, odometer_file, gaspump_file):
+    cur.execute("INSERT INTO fuel_readings (odometer_file, gaspump_file) VALUES (%s, %s)", (odometer_file, gaspump_file))
+
+def locations(db):
+    with db.transaction() as cur:
+        cur.execute("SELECT odometer_file, lat, lng, location FROM fuel_readings ORDER BY id")
+        return {f: rest for f, *rest in cur.fetchall()}
+
+@pytest.fixture
+def readings(db):
+    with db.transaction() as cur:
+        insert(cur, "", "")
+        insert(cur, "odo-1.jpg", "pump-1.jpg")
+        insert(cur, "odo-2.jpg", "pump-2.jpg")
+        insert(cur, "odo-3.jpg", "pump-3.jpg")
+    return db
+
+RECORDS = [
+    {"FileName": "odo-1.jpg", "GPSLatitudeFixed": 40.0, "GPSLongitudeFixed": -75.0, "Location": "Odometer place"},
+    {"FileName": "pump-1.jpg", "GPSLatitudeFixed": 41.0, "GPSLongitudeFixed": -76.0, "Location": "Pump place"},
+    {"FileName": "pump-2.jpg", "GPSLatitudeFixed": 42.0, "GPSLongitudeFixed": -77.0, "Location": "Pump only"},
+    {"FileName": "odo-3.jpg", "GPSLatitudeFixed": None, "GPSLongitudeFixed": None, "Location": "No GPS data"},
+    {"FileName": "elsewhere.jpg", "GPSLatitudeFixed": 1.0, "GPSLongitudeFixed": 1.0, "Location": "Unrelated"},
+]
+
+def test_location_values_skip_images_without_gps():
+    assert [v[0] for v in location_values(RECORDS)] == ["odo-1.jpg", "pump-1.jpg", "pump-2.jpg", "elsewhere.jpg"]
+
+def test_batch_update_prefers_the_odometer_photo(readings):
+    assert update_locations(location_values(RECORDS)) == 2
+    geotagged = locations(readings)
+    assert geotagged["odo-1.jpg"] == [40.0, -75.0, "Odometer place"]
+    assert geotagged["odo-2.jpg"] == [42.0, -77.0, "Pump only"]
+    assert geotagged["odo-3.jpg"] == [None, None, None]
+    assert geotagged[""] == [None, None, None]
+    # a re-run changes nothing
+    assert update_locations(location_values(RECORDS)) == 0
+
+def test_update_all_from_json(readings, tmp_path):
+    path = tmp_path / "image_metadata_full.json"
+    path.write_text(json.dumps(RECORDS), encoding="utf-8")
+    assert update_all_locations(path) == (4, 2)
+
+def test_odometer_wins_across_pages(readings):
+    # the two photos of reading 1 land in different execute_values pages
+    odometer, pump, *rest = location_values(RECORDS)
+    values = [odometer] + [(f"other-{i}.jpg", 0.0, 0.0, "x") for i in range(5000)] + [pump] + rest
+    assert update_locations(values) == 2
+    assert locations(readings)["odo-1.jpg"] == [40.0, -75.0, "Odometer place"]
@@ -0,0 +1,74 @@
+import pytest
+from PIL import Image
+
+import run_vision_query_locally as runner
+from run_vision_query_locally import MOSAIC_LABEL, MOSAIC_TILE, build_mosaic, parse_answer, tile_file
+
+FILES = ["IMG_1.jpg", "IMG_2.jpg", "IMG_3.jpg"]
+
+
+def test_tile_file_maps_numbers_to_files():
+    assert tile_file(FILES, {"tile": 2}) == "IMG_2.jpg"
+    assert tile_file(FILES, {"tile": "3"}) == "IMG_3.jpg"
+
+@pytest.mark.parametrize("part", [{"tile": 0}, {"tile": 4}, {"tile": None}, {"tile": "first"}, {}, None, "1"])
+def test_tile_file_rejects_what_is_not_a_tile(part):
+    assert tile_file(FILES, part) is None
+
+def test_parse_answer_finds_the_json_in_prose():
+    answer = 'Here you go:\n```json\n{"odometer": {"tile": 1, "trip": "300", "total_mileage": "10300"}}\n```'
+    assert parse_answer(answer) == {"odometer": {"tile": 1, "trip": "300", "total_mileage": "10300"}}
+    assert parse_answer("I cannot read these displays.") is None
+
+def test_build_mosaic_one_tile_per_photo(tmp_path):
+    paths = []
+    for name in FILES:
+        Image.new("RGB", (800, 600), (40, 40, 40)).save(tmp_path / name)
+        paths.append(str(tmp_path / name))
+    assert build_mosaic(paths).size == (MOSAIC_TILE[0] * 3, MOSAIC_LABEL + MOSAIC_TILE[1])
+
+@pytest.fixture
+def folder(tmp_path):
+    # plain photos: the local seven-segment reader finds no pump display, so every photo is a tile
+    for name in FILES:
+        Image.new("RGB", (320, 240), (90, 90, 90)).save(tmp_path / name)
+    return str(tmp_path)
+
+def answer_with(monkeypatch, answer):
+    """The model's answer to the mosaic request, without an LM Studio server."""
+    asked = []
+    monkeypatch.setattr(runner, "process_mosaic", lambda paths: asked.extend(paths) or answer)
+    return asked
+
+def test_analyze_mosaic_reads_the_named_tiles(folder, monkeypatch):
+    asked = answer_with(monkeypatch, {
+        "odometer": {"tile": 3, "trip": "300.1", "total_mileage": "10300"},
+        "pump": {"tile": "1", "dollars": "35.00", "gallons": "10.000"},
+    })
+    results = runner.analyze_mosaic(folder)
+    assert [p.rsplit("/", 1)[1] for p in asked] == FILES
+    assert results["odometer_image"] == {"file": "IMG_3.jpg", "bottom_value_total_mileage": "10300", "top_value_trip": "300.1"}
+    assert results["gas_pump_image"] == {"file": "IMG_1.jpg", "top_value_dollars": "35.00", "bottom_value_gallons": "10.000"}
+    assert results["input_files"] == ["IMG_3.jpg", "IMG_1.jpg"]
+
+def test_analyze_mosaic_rejects_one_tile_for_both_displays(folder, monkeypatch):
+    answer_with(monkeypatch, {
+        "odometer": {"tile": 2, "trip": "300.1", "total_mileage": "10300"},
+        "pump": {"tile": 2, "dollars": "35.00", "gallons": "10.000"},
+    })
+    results = runner.analyze_mosaic(folder)
+    assert results["odometer_image"] == results["gas_pump_image"] == {}
+
+def test_analyze_mosaic_ignores_a_tile_out_of_range(folder, monkeypatch):
+    answer_with(monkeypatch, {
+        "odometer": {"tile": 7, "trip": "300.1", "total_mileage": "10300"},
+        "pump": {"tile": 2, "dollars": "35.00", "gallons": "10.000"},
+    })
+    results = runner.analyze_mosaic(folder)
+    assert results["odometer_image"] == {}
+    assert results["gas_pump_image"]["file"] == "IMG_2.jpg"
+
+def test_analyze_mosaic_without_an_answer(folder, monkeypatch):
+    answer_with(monkeypatch, None)
+    results = runner.analyze_mosaic(folder)
+    assert (results["odometer_image"], results["gas_pump_image"], results["input_files"]) == ({}, {}, [])
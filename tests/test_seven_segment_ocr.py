@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from seven_segment_ocr import DIGITS, SEGMENT_BOXES, PumpReading, pump_numbers, pump_values, read_digit
+
+# the canonical segments of each digit (the first DIGITS entry for it)
+SEGMENTS = {}
+for segments, digit in DIGITS.items():
+    SEGMENTS.setdefault(digit, segments)
+
+
+def digit_box(segments, h=40, w=24):
+    box = np.zeros((h, w), dtype=bool)
+    for seg in segments:
+        x0, x1, y0, y1 = SEGMENT_BOXES[seg]
+        box[int(y0 * h):int(y1 * h), int(x0 * w):int(x1 * w)] = True
+    return box
+
+@pytest.mark.parametrize("digit", sorted(SEGMENTS))
+def test_read_digit(digit):
+    assert read_digit(digit_box(SEGMENTS[digit])) == (digit, 1.0)
+
+def test_read_narrow_one():
+    box = np.ones((40, 6), dtype=bool)
+    assert read_digit(box) == ("1", 1.0)
+
+def test_unknown_segments():
+    assert read_digit(digit_box("ag")) == ("?", 0.0)
+    assert read_digit(np.zeros((40, 24), dtype=bool)) == ("?", 0.0)
+
+def test_half_lit_segment_lowers_confidence():
+    box = digit_box(SEGMENTS["8"])
+    x0, x1, y0, y1 = SEGMENT_BOXES["g"]
+    # a quarter of segment g lit: read as off, but not surely
+    box[int(y0 * 40):int(y1 * 40), int(x0 * 24):int(x1 * 24)] = False
+    box[int(y0 * 40):int(y1 * 40), int(x0 * 24):int(x0 * 24) + 2] = True
+    digit, confidence = read_digit(box)
+    assert digit == "0"
+    assert 0.0 < confidence < 1.0
+
+def test_pump_numbers():
+    assert pump_numbers([("37.87", 0.9), ("8.669", 0.95)]) == (37.87, 8.669, 0.9)
+
+def test_pump_numbers_skips_rows_that_are_not_numbers():
+    assert pump_numbers([("??", 0.0), ("37.87", 1.0), ("8.669", 1.0), ("3.999", 1.0)]) == (37.87, 8.669, 1.0)
+
+def test_pump_numbers_implausible_price():
+    # gallons above dollars: $0.23 a gallon
+    assert pump_numbers([("8.669", 1.0), ("37.87", 1.0)]) == (None, None, 0.0)
+
+def test_pump_numbers_unusual_decimals_less_sure():
+    dollars, gallons, confidence = pump_numbers([("37.8", 1.0), ("8.669", 1.0)])
+    assert (dollars, gallons) == (37.8, 8.669)
+    assert confidence == pytest.approx(0.8)
+
+def test_pump_numbers_needs_two():
+    assert pump_numbers([("37.87", 1.0)]) == (None, None, 0.0)
+
+def test_pump_values_text():
+    assert pump_values(PumpReading(37.5, 8.6, 1.0, [], "lcd")) == ("37.50", "8.600")
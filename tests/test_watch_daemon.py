@@ -0,0 +1,48 @@
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("exiftool")
+import watch_daemon
+
+
+def insert(cur, odometer_file, mileage, gallons, day):
+    cur.execute("INSERT INTO fuel_readings (odometer_file, total_mileage, gallons, dollars, fill_time) "
+                "VALUES (%s, %s, %s, 35, %s)", (odometer_file, mileage, gallons, datetime(2025, 3, day, tzinfo=timezone.utc)))
+
+def readings_by_file(db):
+    with db.transaction() as cur:
+        cur.execute("SELECT odometer_file, mpg, location FROM fuel_readings")
+        return {f: (mpg, location) for f, mpg, location in cur.fetchall()}
+
+@pytest.fixture
+def worker(db, tmp_path):
+    """A Worker without exiftool or a model: extract and analyze answer for a late photo pair."""
+    with db.transaction() as cur:
+        insert(cur, "a.jpg", 10300, 10.0, 1)
+        insert(cur, "b.jpg", 10600, 12.0, 8)
+        insert(cur, "c.jpg", 10900, 10.0, 15)
+    store = tmp_path / "image_metadata_full.json"
+    store.write_text(json.dumps([
+        {"FileName": "late-odo.jpg", "GPSLatitudeFixed": 40.0, "GPSLongitudeFixed": -75.0, "Location": "Late place"},
+        {"FileName": "c.jpg", "GPSLatitudeFixed": 1.0, "GPSLongitudeFixed": 1.0, "Location": "Latest place"},
+    ]), encoding="utf-8")
+    worker = watch_daemon.Worker.__new__(watch_daemon.Worker)
+    worker.args = SimpleNamespace(store=str(store), thumbnails=str(tmp_path / "thumbnails"))
+    worker.extract = lambda paths: datetime(2025, 3, 10, tzinfo=timezone.utc)
+    worker.thumbnails = lambda paths, batch_dir: None
+    worker.screen = lambda batch_dir: []
+    worker.analyze = lambda batch_dir: {
+        "odometer_image": {"file": "late-odo.jpg", "top_value_trip": "150", "bottom_value_total_mileage": "10750"},
+        "gas_pump_image": {"file": "late-pump.jpg", "top_value_dollars": "17.50", "bottom_value_gallons": "5.0"},
+    }
+    return worker
+
+def test_late_photos_update_their_own_reading(db, worker):
+    worker.process(["late-odo.jpg", "late-pump.jpg"])
+    readings = readings_by_file(db)
+    assert readings["late-odo.jpg"] == (30.0, "Late place")     # 10750 - 10600 over 5 gallons
+    assert readings["c.jpg"] == (15.0, None)                    # recomputed, but not geotagged
+    assert readings["a.jpg"] == (None, None)
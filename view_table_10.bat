@@ -1,3 +1,3 @@
 echo "Display Important Values from the table fuel_readings"
-psql -c "select id, total_mileage, mpg, lat,lng,location from fuel_readings order by id desc limit 10"
+psql -c "select id, fill_time, total_mileage, mpg, lat,lng,location from fuel_readings order by fill_time desc nulls last, id desc limit 10"
 
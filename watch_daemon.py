@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+watch_daemon.py
+---------------
+Long-running mode: watch ./attachments and push each new fill-up through
+EXIF, thumbnails, inference, SQL write, MPG and location as soon as its photos
+have arrived, instead of waiting for someone to run dogasser.bat.
+
+- File events come from watchdog (inotify on Linux, ReadDirectoryChangesW on
+  Windows) when it is installed, otherwise the folder is polled
+- New images are collected into a batch; the batch is processed once it holds
+  an odometer/pump pair (--pair-size) and no file has changed for --settle
+  seconds (photos are often still being written when the first event arrives)
+- Each batch's thumbnails go through the near-duplicate and quality screens
+  of pipeline.py (image_quality.screen_folder) before inference
+- exiftool, the LLM client and the database pool stay up between batches
+
+Usage:
+  python watch_daemon.py
+  python watch_daemon.py --runner chatgpt --model gpt-4o-mini --settle 10
+  python watch_daemon.py --poll 2              # force polling
+"""
+import argparse
+import os
+import queue
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    # polling fallback
+    Observer = None
+    FileSystemEventHandler = object
+
+import exiftool
+
+import exif_to_json_and_csv as exif
+import gasser_db
+import image_quality
+import metadata_store
+import metrics
+import profiling
+from compute_mpg import recompute_mpg
+from create_thumbnails import THUMBNAIL_EXTENSIONS, create_thumbnail
+from fuel_stats import refresh_stats
+from read_update_metadata import update_reading_location
+from write_results_sql import reading_from_results, write_llm_gauge_info_sql
+
+Signature = Tuple[int, int]
+
+
+########################
+class FolderEvents(FileSystemEventHandler):
+    """watchdog handler: every created / modified / moved-in image path goes onto a queue."""
+
+    def __init__(self, events: "queue.Queue[str]"):
+        self.events = events
+
+    def _put(self, path: str) -> None:
+        if path.lower().endswith(exif.DEFAULT_IMAGE_EXTENSIONS):
+            self.events.put(path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._put(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._put(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._put(event.dest_path)
+
+def scan(folder: str) -> Dict[str, Signature]:
+    sigs = {}
+    for path in exif.collect_files(folder, exif.DEFAULT_IMAGE_EXTENSIONS):
+        try:
+            sigs[path] = metadata_store.file_signature(path)
+        except OSError:
+            pass  # deleted between listdir and stat
+    return sigs
+
+class Batch:
+    """Images seen since the last processed batch, with the time each one last changed."""
+
+    def __init__(self, pair_size: int, settle: float, max_wait: float):
+        self.pair_size = pair_size
+        self.settle = settle
+        self.max_wait = max_wait
+        self.changed: Dict[str, float] = {}
+        self.started: Optional[float] = None
+
+    def touch(self, path: str, now: float) -> None:
+        if self.started is None:
+            self.started = now
+        self.changed[os.path.abspath(path)] = now
+
+    def take_if_ready(self, now: float) -> Optional[List[str]]:
+        if not self.changed:
+            return None
+        quiet = now - max(self.changed.values()) >= self.settle
+        complete = len(self.changed) >= self.pair_size
+        overdue = now - self.started >= self.max_wait
+        if not quiet or not (complete or overdue):
+            return None
+        if not complete:
+            print(f"⚠️  Only {len(self.changed)} image(s) after {self.max_wait:.0f}s; processing anyway")
+        paths = sorted(p for p in self.changed if os.path.exists(p))
+        self.changed.clear()
+        self.started = None
+        return paths
+
+########################
+class Worker:
+    """Everything that is expensive to start, kept for the life of the daemon."""
+
+    def __init__(self, args):
+        self.args = args
+        self.et = exiftool.ExifTool()
+        self.et.run()
+        if args.runner == "chatgpt":
+            import run_vision_query_chatgpt as runner
+            runner.get_client()
+            self.analyze = lambda d: runner.analyze_images(d, args.model)
+        else:
+            import run_vision_query_locally as runner
+            runner.get_client()
+            self.analyze = lambda d: runner.analyze_images(d, mosaic=args.mosaic)
+        if not gasser_db.SQLITE:
+            gasser_db.get_pool()
+
+    def close(self) -> None:
+        self.et.terminate()
+        gasser_db.close_pool()
+
+    def extract(self, paths: List[str]):
+        """EXIF (and geocoding) for the new or changed paths; returns the fill-up time."""
+        args = self.args
+        store = metadata_store.open_store(args.store)
+        try:
+            exif.update_store(store, paths, args.email, args.rate_sec, args.no_geo, et=self.et)
+            return metadata_store.fill_time_for(paths, store)
+        finally:
+            store.close()
+
+    def thumbnails(self, paths: List[str], batch_dir: str) -> None:
+        # only this batch's photos go to the model
+        os.makedirs(batch_dir, exist_ok=True)
+        for path in paths:
+            if path.lower().endswith(THUMBNAIL_EXTENSIONS):
+                create_thumbnail(path, os.path.join(batch_dir, os.path.basename(path)))
+
+    def screen(self, batch_dir: str) -> List[str]:
+        """Set near-duplicate and unreadable thumbnails aside; returns the ones left for the model."""
+        args = self.args
+        return image_quality.screen_folder(batch_dir, None if args.no_dedup else args.dedup_distance,
+                                           not args.no_quality)
+
+    def process(self, paths: List[str]) -> None:
+        args = self.args
+        t0 = time.perf_counter()
+        print(f"\n=== {len(paths)} new image(s): {', '.join(os.path.basename(p) for p in paths)}")
+
+        with metrics.stage("metadata", items=len(paths)):
+            fill_time = self.extract(paths)
+        batch_dir = os.path.join(args.thumbnails, time.strftime("batch-%Y%m%dT%H%M%S"))
+        with metrics.stage("thumbnails", items=len(paths)):
+            self.thumbnails(paths, batch_dir)
+        with metrics.stage("screen", items=len(paths)):
+            self.screen(batch_dir)
+        with metrics.stage("analyze", items=len(paths)):
+            results = self.analyze(batch_dir)
+        with metrics.stage("write", items=1):
+            reading = reading_from_results(results)
+            id = write_llm_gauge_info_sql(*reading, fill_time=fill_time)
+        with metrics.stage("mpg", items=1):
+            # photos can arrive late, so this reading may sit before the latest fill_time
+            recompute_mpg(around_id=id)
+        with metrics.stage("location", items=1):
+            update_reading_location(Path(args.store), [reading[0], reading[3]])
+            refresh_stats()
+        metrics.observe("batch_seconds", time.perf_counter() - t0)
+        print(f"--- processed in {time.perf_counter() - t0:.2f}s")
+
+########################
+def watch(args) -> None:
+    batch = Batch(args.pair_size, args.settle, args.max_wait)
+    events: "queue.Queue[str]" = queue.Queue()
+    known = {} if args.process_existing else scan(args.folder)
+    if args.process_existing:
+        for path in scan(args.folder):
+            batch.touch(path, time.monotonic())
+
+    observer = None
+    if Observer is not None and not args.poll:
+        observer = Observer()
+        observer.schedule(FolderEvents(events), args.folder, recursive=False)
+        observer.start()
+        print(f"Watching {os.path.abspath(args.folder)} (file events)")
+    else:
+        print(f"Watching {os.path.abspath(args.folder)} (polling every {args.poll or 2.0}s)")
+
+    worker = Worker(args)
+    try:
+        while True:
+            now = time.monotonic()
+            if observer is None:
+                current = scan(args.folder)
+                for path, sig in current.items():
+                    if known.get(path) != sig:
+                        batch.touch(path, now)
+                known = current
+                time.sleep(args.poll or 2.0)
+            else:
+                try:
+                    batch.touch(events.get(timeout=0.5), now)
+                    continue
+                except queue.Empty:
+                    pass
+
+            paths = batch.take_if_ready(time.monotonic())
+            if paths:
+                try:
+                    worker.process(paths)
+                    metrics.count("batches_total", status="ok")
+                except (Exception, SystemExit) as e:
+                    # a bad batch (model down, unreadable photo) must not stop the daemon
+                    metrics.count("batches_total", status="failed")
+                    print(f"ERROR processing {', '.join(os.path.basename(p) for p in paths)}: {e}")
+                # the daemon never exits on its own, so the metrics files are refreshed after every batch
+                metrics.export_args(args)
+    except KeyboardInterrupt:
+        print("\nStopping")
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        worker.close()
+
+def main():
+    ap = argparse.ArgumentParser(description="Watch the attachments folder and process each new fill-up right away.")
+    ap.add_argument("--folder", default="./attachments", help="Folder the photos are downloaded into")
+    ap.add_argument("--thumbnails", default="images_thumbnails", help="Thumbnail folder (one sub-folder per batch)")
+    ap.add_argument("--store", default=metadata_store.DEFAULT_STORE, help="SQLite metadata store")
+    ap.add_argument("--runner", choices=["local", "chatgpt"], default="local",
+                    help="LM Studio (run_vision_query_locally.py) or OpenAI (run_vision_query_chatgpt.py)")
+    ap.add_argument("--model", default="gpt-4o-mini", help="OpenAI model for --runner chatgpt")
+    ap.add_argument("--mosaic", action="store_true",
+                    help="--runner local: one request per fill-up, the displays tiled into one image")
+    image_quality.add_arguments(ap)
+    ap.add_argument("--email", default="your_email@example.com", help="Contact email for Nominatim User-Agent")
+    ap.add_argument("--rate-sec", type=float, default=1.0, help="Delay between reverse geocode calls (seconds)")
+    ap.add_argument("--no-geo", action="store_true", help="Skip reverse geocoding")
+    ap.add_argument("--pair-size", type=int, default=2, help="Images that make up one fill-up (default: 2)")
+    ap.add_argument("--settle", type=float, default=5.0, help="Seconds without changes before a batch runs")
+    ap.add_argument("--max-wait", type=float, default=300.0,
+                    help="Process an incomplete batch after this many seconds (default: 300)")
+    ap.add_argument("--poll", type=float, default=None, metavar="SEC",
+                    help="Poll the folder every SEC seconds instead of using file events")
+    ap.add_argument("--process-existing", action="store_true",
+                    help="Treat images already in the folder as new")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.folder):
+        raise SystemExit(f"ERROR: Folder not found: {args.folder}")
+    watch(args)
+
+if __name__ == "__main__":
+    profiling.run(main)
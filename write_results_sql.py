@@ -2,14 +2,12 @@
 import json
 import sys
 from pathlib import Path
-import sys
-import psycopg2
-from psycopg2 import sql
-import os
-from dotenv import load_dotenv
-
+from typing import Dict, Optional
 
-load_dotenv();
+import gasser_db
+import llm_ledger
+import metadata_store
+import profiling
 
 ##########################
 def read_results_llm():
@@ -47,48 +45,92 @@ def read_results_llm():
     print(f"Dollars: {gas.get('top_value_dollars')}")
     print(f"Gallons: {gas.get('bottom_value_gallons')}")
 
+    return reading_from_results(data)
+
+##########################
+def reading_from_results(data):
+    """(odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons) from a results_llm dict."""
+    odo = data.get("odometer_image", {})
+    gas = data.get("gas_pump_image", {})
+
     return (odo.get('file'), odo.get('top_value_trip')    , odo.get('bottom_value_total_mileage'), \
             gas.get('file'), gas.get('top_value_dollars') , gas.get('bottom_value_gallons') )
 
+def number_or_none(v: Optional[str], zero_ok: bool = False) -> Optional[str]:
+    """
+    The number the model read, or None when it could not read one: blank, not a number,
+    or 0 where 0 is impossible. A "0" would be stored as a real reading and break the MPG.
+    """
+    if v is None:
+        return None
+    s = str(v).strip().replace(",", "").replace("$", "")
+    try:
+        n = float(s)
+    except ValueError:
+        return None
+    return s if (n != 0 or zero_ok) else None
+
+# (section, field, 0 is a valid reading)
+NUMERIC_FIELDS = [
+    ("odometer_image", "top_value_trip", True),
+    ("odometer_image", "bottom_value_total_mileage", False),
+    ("gas_pump_image", "top_value_dollars", False),
+    ("gas_pump_image", "bottom_value_gallons", False),
+]
+
+def normalize_data(data: Dict) -> Dict:
+    # Ensure keys exist
+    data.setdefault("odometer_image", {})
+    data.setdefault("gas_pump_image", {})
+    # Normalize numeric fields; unreadable ones become null (NULL in fuel_readings), never "0"
+    unreadable = []
+    for section, field, zero_ok in NUMERIC_FIELDS:
+        data[section][field] = number_or_none(data[section].get(field), zero_ok)
+        if data[section][field] is None and field != "top_value_trip":
+            unreadable.append(field)
+    if unreadable:
+        data["unreadable"] = unreadable
+        print(f"⚠️  The model could not read: {', '.join(unreadable)}")
+    # Default file names if missing
+    data["odometer_image"]["file"] = data["odometer_image"].get("file") or "not found"
+    data["gas_pump_image"]["file"] = data["gas_pump_image"].get("file") or "not found"
+    return data
+
 ########################
-def write_llm_gauge_info_sql( odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons):
-    PGHOST      = os.environ.get("PGHOST")
-    PGUSER      = os.environ.get("PGUSER")
-    PGPASSWORD  = os.environ.get("PGPASSWORD")  
-    PGPORT      = os.environ.get("PGPORT")
-    PGDATABASE  = os.environ.get("PGDATABASE")
-
-    DB_CONFIG = {
-        "dbname": PGDATABASE,
-        "user":   PGUSER,
-        "password": PGPASSWORD,
-        "host": PGHOST,
-        "port": PGPORT
-    }
-
-    print("odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons")
-    print (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons)
-    
-    #set up the insert
-    insert_query = "INSERT INTO fuel_readings  (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons)  VALUES (%s, %s, %s, %s,%s,%s);"
+def reading_id(odometer_file):
+    """id of the reading already written for this odometer photo, or None."""
+    with gasser_db.transaction() as cur:
+        gasser_db.execute_prepared(cur, "reading_id", gasser_db.READING_ID_SQL, (odometer_file,))
+        row = cur.fetchone()
+    return row[0] if row else None
 
+########################
+def fill_time_of(odometer_file, gaspump_file):
+    """EXIF DateTimeOriginal from the metadata store, else the Gmail date in the file name."""
+    store = metadata_store.open_store_if_exists()
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.autocommit = True
-  
-        #do the insert - with autocommit - so no explicit commit
-        with conn, conn.cursor() as cur:
-            cur.execute(insert_query, (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons) )
-
-      
-    except psycopg2.Error as e:
-        print(f"PostgreSQL error: {e}")
-        sys.exit(1)
+        return metadata_store.fill_time_for([odometer_file, gaspump_file], store)
     finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+        if store is not None:
+            store.close()
+
+########################
+def write_llm_gauge_info_sql( odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons, fill_time=None):
+    if fill_time is None:
+        fill_time = fill_time_of(odometer_file, gaspump_file)
+
+    print("odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons, fill_time")
+    print (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons, fill_time)
+    
+    #do the insert - committed when the transaction block exits
+    with gasser_db.transaction() as cur:
+        gasser_db.execute_prepared(cur, "insert_reading_id", gasser_db.INSERT_READING_RETURNING_SQL,
+                                   (odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons, fill_time))
+        id = cur.fetchone()[0]
+    # the model calls that read these photos now have a reading to point at
+    llm_ledger.link_reading(odometer_file, gaspump_file)
+    # the id of the new reading, for recompute_mpg(around_id=...)
+    return id
     
 
 
@@ -102,8 +144,9 @@ def main():
 
     #print( odometer_file, trip_milage, total_mileage, gas_pump_file, dollars, gallons)
  
-    write_llm_gauge_info_sql( odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons)
+    with gasser_db.exit_on_db_error():
+        write_llm_gauge_info_sql( odometer_file, trip_value, total_mileage, gaspump_file, dollars, gallons)
  
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)